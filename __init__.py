@@ -1,5 +1,16 @@
 from .agenda import *
 from .extractions import *
+from .instrumentation import *
+from .metrics import *
 from .observation import *
+from .profiling import *
 from .puppeteer import *
+from .replay import *
+from .session import *
+from .state_store import *
+from .synthetic import *
+from .trace import *
+from .trace_sink import *
+from .transcript import *
 from .trigger_detector import *
+from .warmup import *
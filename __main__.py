@@ -0,0 +1,82 @@
+"""Command line entry point of the puppeteer package.
+
+Commands:
+
+    replay: Replays recorded conversations, as JSON Lines transcripts, through a set of agendas, optionally over a
+            pool of worker processes, and writes the actions, extractions and, optionally, traces of each turn as
+            JSON Lines. See replay_transcripts() for the formats.
+
+Run from the directory containing the puppeteer package:
+
+    python -m puppeteer replay transcripts.jsonl --agendas my_agendas/*.yaml --snips-path training_data --workers 8
+    python -m puppeteer replay transcripts.jsonl --agenda-factory puppeteer.benchmarks.common:load_agendas --traces
+
+Agendas given with --agendas only get Snips trigger detectors, for the intents under --snips-path. Agendas using other
+trigger detectors, such as the agendas shipped with the package, are loaded with --agenda-factory.
+"""
+import argparse
+import functools
+import json
+import os
+import sys
+import time
+from typing import List, Optional
+
+from .replay import call_factory, load_agenda_files, replay_transcripts
+from .transcript import read_transcripts
+
+
+def replay_command(args: argparse.Namespace) -> None:
+    if args.agenda_factory is not None:
+        factory = functools.partial(call_factory, args.agenda_factory)
+    else:
+        factory = functools.partial(load_agenda_files, args.agendas, args.snips_path)
+    workers = (os.cpu_count() or 1) if args.workers is None else args.workers
+    input_file = sys.stdin if args.input == "-" else open(args.input, "r")
+    output_file = sys.stdout if args.output is None else open(args.output, "w")
+    start = time.perf_counter()
+    try:
+        results = replay_transcripts(read_transcripts(input_file), factory, workers=workers, seed=args.seed,
+                                     traces=args.traces, batch_size=args.batch_size)
+        count = 0
+        for result in results:
+            output_file.write(json.dumps(result, default=str))
+            output_file.write("\n")
+            count += 1
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+    elapsed = time.perf_counter() - start
+    print("Replayed %d turns in %.2f s (%.0f turns/s) with %d workers" %
+          (count, elapsed, count / max(elapsed, 1e-9), workers), file=sys.stderr)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m puppeteer", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    replay_parser = commands.add_parser("replay", help="Replay recorded conversations through agendas.")
+    replay_parser.add_argument("input", help="JSON Lines transcript to replay, or - for standard input.")
+    replay_parser.add_argument("--output", help="File to write the results to. Defaults to standard output.")
+    agendas_group = replay_parser.add_mutually_exclusive_group(required=True)
+    agendas_group.add_argument("--agendas", nargs="+",
+                               help="Agenda files, whose triggers are all detected by Snips intents.")
+    agendas_group.add_argument("--agenda-factory", help="Function returning the agendas, as module:function.")
+    replay_parser.add_argument("--snips-path",
+                               help="Root path of Snips training data for the trigger detectors. Every trigger of the "
+                                    "agendas must be detected by an intent under it.")
+    replay_parser.add_argument("--workers", type=int,
+                               help="Number of worker processes, 0 to replay in this process. Defaults to the number "
+                                    "of CPUs.")
+    replay_parser.add_argument("--seed", type=int, default=0, help="Base seed of the random states of conversations.")
+    replay_parser.add_argument("--traces", action="store_true", help="Include the trace of each turn.")
+    replay_parser.add_argument("--batch-size", type=int, default=64, help="Number of turns per batch.")
+    replay_parser.set_defaults(function=replay_command)
+    args = parser.parse_args(argv)
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
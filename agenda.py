@@ -1,14 +1,22 @@
 import abc
-from typing import Any, Dict, List, Optional, Tuple, Type
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple, Type
 
 import matplotlib.pyplot as plt
 import networkx as nx
+import numpy as np
 import yaml
 
 from .extractions import Extractions
-from .logging import Logger
+from .instrumentation import begin_detector_timing, end_timing
+from .logging import Logger, current_logger
+from .metrics import metrics_registry
 from .observation import Observation
-from .trigger_detector import TriggerDetector, TriggerDetectorLoader
+from .trace import Trace
+from .trigger_detector import TriggerDetector, TriggerDetectorCache, TriggerDetectorLoader
+
+_pick_actions = metrics_registry().counter(
+    "puppeteer_pick_actions_total", "Calls to DefaultAgendaPolicy.pick_actions(), by agenda and action map used.",
+    ["agenda", "action_map"])
 
 
 def _check_dict_fields(cls: Type, d: Dict[str, Any], fields: List[Tuple[str, Type]]) -> None:
@@ -243,8 +251,9 @@ class AgendaState:
         self._transition_trigger_probabilities = agenda.trigger_probabilities_cls(agenda, kickoff=False)
         self._kickoff_trigger_probabilities = agenda.trigger_probabilities_cls(agenda, kickoff=True)
         self._state_probabilities = agenda.state_probabilities_cls(agenda)
+        self._pending_kickoff: Optional[Tuple[List[Observation], Extractions, Optional[TriggerDetectorCache]]] = None
+        self._deferred_extractions = Extractions()
         self._pos = None
-        self._log = Logger()
 
     @property
     def transition_trigger_probabilities(self) -> "TriggerProbabilities":
@@ -253,9 +262,31 @@ class AgendaState:
 
     @property
     def kickoff_trigger_probabilities(self) -> "TriggerProbabilities":
-        """Returns the kickoff trigger probabilities part of the agenda state."""
+        """Returns the kickoff trigger probabilities part of the agenda state.
+
+        If the latest call to update() deferred the kickoff trigger probabilities, they are updated now, running the
+        kickoff trigger detectors on the observations given to update().
+        """
+        if self._pending_kickoff is not None:
+            (observations, old_extractions, detector_cache) = self._pending_kickoff
+            self._pending_kickoff = None
+            log = current_logger()
+            log.begin("Kickoff trigger probabilities for agenda %s", self._agenda.name)
+            self._deferred_extractions = self._kickoff_trigger_probabilities.update(observations, old_extractions,
+                                                                                    detector_cache=detector_cache)
+            log.end()
         return self._kickoff_trigger_probabilities
 
+    @property
+    def kickoff_pending(self) -> bool:
+        """Returns true if the kickoff trigger probabilities were deferred by update(), and have not been used since."""
+        return self._pending_kickoff is not None
+
+    @property
+    def deferred_extractions(self) -> Extractions:
+        """Returns the extractions made by deferred kickoff trigger detection since the latest call to update()."""
+        return self._deferred_extractions
+
     @property
     def state_probabilities(self) -> "StateProbabilities":
         """Returns the state probabilities part of the agenda state."""
@@ -264,36 +295,60 @@ class AgendaState:
     def update(self,
                actions: List[Action],
                observations: List[Observation],
-               old_extractions: Extractions
+               old_extractions: Extractions,
+               detector_cache: Optional[TriggerDetectorCache] = None,
+               update_transitions: bool = True,
+               update_kickoff: bool = True
                ) -> Extractions:
         """Updates the agenda-level state.
 
         Updating the agenda level state, based on extractions and observations made since the last time step.
 
+        If update_transitions is false, only the kickoff trigger probabilities are updated. Transition trigger
+        probabilities and state probabilities are left as they are. This is used for agendas that are not active in
+        the conversation, where only the kickoff triggers are needed by the PuppeteerPolicy.
+
+        If update_kickoff is false, the update of the kickoff trigger probabilities is deferred until they are first
+        accessed through the kickoff_trigger_probabilities property. Extractions made by the kickoff trigger detectors
+        are then not part of the returned extractions, but are available through the deferred_extractions property.
+
         Args:
             actions: Actions performed in the last turn.
             observations: Observations made since the last turn.
             old_extractions: Extractions made in the conversation.
+            detector_cache: Optional cache of trigger detector results for this turn. See TriggerProbabilities.update().
+            update_transitions: If false, skip updating transition trigger probabilities and state probabilities.
+            update_kickoff: If false, defer updating kickoff trigger probabilities until they are used.
 
         Returns:
             New extractions made based on the input observations.
         """
-        self._log.begin(f"Updating agenda {self._agenda.name}")
-
-        self._log.begin("Kickoff trigger probabilities")
-        new_extractions = self._kickoff_trigger_probabilities.update(observations, old_extractions)
-        self._log.end()
+        log = current_logger()
+        log.begin("Updating agenda %s", self._agenda.name)
+
+        self._deferred_extractions = Extractions()
+        if update_kickoff:
+            self._pending_kickoff = None
+            log.begin("Kickoff trigger probabilities")
+            new_extractions = self._kickoff_trigger_probabilities.update(observations, old_extractions,
+                                                                         detector_cache=detector_cache)
+            log.end()
+        else:
+            self._pending_kickoff = (observations, old_extractions, detector_cache)
+            new_extractions = Extractions()
 
-        self._log.begin("Transition trigger probabilities")
-        extractions = self._transition_trigger_probabilities.update(observations, old_extractions)
-        new_extractions.update(extractions)
-        self._log.end()
+        if update_transitions:
+            log.begin("Transition trigger probabilities")
+            extractions = self._transition_trigger_probabilities.update(observations, old_extractions,
+                                                                        detector_cache=detector_cache)
+            new_extractions.update(extractions)
+            log.end()
 
-        self._log.begin("State probabilities")
-        self._state_probabilities.update(self._transition_trigger_probabilities, actions)
-        self._log.end()
+            log.begin("State probabilities")
+            self._state_probabilities.update(self._transition_trigger_probabilities, actions)
+            log.end()
 
-        self._log.end()
+        log.end()
 
         return new_extractions
 
@@ -385,7 +440,8 @@ class TriggerProbabilities(abc.ABC):
         return self._trigger_detectors
 
     @abc.abstractmethod
-    def update(self, observations: List[Observation], old_extractions: Extractions) -> Extractions:
+    def update(self, observations: List[Observation], old_extractions: Extractions,
+               detector_cache: Optional[TriggerDetectorCache] = None) -> Extractions:
         """Updates trigger probabilities based on extractions and observations since the last time step.
 
         Trigger probabilities represent all information in observations that is relevant for state transition between
@@ -399,9 +455,15 @@ class TriggerProbabilities(abc.ABC):
         based only on the observations and extractions, and dies not take the previous step's trigger probabilities into
         account. This seems reasonable for most definitions of trigger probability update, but is not required.
 
+        The detector_cache argument is a cache of trigger detector results for the current turn, shared by all agendas
+        of the Puppeteer. Implementations should get detector results through the cache, if given, so that each
+        distinct detector runs at most once per turn. The cache may also hold results computed beforehand, e.g.,
+        concurrently by Puppeteer.react_async().
+
         Args:
             observations: Observations made since the last time step.
             old_extractions: Extractions made in the conversation.
+            detector_cache: Optional cache of trigger detector results for this time step.
 
         Returns:
             New extractions made based on the observations.
@@ -423,9 +485,9 @@ class DefaultTriggerProbabilities(TriggerProbabilities):
                 they are transition probabilities.
         """
         super(DefaultTriggerProbabilities, self).__init__(agenda, kickoff)
-        self._log = Logger()
 
-    def update(self, observations: List[Observation], old_extractions: Extractions) -> Extractions:
+    def update(self, observations: List[Observation], old_extractions: Extractions,
+               detector_cache: Optional[TriggerDetectorCache] = None) -> Extractions:
         """Updates trigger probabilities based on extractions and observations since the last time step.
 
         See method documentation in superclass for more details.
@@ -433,37 +495,42 @@ class DefaultTriggerProbabilities(TriggerProbabilities):
         Args:
             observations: Observations made since the last time step.
             old_extractions: Extractions made in the conversation.
+            detector_cache: Optional cache of trigger detector results for this time step.
 
         Returns:
             New extractions made based on the observations.
         """
+        log = current_logger()
         trigger_map: Dict[str, float] = {}
         non_trigger_probs: List[float] = []
         new_extractions = Extractions()
+        debug = log.is_enabled_for(Logger.DEBUG)
         
         for trigger_detector in self.trigger_detectors:
-            self._log.begin(f"Trigger detector with trigger names {trigger_detector.trigger_names}")
-            (trigger_map_out, non_trigger_prob, extractions) = trigger_detector.trigger_probabilities(observations,
-                                                                                                      old_extractions)
-
-            if extractions.names:
-                self._log.begin("Extractions")
-                for name in extractions.names:
-                    self._log.add(f"{name}: {extractions.extraction(name)}")
-                self._log.end()
+            if detector_cache is not None:
+                (trigger_map_out, non_trigger_prob, extractions) = detector_cache.trigger_probabilities(
+                    trigger_detector, observations, old_extractions)
+            else:
+                token = begin_detector_timing(trigger_detector)
+                try:
+                    (trigger_map_out, non_trigger_prob, extractions) = trigger_detector.trigger_probabilities(
+                        observations, old_extractions)
+                finally:
+                    end_timing(token)
+
+            if debug:
+                log.event(Trace.DETECTOR, (trigger_detector.trigger_names, dict(trigger_map_out), non_trigger_prob,
+                                           {name: extractions.extraction(name) for name in extractions.names}),
+                          level=Logger.DEBUG)
             new_extractions.update(extractions)
 
-            self._log.begin("Triggers")
             non_trigger_probs.append(non_trigger_prob)
             for (trigger_name, p) in trigger_map_out.items():
-                self._log.add(f"{trigger_name}: {p:.3f}")
                 if trigger_name in self._probabilities:
                     if trigger_name not in trigger_map:
                         trigger_map[trigger_name] = p
                     elif trigger_map[trigger_name] < p:
                         trigger_map[trigger_name] = p
-            self._log.end()
-            self._log.end()
 
         if trigger_map:
             non_trigger_prob = 1.0 - max(trigger_map.values())
@@ -484,12 +551,8 @@ class DefaultTriggerProbabilities(TriggerProbabilities):
         
         self._non_trigger_prob = non_trigger_prob
 
-        if trigger_map:
-            self._log.begin("Final trigger probabilities")
-            for (name, p) in self._probabilities.items():
-                self._log.add(f"{name}: {p:.3f}")
-            self._log.add(f"no trigger: {non_trigger_prob:.3f}")
-            self._log.end()
+        if trigger_map and debug:
+            log.event(Trace.TRIGGER_PROBABILITIES, (dict(self._probabilities), non_trigger_prob), level=Logger.DEBUG)
 
         return new_extractions
 
@@ -538,12 +601,32 @@ class StateProbabilities(abc.ABC):
 
     def reset(self) -> None:
         """Reset state probabilities to the initial values for a newly started agenda."""
+        start_state_name = self._agenda.compile().start_state_name
         for state_name in self._probabilities:
-            if state_name == self._agenda.start_state.name:
+            if state_name == start_state_name:
                 self._probabilities[state_name] = 1.0
             else:
                 self._probabilities[state_name] = 0.0
 
+    def get_state(self) -> List[float]:
+        """Returns the state probabilities as a flat list of values.
+
+        The values are given in the same order as the keys of the probabilities property. Together with set_state(),
+        this allows conversation-level state to be stored compactly outside of this object.
+
+        Returns:
+            The list of state probability values.
+        """
+        return list(self._probabilities.values())
+
+    def set_state(self, state: Sequence[float]) -> None:
+        """Restores state probabilities from a flat sequence of values, as returned by get_state().
+
+        Args:
+            state: The state probability values.
+        """
+        self._probabilities = dict(zip(self._probabilities, state))
+
     @abc.abstractmethod
     def update(self, trigger_probabilities: TriggerProbabilities, actions: List[Action]) -> None:
         """Updates state probabilities based on trigger probabilities.
@@ -572,7 +655,6 @@ class DefaultStateProbabilities(StateProbabilities):
             agenda: The agenda for which this object holds state probabilities.
         """
         super(DefaultStateProbabilities, self).__init__(agenda)
-        self._log = Logger()
 
     def update(self, trigger_probabilities: TriggerProbabilities, actions: List[Action]) -> None:
         """Updates state probabilities based on trigger probabilities.
@@ -586,9 +668,11 @@ class DefaultStateProbabilities(StateProbabilities):
             trigger_probabilities: The trigger probabilities.
             actions: Actions performed in the last turn.
         """
+        agenda = self._agenda.compile()
+
         # Check if the last of the actions taken "belongs" to this agenda. Earlier
         # actions may be the finishing actions of a deactivated agenda.
-        if actions and not actions[-1] in self._agenda.actions:
+        if actions and not actions[-1] in agenda.action_set:
             return
         
         current_probability_map = self._probabilities
@@ -596,28 +680,26 @@ class DefaultStateProbabilities(StateProbabilities):
         non_event_prob = trigger_probabilities.non_trigger_prob
 
         # Set up our new prob map.
-        new_probability_map = {}
-        for st in self._agenda.state_names:
-            new_probability_map[st] = 0.0
+        new_probability_map = dict.fromkeys(agenda.state_names, 0.0)
         new_probability_map['ERROR_STATE'] = 0.0
 
         # Chance we actually have an event:
         p_event = 1.0 - non_event_prob
         
         # For each state in the machine, do:
-        for st in self._agenda.state_names:
+        for st in agenda.state_names:
             to_move = current_probability_map[st] * p_event
             new_probability_map[st] = max(0.05, current_probability_map[st] - to_move, new_probability_map[st])
                       
         # For each state in the machine, do:
-        for st in self._agenda.state_names:
+        for (st, transitions) in zip(agenda.state_names, agenda.transitions):
             to_move = current_probability_map[st] * p_event
             
             if round(to_move, 1) > 0.0:
                 for event in trigger_map:
                     trans_prob = to_move * trigger_map[event]
-                    if event in self._agenda.transition_trigger_names(st):
-                        st2 = self._agenda.transition_end_state_name(st, event)
+                    if event in transitions:
+                        st2 = transitions[event]
                         new_probability_map[st2] = new_probability_map[st2] + trans_prob   
                         # Decrease our confidence that we've had some problems following the script, previously.
                         # Not part of paper.
@@ -633,10 +715,173 @@ class DefaultStateProbabilities(StateProbabilities):
 
         self._probabilities = new_probability_map
 
-        self._log.begin("Updated state probabilities")
-        for (name, p) in self._probabilities.items():
-            self._log.add(f"{name}: {p:.3f}")
-        self._log.end()
+        log = current_logger()
+        if log.is_enabled_for(Logger.DEBUG):
+            log.event(Trace.STATE_PROBABILITIES, (dict(self._probabilities),), level=Logger.DEBUG)
+
+
+class VectorizedStateProbabilities(StateProbabilities):
+    """Handles state probabilities for an ongoing conversation, using NumPy array operations.
+
+    This is a drop-in replacement for DefaultStateProbabilities, computing the same state probabilities, but keeping
+    them in a NumPy array and updating them with array operations over the transition array of the compiled agenda,
+    rather than with nested Python loops over states and triggers. It is selected through the state_probabilities_cls
+    argument of Agenda or Agenda.load(), and pays off for agendas with many states.
+
+    The update follows DefaultStateProbabilities.update() exactly, including the effects of the order in which states
+    and triggers are visited there:
+    - A state takes part in transitions if its probability times the event probability rounds to a positive value,
+      i.e., is at least 0.05.
+    - Such a state, if it lacks a transition for some trigger, has its probability set from the last trigger (in agenda
+      order) that it lacks a transition for. Probability mass moved into the state by states visited before that point
+      is lost, as in the loop-based implementation.
+    - The ERROR_STATE probability is computed in closed form from the sequence of additions and floored subtractions
+      made by the loop-based implementation. It may differ from the loop-based result by floating-point rounding.
+
+    Trigger probabilities are expected to hold a probability for each transition trigger of the agenda, as
+    DefaultTriggerProbabilities does.
+
+    The probabilities property builds a dict from the array when needed. The dict must not be modified.
+    """
+    def __init__(self, agenda: "Agenda"):
+        """Initializes a new VectorizedStateProbabilities object.
+
+        Args:
+            agenda: The agenda for which this object holds state probabilities.
+        """
+        super(VectorizedStateProbabilities, self).__init__(agenda)
+        self._names = tuple(self._probabilities)
+        self._ids = {name: i for (i, name) in enumerate(self._names)}
+        self._values = np.fromiter(self._probabilities.values(), dtype=float, count=len(self._names))
+        self._compiled: Optional["CompiledAgenda"] = None
+        # For each state, the last trigger without a transition from the state, or -1. Computed by _tables().
+        self._last_unmatched = np.empty(0, dtype=int)
+        # The probabilities as a dict, built from the array when needed.
+        self._probabilities_cache: Optional[Dict[str, float]] = None
+
+    @property
+    def probabilities(self) -> Dict[str, float]:
+        """Returns the state probabilities."""
+        if self._probabilities_cache is None:
+            self._probabilities_cache = dict(zip(self._names, self._values.tolist()))
+        return self._probabilities_cache
+
+    def probability(self, state_name: str) -> float:
+        """Returns the probability for the state with the given name.
+
+        Args:
+            state_name: The name of the state.
+
+        Returns:
+            The state probability.
+        """
+        return float(self._values[self._ids[state_name]])
+
+    def reset(self) -> None:
+        """Reset state probabilities to the initial values for a newly started agenda."""
+        self._values = np.zeros(len(self._names))
+        self._values[self._ids[self._agenda.compile().start_state_name]] = 1.0
+        self._probabilities_cache = None
+
+    def get_state(self) -> List[float]:
+        """Returns the state probabilities as a flat list of values.
+
+        Returns:
+            The list of state probability values.
+        """
+        return self._values.tolist()
+
+    def set_state(self, state: Sequence[float]) -> None:
+        """Restores state probabilities from a flat sequence of values, as returned by get_state().
+
+        Args:
+            state: The state probability values.
+        """
+        self._values = np.array(state, dtype=float)
+        self._probabilities_cache = None
+
+    def _tables(self) -> "CompiledAgenda":
+        """Returns the compiled agenda, precomputing the tables used by update() when the agenda was recompiled."""
+        agenda = self._agenda.compile()
+        if agenda is not self._compiled:
+            if agenda.state_names + ("ERROR_STATE",) != self._names:
+                raise ValueError("States of agenda '%s' changed after state probabilities were created" % agenda.name)
+            transition_array = agenda.transition_array
+            num_triggers = transition_array.shape[1]
+            unmatched = transition_array < 0
+            last_unmatched = num_triggers - 1 - np.argmax(unmatched[:, ::-1], axis=1)
+            self._last_unmatched = np.where(unmatched.any(axis=1), last_unmatched, -1)
+            self._compiled = agenda
+        return agenda
+
+    def update(self, trigger_probabilities: TriggerProbabilities, actions: List[Action]) -> None:
+        """Updates state probabilities based on trigger probabilities.
+
+        See documentation of this method in StateProbabilities and class documentation.
+
+        Args:
+            trigger_probabilities: The trigger probabilities.
+            actions: Actions performed in the last turn.
+        """
+        agenda = self._tables()
+
+        # Check if the last of the actions taken "belongs" to this agenda. Earlier
+        # actions may be the finishing actions of a deactivated agenda.
+        if actions and not actions[-1] in agenda.action_set:
+            return
+
+        trigger_map = trigger_probabilities.probabilities
+        triggers = np.array([trigger_map.get(name, 0.0) for name in agenda.trigger_names], dtype=float)
+        p_event = 1.0 - trigger_probabilities.non_trigger_prob
+        num_states = len(agenda.state_names)
+        num_triggers = len(triggers)
+        current = self._values[:num_states]
+
+        to_move = current * p_event
+        new_values = np.empty(num_states + 1)
+        new_values[:num_states] = np.maximum(0.05, current - to_move)
+        new_values[num_states] = 0.0
+
+        # States taking part in transitions, i.e., with round(to_move, 1) > 0.0.
+        active = np.flatnonzero(to_move >= 0.05)
+        if active.size > 0 and num_triggers > 0:
+            # Transition mass, (active states x triggers), in the order visited by the loop-based implementation.
+            moved = to_move[active, np.newaxis] * triggers
+            end_states = agenda.transition_array[active]
+            matched = end_states >= 0
+
+            # Active states lacking a transition get their probability overwritten, at their last unmatched trigger.
+            last_unmatched = self._last_unmatched[active]
+            overwritten = last_unmatched >= 0
+            overwritten_states = active[overwritten]
+            overwrite_key = np.full(num_states, -1)
+            overwrite_key[overwritten_states] = overwritten_states * num_triggers + last_unmatched[overwritten]
+            new_values[overwritten_states] = np.maximum(
+                0.05, current[overwritten_states] - triggers[last_unmatched[overwritten]])
+
+            # Add transition mass, in visiting order, skipping mass added before the end state was overwritten.
+            (rows, columns) = np.nonzero(matched)
+            destinations = end_states[rows, columns]
+            keep = active[rows] * num_triggers + columns > overwrite_key[destinations]
+            np.add.at(new_values, destinations[keep], moved[rows[keep], columns[keep]])
+
+            # The ERROR_STATE probability is updated, in visiting order, by x -> x + m for unmatched triggers and
+            # x -> max(0.05, x - m) for matched triggers. The composition of these, starting from 0, is the maximum
+            # of the total change and of 0.05 plus the change following each floored subtraction.
+            deltas = np.where(matched, -moved, moved).ravel()
+            remaining = deltas.sum() - np.cumsum(deltas)
+            floors = remaining[matched.ravel()]
+            error = deltas.sum()
+            if floors.size > 0:
+                error = max(error, 0.05 + floors.max())
+            new_values[num_states] = error
+
+        self._values = new_values
+        self._probabilities_cache = None
+
+        log = current_logger()
+        if log.is_enabled_for(Logger.DEBUG):
+            log.event(Trace.STATE_PROBABILITIES, (dict(zip(self._names, new_values.tolist())),), level=Logger.DEBUG)
 
 
 class AgendaPolicy(abc.ABC):
@@ -762,9 +1007,15 @@ class DefaultAgendaPolicy(AgendaPolicy):
     - max_transitions
         Max number of times we have triggering conditions before giving up on reaching a terminus.
 
+    The agenda made progress in a turn if the probability of no transition trigger is at most
+    PROGRESS_MAX_NON_TRIGGER_PROB, and the probability of the ERROR_STATE is at most PROGRESS_MAX_ERROR_STATE_PROB.
+
     See AgendaPolicy documentation for further details.
     """
 
+    PROGRESS_MAX_NON_TRIGGER_PROB = 0.4
+    PROGRESS_MAX_ERROR_STATE_PROB = 0.8
+
     def __init__(self,
                  agenda: "Agenda",
                  reuse: bool = False,
@@ -806,7 +1057,6 @@ class DefaultAgendaPolicy(AgendaPolicy):
         if kickoff_thresh <= 0.0:
             raise ValueError("kickoff_thresh must be positive, got %f" % kickoff_thresh)
         self._kickoff_thresh = kickoff_thresh
-        self._log = Logger()
 
     def to_dict(self) -> Dict[str, Any]:
         """Returns a dictionary representation of the state of this policy.
@@ -851,7 +1101,8 @@ class DefaultAgendaPolicy(AgendaPolicy):
         """
         non_event_probability = state.transition_trigger_probabilities.non_trigger_prob
         error_state_probability = state.state_probabilities.probabilities["ERROR_STATE"]
-        return non_event_probability <= 0.4 and error_state_probability <= .8
+        return (non_event_probability <= self.PROGRESS_MAX_NON_TRIGGER_PROB and
+                error_state_probability <= self.PROGRESS_MAX_ERROR_STATE_PROB)
 
     def is_done(self, state: AgendaState) -> bool:
         """Returns true if the agenda is likely in a terminus state.
@@ -867,10 +1118,11 @@ class DefaultAgendaPolicy(AgendaPolicy):
         # For state by decresing probabilities that we're in that state. 
         # TODO Probably simpler: just look at best and second-best state
         # TODO Don't access probability map directly
+        terminus_names = self._agenda.compile().terminus_names
         probability_map = state.state_probabilities.probabilities
         sorted_states = {k: v for k, v in sorted(probability_map.items(), key=lambda item: item[1], reverse=True)}
         for (rank, st) in enumerate(sorted_states):
-            if st in self._agenda.terminus_names:
+            if st in terminus_names:
                 # If this is an accept state, we can set our best exit candidate.
                 if rank == 0 and probability_map[st] >= self._absolute_accept_thresh:
                     return True
@@ -906,6 +1158,8 @@ class DefaultAgendaPolicy(AgendaPolicy):
         Returns:
             A list of actions to take.
         """
+        log = current_logger()
+        agenda = self._agenda.compile()
         actions_taken: List[Action] = []
         
         # Action map - maps states to a list of tuples of:
@@ -913,11 +1167,15 @@ class DefaultAgendaPolicy(AgendaPolicy):
         #  boolean to indicate if this an exclusive action that cannot be used
         #  with other actions, number of allowed repeats for this action)
         if turns_without_progress == 0:
-            self._log.add("Using normal action map.")
-            action_map = self._agenda.action_map
+            log.add("Using normal action map.")
+            _pick_actions.inc(self._agenda.name, "normal")
+            action_map = agenda.action_map
+            normal_action_map = True
         else:
-            self._log.add("Using stall action map.")
-            action_map = self._agenda.stall_action_map
+            log.add("Using stall action map.")
+            _pick_actions.inc(self._agenda.name, "stall")
+            action_map = agenda.stall_action_map
+            normal_action_map = agenda.stall_equals_normal
             
         # Work over the most likely state, to least likely, taking the first
         # actions we are allowed to given repeat allowance & exclusivity.
@@ -926,9 +1184,8 @@ class DefaultAgendaPolicy(AgendaPolicy):
                                            reverse=True)}:
             # XXX Maybe need to check likelihood.
             if st in action_map:
-                self._log.add(f"State {st} is the most likely state that has actions defined.")
-                for action_name in action_map[st]:
-                    action = self._agenda.action(action_name)
+                log.add("State %s is the most likely state that has actions defined.", st)
+                for action in action_map[st]:
                     exclusive_flag = action.exclusive_flag
                     allowed_repeats = action.allowed_repeats
                     
@@ -945,30 +1202,97 @@ class DefaultAgendaPolicy(AgendaPolicy):
                             # No more actions to add
                             break
                 if actions_taken:
-                    self._log.add(f"Doing actions: {[a.name for a in actions_taken]}")
+                    log.add("Doing actions: %s", [a.name for a in actions_taken])
                     return actions_taken
-                elif action_map == self._agenda.action_map:
-                    self._log.add("No normal actions left to take.")
+                elif normal_action_map:
+                    log.add("No normal actions left to take.")
                     # All normal actions were used the maximum number of times.
                     # See if there are stall actions left.
-                    if st in self._agenda.stall_action_map:
-                        for action_name in self._agenda.stall_action_map[st]:
-                            action = self._agenda.action(action_name)
+                    if st in agenda.stall_action_map:
+                        for action in agenda.stall_action_map[st]:
                             allowed_repeats = action.allowed_repeats
                             
                             num_times_action_was_used = action_history.count(action)
                             
                             if num_times_action_was_used < allowed_repeats:
-                                self._log.add(f"Using stall action {action.name} instead.")
+                                log.add("Using stall action %s instead.", action.name)
                                 return [action]
-                    self._log.add("No stall actions to take either.")
+                    log.add("No stall actions to take either.")
                 else:
-                    self._log.add("No stall actions left to take.")
+                    log.add("No stall actions left to take.")
                 # Couldn't find any action for most likely state.
                 break
         return []
 
 
+class CompiledAgenda:
+    """Frozen, compiled form of an Agenda, used by the default probability and policy classes in every turn.
+
+    Agenda stores its definition in name-keyed dicts, and most of its accessors return new lists, which is convenient
+    when building agendas, but wasteful in code that runs in every turn. A CompiledAgenda holds the same definition in
+    precomputed form:
+    - States and transition triggers are given integer ids, by their position in state_names and trigger_names. The
+      ERROR_STATE, which is not part of the agenda definition, has the id error_state, following all other states.
+    - Transitions are given per state, both by name in transitions, and by id in transition_table. The same
+      transitions are also given as a (states x triggers) NumPy array, transition_array, holding the id of the end
+      state of each transition, or -1 where a state has no transition for a trigger.
+    - Terminus states and actions are given as sets, for fast membership tests.
+    - Actions, normal and stall, are given per state as tuples of Action objects, both by state name and by state id.
+
+    A CompiledAgenda is created by Agenda.compile(), and must not be modified. An agenda that is modified after being
+    compiled gets a new CompiledAgenda the next time Agenda.compile() is called.
+    """
+
+    __slots__ = ("name", "state_names", "state_ids", "error_state", "start_state", "start_state_name", "terminus",
+                 "terminus_names", "trigger_names", "trigger_ids", "transitions", "transition_table",
+                 "transition_array", "actions",
+                 "action_set", "action_map", "stall_action_map", "actions_by_state", "stall_actions_by_state",
+                 "stall_equals_normal")
+
+    def __init__(self, agenda: "Agenda") -> None:
+        """Initializes a new CompiledAgenda. Use Agenda.compile() rather than calling this constructor directly.
+
+        Args:
+            agenda: The agenda to compile.
+        """
+        self.name: str = agenda.name
+        self.state_names: Tuple[str, ...] = tuple(agenda.state_names)
+        self.state_ids: Dict[str, int] = {name: i for (i, name) in enumerate(self.state_names)}
+        self.error_state: int = len(self.state_names)
+        self.start_state_name: str = agenda.start_state.name
+        self.start_state: int = self.state_ids[self.start_state_name]
+        self.terminus_names: FrozenSet[str] = frozenset(agenda.terminus_names)
+        self.terminus: FrozenSet[int] = frozenset(self.state_ids[name] for name in self.terminus_names)
+        self.trigger_names: Tuple[str, ...] = tuple(t.name for t in agenda.transition_triggers)
+        self.trigger_ids: Dict[str, int] = {name: i for (i, name) in enumerate(self.trigger_names)}
+        self.transitions: Tuple[Dict[str, str], ...] = tuple(
+            {trigger_name: agenda.transition_end_state_name(name, trigger_name)
+             for trigger_name in agenda.transition_trigger_names(name)}
+            for name in self.state_names)
+        self.transition_table: Tuple[Tuple[Tuple[int, int], ...], ...] = tuple(
+            tuple((self.trigger_ids[trigger_name], self.state_ids[end_name])
+                  for (trigger_name, end_name) in transitions.items())
+            for transitions in self.transitions)
+        self.transition_array: np.ndarray = np.full((len(self.state_names), len(self.trigger_names)), -1, dtype=int)
+        for (state_id, transitions) in enumerate(self.transition_table):
+            for (trigger_id, end_state_id) in transitions:
+                self.transition_array[state_id, trigger_id] = end_state_id
+        self.transition_array.setflags(write=False)
+        self.actions: Tuple[Action, ...] = tuple(agenda.actions)
+        self.action_set: FrozenSet[Action] = frozenset(self.actions)
+        action_map = agenda.action_map
+        stall_action_map = agenda.stall_action_map
+        self.action_map: Dict[str, Tuple[Action, ...]] = {
+            name: tuple(agenda.action(a) for a in action_names) for (name, action_names) in action_map.items()}
+        self.stall_action_map: Dict[str, Tuple[Action, ...]] = {
+            name: tuple(agenda.action(a) for a in action_names) for (name, action_names) in stall_action_map.items()}
+        self.actions_by_state: Tuple[Tuple[Action, ...], ...] = tuple(
+            self.action_map.get(name, ()) for name in self.state_names)
+        self.stall_actions_by_state: Tuple[Tuple[Action, ...], ...] = tuple(
+            self.stall_action_map.get(name, ()) for name in self.state_names)
+        self.stall_equals_normal: bool = stall_action_map == action_map
+
+
 class Agenda:
     """Class defining agenda behavior.
 
@@ -1032,6 +1356,7 @@ class Agenda:
         self._stall_action_map: Dict[str, List[str]] = {}
         self._kickoff_trigger_detectors: List[TriggerDetector] = []
         self._transition_trigger_detectors: List[TriggerDetector] = []
+        self._compiled: Optional[CompiledAgenda] = None
 
     @property
     def name(self) -> str:
@@ -1171,6 +1496,19 @@ class Agenda:
         """Returns the transition trigger detectors used by this agenda."""
         return list(self._transition_trigger_detectors)
 
+    def compile(self) -> CompiledAgenda:
+        """Returns the compiled form of the agenda.
+
+        The compiled agenda is cached, so this method is cheap to call repeatedly. Adding states, triggers,
+        transitions or actions to the agenda invalidates the cached compiled agenda.
+
+        Returns:
+            The compiled agenda.
+        """
+        if self._compiled is None:
+            self._compiled = CompiledAgenda(self)
+        return self._compiled
+
     def _to_dict(self) -> Dict[str, Any]:
         """Returns a dictionary representation of this agenda.
 
@@ -1289,6 +1627,7 @@ class Agenda:
         """
         if state.name in self._states:
             raise ValueError("Agenda already has a state with name '%s'" % state.name)
+        self._compiled = None
         self._states[state.name] = state
         self._action_map[state.name] = []
         self._stall_action_map[state.name] = []
@@ -1302,6 +1641,7 @@ class Agenda:
         """
         if state_name not in self._states:
             raise ValueError("Invalid start state, no state with name '%s'" % state_name)
+        self._compiled = None
         self._start_state_name = state_name
 
     def add_terminus(self, state_name: str) -> None:
@@ -1314,6 +1654,7 @@ class Agenda:
             raise ValueError("Invalid terminus state, no state with name '%s'" % state_name)
         elif state_name in self._terminus_names:
             raise ValueError("Terminus state already set: '%s'" % state_name)
+        self._compiled = None
         self._terminus_names.append(state_name)
 
     def add_transition_trigger(self, trigger: Trigger) -> None:
@@ -1324,6 +1665,7 @@ class Agenda:
         """
         if trigger.name in self._transition_triggers:
             raise ValueError("Agenda already has a transition trigger with name '%s'" % trigger.name)
+        self._compiled = None
         self._transition_triggers[trigger.name] = trigger
 
     def add_kickoff_trigger(self, trigger: Trigger) -> None:
@@ -1353,6 +1695,7 @@ class Agenda:
         elif trigger_name in self._transitions[start_state_name]:
             raise ValueError("End state for transition, from state '%s' already set for trigger '%s'" %
                              (start_state_name, trigger_name))
+        self._compiled = None
         self._transitions[start_state_name][trigger_name] = end_state_name
     
     def add_action(self, action: Action) -> None:
@@ -1363,6 +1706,7 @@ class Agenda:
         """
         if action.name in self._actions:
             raise ValueError("Agenda already has an action with name '%s'" % action.name)
+        self._compiled = None
         self._actions[action.name] = action
 
     def add_action_for_state(self, action_name: str, state_name: str) -> None:
@@ -1378,6 +1722,7 @@ class Agenda:
             raise ValueError("Invalid state for action, no state with name '%s'" % state_name)
         elif action_name in self._action_map[state_name]:
             raise ValueError("State '%s' already has action with name '%s'" % (state_name, action_name))
+        self._compiled = None
         self._action_map[state_name].append(action_name)
     
     def add_stall_action_for_state(self, action_name: str, state_name: str) -> None:
@@ -1393,6 +1738,7 @@ class Agenda:
             raise ValueError("Invalid state for stall action, no state with name '%s'" % state_name)
         elif action_name in self._stall_action_map[state_name]:
             raise ValueError("State '%s' already has stall action with name '%s'" % (state_name, action_name))
+        self._compiled = None
         self._stall_action_map[state_name].append(action_name)
 
     def add_transition_trigger_detector(self, trigger_detector: TriggerDetector) -> None:
@@ -1446,22 +1792,70 @@ class Agenda:
         Returns:
             The loaded agenda.
         """
+        agenda = cls._from_dict(cls._read(filename), policy_cls, state_probabilities_cls, trigger_probabilities_cls)
+        agenda._load_trigger_detectors(trigger_detector_loader, snips_multi_engine)
+        return agenda
+
+    @classmethod
+    def load_all(cls, filenames: List[str], trigger_detector_loader: TriggerDetectorLoader,
+                 snips_multi_engine: bool = False,
+                 policy_cls: Type[AgendaPolicy] = DefaultAgendaPolicy,
+                 state_probabilities_cls: Type[StateProbabilities] = DefaultStateProbabilities,
+                 trigger_probabilities_cls: Type[TriggerProbabilities] = DefaultTriggerProbabilities) -> List["Agenda"]:
+        """Load a number of agendas from files.
+
+        The agendas are loaded as by load(), except that the Snips engines of all of the agendas are first trained
+        together, see TriggerDetectorLoader.preload(). With a loader created with several snips_training_workers, the
+        engines are trained in parallel.
+
+        Args:
+            filenames: The names of the files to load.
+            trigger_detector_loader: The trigger detector loader to use to get trigger detectors for the agendas.
+            snips_multi_engine: If True, load Snips trigger detectors in multi-engine mode.
+            policy_cls: The policy class to use to control the agenda behavior.
+            state_probabilities_cls: The class to use to compute state probabilities.
+            trigger_probabilities_cls: The class to use to compute trigger probabilities.
+
+        Returns:
+            The loaded agendas, in the order of the files.
+        """
+        agendas = [cls._from_dict(cls._read(filename), policy_cls, state_probabilities_cls, trigger_probabilities_cls)
+                   for filename in filenames]
+        requests = []
+        for agenda in agendas:
+            requests.append((agenda.name, list(agenda._transition_triggers.keys())))
+            requests.append((agenda.name, list(agenda._kickoff_triggers.keys())))
+        trigger_detector_loader.preload(requests, snips_multi_engine=snips_multi_engine)
+        for agenda in agendas:
+            agenda._load_trigger_detectors(trigger_detector_loader, snips_multi_engine)
+        return agendas
+
+    @staticmethod
+    def _read(filename: str) -> Dict[str, Any]:
+        """Reads the dictionary representation of an agenda from file, as written by store().
+
+        Args:
+            filename: The name of the file.
+
+        Returns:
+            The dictionary representation of the agenda.
+        """
         with open(filename, "r") as file:
-            d = yaml.load(file, Loader=yaml.FullLoader)
-        agenda = cls._from_dict(d, policy_cls, state_probabilities_cls, trigger_probabilities_cls)
+            return yaml.load(file, Loader=yaml.FullLoader)
 
-        # Load trigger detectors
-        # Transition triggers
-        trigger_names = list(agenda._transition_triggers.keys())
-        detectors = trigger_detector_loader.load(agenda.name, trigger_names, snips_multi_engine=snips_multi_engine)
+    def _load_trigger_detectors(self, trigger_detector_loader: TriggerDetectorLoader, snips_multi_engine: bool) -> None:
+        """Gets trigger detectors for the triggers of the agenda from a loader, and adds them to the agenda.
 
-        for detector in detectors:
-            agenda.add_transition_trigger_detector(detector)
+        Args:
+            trigger_detector_loader: The trigger detector loader.
+            snips_multi_engine: If True, load Snips trigger detectors in multi-engine mode.
+        """
+        # Transition triggers
+        trigger_names = list(self._transition_triggers.keys())
+        for detector in trigger_detector_loader.load(self.name, trigger_names, snips_multi_engine=snips_multi_engine):
+            self.add_transition_trigger_detector(detector)
 
         # Kickoff triggers
-        trigger_names = list(agenda._kickoff_triggers.keys())
-        detectors = trigger_detector_loader.load(agenda.name, trigger_names, snips_multi_engine=snips_multi_engine)
-
-        for detector in detectors:
-            agenda.add_kickoff_trigger_detector(detector)
-        return agenda
+        trigger_names = list(self._kickoff_triggers.keys())
+        for detector in trigger_detector_loader.load(self.name, trigger_names, snips_multi_engine=snips_multi_engine):
+            self.add_kickoff_trigger_detector(detector)
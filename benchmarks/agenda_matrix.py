@@ -0,0 +1,115 @@
+"""Scaling benchmark: react() latency and memory as functions of agenda size and the number of agendas.
+
+Generates random agendas with generate_agenda(), with stub trigger detectors, for each combination of a number of
+states and a number of agendas per Puppeteer, and reports:
+
+    ms/turn:    The mean react() latency over a number of conversations.
+    p99 ms:     The 99th percentile of the react() latency.
+    agenda KB:  The memory held by the agendas themselves, shared by all conversations.
+    conv KB:    The memory held by a Puppeteer after one turn, on top of the agendas, i.e., the cost of a conversation
+                handled by its own Puppeteer.
+
+Run from the directory containing the puppeteer package:
+
+    python -m puppeteer.benchmarks.agenda_matrix --states 10 100 1000 --agendas 1 4 16
+"""
+import argparse
+import gc
+import os
+import time
+import tracemalloc
+from typing import Callable, List, Tuple, Type
+
+import numpy as np
+
+from puppeteer import (
+    Agenda,
+    DefaultStateProbabilities,
+    Extractions,
+    Puppeteer,
+    StateProbabilities,
+    VectorizedStateProbabilities,
+    generate_agenda
+)
+from puppeteer.benchmarks.common import add_stub_detectors, message
+from puppeteer.logging import Logger
+
+
+def allocated(setup: Callable[[], object]) -> Tuple[object, int]:
+    """Returns the result of the given setup function, and the number of bytes it allocated and still holds."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = setup()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def generate_agendas(args: argparse.Namespace, num_states: int, num_agendas: int,
+                     state_probabilities_cls: Type[StateProbabilities]) -> List[Agenda]:
+    """Generates and compiles the agendas of one cell of the matrix."""
+    agendas = [add_stub_detectors(generate_agenda("synthetic_%d_%d" % (num_states, i), num_states, args.triggers,
+                                                  branching=args.branching, num_termini=args.termini,
+                                                  actions_per_state=args.actions,
+                                                  stall_actions_per_state=args.stall_actions, seed=i,
+                                                  state_probabilities_cls=state_probabilities_cls))
+               for i in range(num_agendas)]
+    for agenda in agendas:
+        agenda.compile()
+    return agendas
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--states", type=int, nargs="+", default=[10, 100, 1000], help="Numbers of states per agenda.")
+    parser.add_argument("--agendas", type=int, nargs="+", default=[1, 4, 16], help="Numbers of agendas per Puppeteer.")
+    parser.add_argument("--triggers", type=int, default=10, help="Number of transition triggers per agenda.")
+    parser.add_argument("--branching", type=int, default=2, help="Number of outgoing transitions per state.")
+    parser.add_argument("--termini", type=int, default=1, help="Number of terminus states per agenda.")
+    parser.add_argument("--actions", type=int, default=1, help="Number of actions per state.")
+    parser.add_argument("--stall-actions", type=int, default=0, help="Number of stall actions per state.")
+    parser.add_argument("--vectorized", action="store_true", help="Use VectorizedStateProbabilities.")
+    parser.add_argument("--conversations", type=int, default=5, help="Number of conversations per cell.")
+    parser.add_argument("--turns", type=int, default=10, help="Number of turns per conversation.")
+    parser.add_argument("--store", help="Directory to store the generated agendas in, as YAML files.")
+    args = parser.parse_args()
+
+    state_probabilities_cls = VectorizedStateProbabilities if args.vectorized else DefaultStateProbabilities
+    # Warm up, so that memory allocated once, e.g., by lazy imports, is not counted in the first cell.
+    Puppeteer(generate_agendas(args, 10, 1, state_probabilities_cls)).react(message(0), Extractions())
+    print("%8s %8s %12s %12s %12s %12s" % ("states", "agendas", "ms/turn", "p99 ms", "agenda KB", "conv KB"))
+    for num_states in args.states:
+        for num_agendas in args.agendas:
+            (agendas, agenda_bytes) = allocated(
+                lambda: generate_agendas(args, num_states, num_agendas, state_probabilities_cls))
+            if args.store:
+                os.makedirs(args.store, exist_ok=True)
+                for agenda in agendas:
+                    agenda.store(os.path.join(args.store, "%s.yaml" % agenda.name))
+            np.random.seed(0)
+
+            def first_turn() -> Puppeteer:
+                puppeteer = Puppeteer(agendas, log_level=Logger.DISABLED)
+                puppeteer.react(message(0), Extractions())
+                return puppeteer
+
+            (_, conversation_bytes) = allocated(first_turn)
+
+            times = []
+            for c in range(args.conversations):
+                puppeteer = Puppeteer(agendas, log_level=Logger.DISABLED)
+                extractions = Extractions()
+                for t in range(args.turns):
+                    start = time.perf_counter()
+                    (_, new_extractions) = puppeteer.react(message(t, c), extractions)
+                    times.append(time.perf_counter() - start)
+                    extractions.update(new_extractions)
+            print("%8d %8d %12.3f %12.3f %12.1f %12.1f" % (num_states, num_agendas, 1000 * np.mean(times),
+                                                            1000 * np.percentile(times, 99), agenda_bytes / 1024,
+                                                            conversation_bytes / 1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Latency benchmark: react() latency as a function of the number of agendas.
+
+Compares the default mode, where all agendas are updated in every turn, with update_inactive_agendas=False, where
+only the current agenda runs its transition trigger detectors, and with lazy and indexed kickoff evaluation on top of
+that. Each copy of a shipped agenda gets its own stub
+detectors, each call costing the given number of seconds.
+
+Run from the directory containing the puppeteer package:
+
+    python -m puppeteer.benchmarks.agenda_scaling --copies 1 2 4 8 --cost 0.0005
+"""
+import argparse
+import time
+
+import numpy as np
+
+from puppeteer import Extractions, Puppeteer
+from puppeteer.benchmarks.common import load_agendas, message
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--copies", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="Numbers of copies of each shipped agenda to load.")
+    parser.add_argument("--cost", type=float, default=0.0005, help="Simulated cost in seconds of a detector call.")
+    parser.add_argument("--conversations", type=int, default=10, help="Number of conversations.")
+    parser.add_argument("--turns", type=int, default=10, help="Number of turns per conversation.")
+    args = parser.parse_args()
+
+    print("%8s %12s %14s %14s" % ("agendas", "mode", "ms/turn", "runs/turn"))
+    for copies in args.copies:
+        agendas = load_agendas(copies=copies, cost=args.cost, distinct_detectors=True)
+        for (mode, update_inactive_agendas, kickoff_evaluation) in [("all", True, "eager"),
+                                                                    ("active", False, "eager"),
+                                                                    ("lazy", False, "lazy"),
+                                                                    ("indexed", False, "indexed")]:
+            np.random.seed(0)
+            elapsed = 0.0
+            runs = 0
+            for c in range(args.conversations):
+                puppeteer = Puppeteer(agendas, update_inactive_agendas=update_inactive_agendas,
+                                      kickoff_evaluation=kickoff_evaluation)
+                extractions = Extractions()
+                for t in range(args.turns):
+                    start = time.perf_counter()
+                    (_, new_extractions) = puppeteer.react(message(t, c), extractions)
+                    elapsed += time.perf_counter() - start
+                    extractions.update(new_extractions)
+                runs += puppeteer.detector_cache.misses
+            turns = args.conversations * args.turns
+            print("%8d %12s %14.3f %14.1f" % (len(agendas), mode, 1000 * elapsed / turns, runs / turns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Throughput benchmark: per-conversation state updates vs. a BatchedStateStore.
+
+For each shipped agenda, runs one tick of state probability updates and is_done() evaluations for a number of
+conversations, first one conversation at a time with DefaultStateProbabilities and DefaultAgendaPolicy, then for all
+conversations at once with a BatchedStateStore. Trigger probabilities are random, with a fixed seed.
+
+Run from the directory containing the puppeteer package:
+
+    python -m puppeteer.benchmarks.batched_state_store --conversations 1000 10000 100000
+"""
+import argparse
+import time
+from typing import List
+
+import numpy as np
+
+from puppeteer import AgendaState, BatchedStateStore, Extractions, TriggerProbabilities
+from puppeteer.benchmarks.common import load_agendas
+
+
+class GivenTriggerProbabilities(TriggerProbabilities):
+    """Trigger probabilities set from given values, rather than by trigger detectors."""
+
+    def set(self, names: List[str], probabilities: List[float], non_trigger_prob: float) -> None:
+        self._probabilities = dict(zip(names, probabilities))
+        self._non_trigger_prob = non_trigger_prob
+
+    def update(self, observations, old_extractions, detector_cache=None) -> Extractions:
+        return Extractions()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Numbers of conversations.")
+    parser.add_argument("--loop-limit", type=int, default=10000,
+                        help="Maximum number of conversations to time one at a time. For larger numbers, the "
+                             "rate measured on this many conversations is reported.")
+    args = parser.parse_args()
+
+    print("%-16s %12s %16s %16s %10s" % ("agenda", "conversations", "loop conv/s", "batched conv/s", "speedup"))
+    for agenda in load_agendas():
+        store_names = BatchedStateStore(agenda).trigger_names
+        for n in args.conversations:
+            rng = np.random.RandomState(0)
+            triggers = (rng.random_sample((n, len(store_names))) < 0.3).astype(float)
+            non_trigger_probs = 1.0 - triggers.max(axis=1, initial=0.0)
+
+            # One conversation at a time.
+            looped = min(n, args.loop_limit)
+            agenda_state = AgendaState(agenda)
+            trigger_probabilities = GivenTriggerProbabilities(agenda)
+            initial = agenda_state.state_probabilities.get_state()
+            start = time.perf_counter()
+            for i in range(looped):
+                trigger_probabilities.set(store_names, triggers[i].tolist(), non_trigger_probs[i])
+                agenda_state.state_probabilities.set_state(initial)
+                agenda_state.state_probabilities.update(trigger_probabilities, [])
+                agenda.policy.is_done(agenda_state)
+            loop_rate = looped / (time.perf_counter() - start)
+
+            # All conversations at once.
+            store = BatchedStateStore(agenda, capacity=n)
+            conversation_ids = ["conversation-%d" % i for i in range(n)]
+            for conversation_id in conversation_ids:
+                store.add(conversation_id)
+            start = time.perf_counter()
+            store.update(conversation_ids, triggers, non_trigger_probs)
+            store.is_done(conversation_ids)
+            batch_rate = n / (time.perf_counter() - start)
+            print("%-16s %12d %16.0f %16.0f %10.1f" % (agenda.name, n, loop_rate, batch_rate, batch_rate / loop_rate))
+
+
+if __name__ == "__main__":
+    main()
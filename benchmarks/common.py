@@ -0,0 +1,234 @@
+import os
+import random
+import tempfile
+import time
+import zlib
+from os import listdir
+from os.path import basename, dirname, join, realpath
+from typing import Callable, Dict, List, Optional, Set, Tuple, Type
+
+import yaml
+
+from puppeteer import (
+    Agenda,
+    DefaultStateProbabilities,
+    Extractions,
+    MessageObservation,
+    Observation,
+    StateProbabilities,
+    TriggerDetector,
+    TriggerDetectorLoader,
+    generate_agenda
+)
+
+AGENDA_DIR = join(dirname(dirname(realpath(__file__))), "agendas")
+
+
+class StubTriggerDetector(TriggerDetector):
+    """Deterministic stand-in for an NLP-based trigger detector.
+
+    A trigger fires if its name occurs in a message text. Otherwise, it fires with probability given by the rate
+    parameter, decided by a hash of the message text and the trigger name, so that the same input always gives the
+    same output. The cost parameter is the number of seconds each call spends busy-waiting, to mimic the cost of a
+    real NLP engine.
+    """
+
+    def __init__(self, trigger_names: List[str], rate: float = 0.2, cost: float = 0.0) -> None:
+        self._trigger_names = list(trigger_names)
+        self._rate = rate
+        self._cost = cost
+        self.calls = 0
+
+    @property
+    def trigger_names(self) -> List[str]:
+        return list(self._trigger_names)
+
+    def trigger_probabilities(self, observations: List[Observation],
+                              old_extractions: Extractions) -> Tuple[Dict[str, float], float, Extractions]:
+        self.calls += 1
+        if self._cost > 0.0:
+            end = time.perf_counter() + self._cost
+            while time.perf_counter() < end:
+                pass
+        texts = [o.text for o in observations if isinstance(o, MessageObservation)]
+        text = "\n".join(texts)
+        trigger_map: Dict[str, float] = {}
+        for name in self._trigger_names:
+            if name in text:
+                trigger_map[name] = 1.0
+            else:
+                h = zlib.crc32((text + "|" + name).encode("utf-8")) / 0xffffffff
+                if h < self._rate:
+                    trigger_map[name] = 1.0
+        if trigger_map:
+            non_trigger_prob = 1.0 - max(trigger_map.values())
+        else:
+            non_trigger_prob = 1.0
+        return trigger_map, non_trigger_prob, Extractions()
+
+
+def add_stub_detectors(agenda: Agenda, rate: float = 0.2, cost: float = 0.0) -> Agenda:
+    """Adds stub trigger detectors for all triggers of an agenda, and returns the agenda.
+
+    Args:
+        agenda: The agenda, e.g., from generate_agenda().
+        rate: Firing rate of the stub detectors.
+        cost: Simulated cost in seconds of each detector call.
+
+    Returns:
+        The agenda.
+    """
+    agenda.add_transition_trigger_detector(
+        StubTriggerDetector([t.name for t in agenda.transition_triggers], rate=rate, cost=cost))
+    if agenda.kickoff_triggers:
+        agenda.add_kickoff_trigger_detector(
+            StubTriggerDetector([t.name for t in agenda.kickoff_triggers], rate=rate, cost=cost))
+    return agenda
+
+
+def synthetic_agenda(num_states: int, num_triggers: int,
+                     state_probabilities_cls: Type[StateProbabilities] = DefaultStateProbabilities) -> Agenda:
+    """Returns an agenda with a chain of states, each with a transition to the next one and an action.
+
+    Args:
+        num_states: Number of states.
+        num_triggers: Number of transition triggers.
+        state_probabilities_cls: The class to use to compute state probabilities.
+
+    Returns:
+        The agenda, with stub trigger detectors.
+    """
+    agenda = generate_agenda("synthetic_%d" % num_states, num_states, num_triggers, branching=1,
+                             num_kickoff_triggers=0, state_probabilities_cls=state_probabilities_cls)
+    return add_stub_detectors(agenda, rate=0.5)
+
+
+def timeit(f: Callable[[], object], repeats: int) -> float:
+    """Returns the mean time in seconds of calling the given function."""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        f()
+    return (time.perf_counter() - start) / repeats
+
+
+def agenda_files() -> List[str]:
+    """Returns the paths of the agenda files shipped with the library."""
+    return sorted(join(AGENDA_DIR, f) for f in listdir(AGENDA_DIR) if f.endswith(".yaml"))
+
+
+def agenda_trigger_names(filenames: List[str]) -> Set[str]:
+    """Returns the names of all triggers, kickoff and transition, used by the given agenda files."""
+    names: Set[str] = set()
+    for filename in filenames:
+        with open(filename, "r") as file:
+            d = yaml.load(file, Loader=yaml.FullLoader)
+        names.update(t["name"] for t in d["transition_triggers"])
+        names.update(t["name"] for t in d["kickoff_triggers"])
+    return names
+
+
+def stub_loader(filenames: List[str], rate: float = 0.2, cost: float = 0.0,
+                shared: bool = False) -> TriggerDetectorLoader:
+    """Returns a trigger detector loader serving stub detectors for all triggers of the given agenda files.
+
+    Args:
+        filenames: The agenda files.
+        rate: Firing rate of the stub detectors.
+        cost: Simulated cost in seconds of each detector call.
+        shared: If true, a single detector detects all triggers. Otherwise, there is one detector per trigger.
+    """
+    loader = TriggerDetectorLoader()
+    names = sorted(agenda_trigger_names(filenames))
+    if shared:
+        loader.register_detector(StubTriggerDetector(names, rate, cost))
+    else:
+        for name in names:
+            loader.register_detector(StubTriggerDetector([name], rate, cost))
+    return loader
+
+
+def load_agendas(copies: int = 1, rate: float = 0.2, cost: float = 0.0, shared: bool = False,
+                 filenames: Optional[List[str]] = None,
+                 detectors: Optional[List[TriggerDetector]] = None,
+                 distinct_detectors: bool = False) -> List[Agenda]:
+    """Loads the shipped agendas, with stub trigger detectors.
+
+    Args:
+        copies: Number of copies of each agenda to load. Copies get distinct names.
+        rate: Firing rate of the stub detectors.
+        cost: Simulated cost in seconds of each detector call.
+        shared: If true, a single detector detects all triggers.
+        filenames: Agenda files to load. Defaults to the shipped agendas.
+        detectors: Additional detectors, replacing the stub detectors for their triggers.
+        distinct_detectors: If true, each copy of an agenda gets its own stub detectors. Otherwise, all agendas share
+            the same detectors.
+
+    Returns:
+        The loaded agendas.
+    """
+    if filenames is None:
+        filenames = agenda_files()
+    def new_loader() -> TriggerDetectorLoader:
+        loader = stub_loader(filenames, rate, cost, shared)
+        for detector in detectors or []:
+            loader.register_detector(detector)
+        return loader
+    loaders = [new_loader()]
+    if distinct_detectors:
+        loaders.extend(new_loader() for _ in range(copies - 1))
+    agendas = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for filename in filenames:
+            with open(filename, "r") as file:
+                d = yaml.load(file, Loader=yaml.FullLoader)
+            name = d["name"]
+            for i in range(copies):
+                if copies > 1:
+                    d["name"] = "%s_%d" % (name, i)
+                path = join(tmpdir, "%s.yaml" % d["name"])
+                with open(path, "w") as file:
+                    yaml.dump(d, file, default_flow_style=False, sort_keys=False)
+                agendas.append(Agenda.load(path, loaders[i % len(loaders)]))
+    return agendas
+
+
+MESSAGES = [
+    "Hello",
+    "Why?",
+    "routing number: 8998 account number: 12321312321",
+    "None of your business",
+    "I live in Chicago.",
+    "payment",
+    "No way",
+    "Can you pay with paypal?",
+    "what is your account number",
+    "I'm from Ohio",
+]
+
+
+def message(turn: int, conversation: int = 0) -> List[Observation]:
+    """Returns the observations for the given turn of a deterministic benchmark conversation."""
+    return [MessageObservation(MESSAGES[(turn + conversation) % len(MESSAGES)])]
+
+
+# Vocabulary of the example sentences of synthetic Snips intents.
+SNIPS_WORDS = ("account bank card money send pay transfer help please now where when name city live work phone call "
+               "time today tomorrow price cheap fast need want know tell give number address code open close").split()
+
+
+def write_synthetic_intents(root: str, intents: int, examples: int, seed: int = 0) -> None:
+    """Writes training data for synthetic intents, with random positive and negative example sentences."""
+    rng = random.Random(seed)
+    for i in range(intents):
+        name = "intent%d" % i
+        os.makedirs(join(root, name))
+        keywords = rng.sample(SNIPS_WORDS, 3)
+        for (filename, words) in [(name, keywords + SNIPS_WORDS), ("NOT" + name, SNIPS_WORDS)]:
+            with open(join(root, name, "%s.txt" % filename), "w") as file:
+                for _ in range(examples):
+                    file.write(" ".join(rng.choice(words) for _ in range(rng.randint(3, 10))) + "\n")
+
+
+def intent_paths(root: str) -> List[str]:
+    """Returns the intent folders under a root path, i.e., the folders holding a file named after the folder."""
+    return sorted(wpath for (wpath, _, files) in os.walk(root) if "%s.txt" % basename(wpath) in files)
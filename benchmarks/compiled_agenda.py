@@ -0,0 +1,51 @@
+"""Micro-benchmark: per-turn cost of the default agenda classes as a function of the number of agenda states.
+
+Builds synthetic agendas with a chain of states, each state having a transition to the next state for one of a fixed
+number of triggers, and an action. Reports the time of one state probability update, and of the is_done() and
+pick_actions() policy calls, once every state has enough probability mass to take part in transitions.
+
+Run from the directory containing the puppeteer package:
+
+    python -m puppeteer.benchmarks.compiled_agenda --states 10 100 1000 10000
+"""
+import argparse
+import time
+
+from puppeteer import AgendaState, Extractions, MessageObservation
+from puppeteer.benchmarks.common import synthetic_agenda, timeit
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--states", type=int, nargs="+", default=[10, 100, 1000, 10000],
+                        help="Numbers of agenda states.")
+    parser.add_argument("--triggers", type=int, default=10, help="Number of transition triggers.")
+    parser.add_argument("--budget", type=float, default=1.0, help="Approximate number of seconds per measurement.")
+    args = parser.parse_args()
+
+    print("%8s %12s %14s %14s %14s" % ("states", "compile ms", "update ms", "is_done ms", "pick ms"))
+    for num_states in args.states:
+        agenda = synthetic_agenda(num_states, args.triggers)
+        start = time.perf_counter()
+        agenda.compile()
+        compile_time = time.perf_counter() - start
+
+        state = AgendaState(agenda)
+        observations = [MessageObservation("benchmark")]
+
+        def update() -> None:
+            state.update([], observations, Extractions())
+
+        update()
+        snapshot = state.state_probabilities.get_state()
+        repeats = max(1, int(args.budget / max(timeit(update, 1), 1e-6)))
+        update_time = timeit(update, repeats)
+        state.state_probabilities.set_state(snapshot)
+        is_done_time = timeit(lambda: agenda.policy.is_done(state), repeats)
+        pick_time = timeit(lambda: agenda.policy.pick_actions(state, [], 0), repeats)
+        print("%8d %12.3f %14.3f %14.3f %14.3f" % (num_states, 1000 * compile_time, 1000 * update_time,
+                                                   1000 * is_done_time, 1000 * pick_time))
+
+
+if __name__ == "__main__":
+    main()
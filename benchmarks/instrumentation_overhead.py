@@ -0,0 +1,62 @@
+"""Latency benchmark: react() latency with and without timing instruments.
+
+Runs the same conversations over the shipped agendas with stub trigger detectors, first with no instrument registered
+and then with a HistogramCollector, and prints the report of the collector. Stub detectors are free, so the measured
+difference is the overhead of the timing hooks themselves.
+
+Run from the directory containing the puppeteer package:
+
+    python -m puppeteer.benchmarks.instrumentation_overhead --copies 1 4
+"""
+import argparse
+import time
+
+import numpy as np
+
+from puppeteer import Extractions, HistogramCollector, Puppeteer, add_instrument, remove_instrument
+from puppeteer.benchmarks.common import load_agendas, message
+from puppeteer.logging import Logger
+
+
+def run(agendas: list, conversations: int, turns: int) -> float:
+    """Runs conversations, returning the mean time per turn, in seconds."""
+    np.random.seed(0)
+    elapsed = 0.0
+    for c in range(conversations):
+        puppeteer = Puppeteer(agendas, log_level=Logger.DISABLED)
+        extractions = Extractions()
+        for t in range(turns):
+            start = time.perf_counter()
+            (_, new_extractions) = puppeteer.react(message(t, c), extractions)
+            elapsed += time.perf_counter() - start
+            extractions.update(new_extractions)
+    return elapsed / (conversations * turns)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--copies", type=int, nargs="+", default=[1, 4],
+                        help="Numbers of copies of each shipped agenda to load.")
+    parser.add_argument("--conversations", type=int, default=20, help="Number of conversations.")
+    parser.add_argument("--turns", type=int, default=10, help="Number of turns per conversation.")
+    args = parser.parse_args()
+
+    reports = []
+    print("%8s %16s %16s %10s" % ("agendas", "none ms/turn", "hist ms/turn", "overhead"))
+    for copies in args.copies:
+        agendas = load_agendas(copies=copies)
+        plain = run(agendas, args.conversations, args.turns)
+        collector = HistogramCollector()
+        add_instrument(collector)
+        try:
+            timed = run(agendas, args.conversations, args.turns)
+        finally:
+            remove_instrument(collector)
+        print("%8d %16.3f %16.3f %9.1f%%" % (len(agendas), 1000 * plain, 1000 * timed, 100 * (timed / plain - 1)))
+        reports.append((len(agendas), collector.report()))
+    for (agendas_count, report) in reports:
+        print("\n%d agendas:\n%s" % (agendas_count, report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Latency benchmark: react() latency as a function of the log level.
+
+Runs the same conversations over the shipped agendas with stub trigger detectors, with the log level set to DEBUG (the
+full log, as by default), INFO (inputs, outputs and decisions only) and DISABLED. Stub detectors are free, so the
+measured time is spent in the puppeteer itself, including logging.
+
+Run from the directory containing the puppeteer package:
+
+    python -m puppeteer.benchmarks.logging_overhead --copies 1 4
+"""
+import argparse
+import time
+
+import numpy as np
+
+from puppeteer import Extractions, Puppeteer
+from puppeteer.benchmarks.common import load_agendas, message
+from puppeteer.logging import Logger
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--copies", type=int, nargs="+", default=[1, 4],
+                        help="Numbers of copies of each shipped agenda to load.")
+    parser.add_argument("--conversations", type=int, default=20, help="Number of conversations.")
+    parser.add_argument("--turns", type=int, default=10, help="Number of turns per conversation.")
+    args = parser.parse_args()
+
+    print("%8s %10s %14s %14s" % ("agendas", "level", "ms/turn", "log lines"))
+    for copies in args.copies:
+        agendas = load_agendas(copies=copies)
+        for (name, level) in [("DEBUG", Logger.DEBUG), ("INFO", Logger.INFO), ("DISABLED", Logger.DISABLED)]:
+            np.random.seed(0)
+            elapsed = 0.0
+            lines = 0
+            for c in range(args.conversations):
+                puppeteer = Puppeteer(agendas, log_level=level)
+                extractions = Extractions()
+                for t in range(args.turns):
+                    start = time.perf_counter()
+                    (_, new_extractions) = puppeteer.react(message(t, c), extractions)
+                    elapsed += time.perf_counter() - start
+                    log = puppeteer.log
+                    lines += 0 if log is None else log.count("\n") + 1
+                    extractions.update(new_extractions)
+            turns = args.conversations * args.turns
+            print("%8d %10s %14.3f %14.1f" % (len(agendas), name, 1000 * elapsed / turns, lines / turns))
+
+
+if __name__ == "__main__":
+    main()
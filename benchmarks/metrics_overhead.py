@@ -0,0 +1,67 @@
+"""Microbenchmark: the cost of a metric update on the react() path.
+
+Measures the time per Counter.inc() call with labels, from one and from several threads at once, next to the same
+increments made on a plain dictionary guarded by a lock. Metric updates are made without locks, each thread adding to
+its own shard, so their cost stays flat as threads are added.
+
+Run from the directory containing the puppeteer package:
+
+    python -m puppeteer.benchmarks.metrics_overhead --threads 1 4
+"""
+import argparse
+import threading
+import time
+from typing import Callable, Dict, Tuple
+
+from puppeteer import MetricsRegistry
+
+
+def run_threads(threads: int, updates: int, update: Callable[[int], None]) -> float:
+    """Runs updates from a number of threads at once, returning the mean time per update, in seconds."""
+    barrier = threading.Barrier(threads + 1)
+
+    def run() -> None:
+        barrier.wait()
+        for i in range(updates):
+            update(i)
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - start) / (threads * updates)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4], help="Numbers of updating threads.")
+    parser.add_argument("--updates", type=int, default=200000, help="Number of updates per thread.")
+    parser.add_argument("--agendas", type=int, default=16, help="Number of distinct label values.")
+    args = parser.parse_args()
+
+    names = ["agenda_%d" % i for i in range(args.agendas)]
+    print("%8s %16s %16s" % ("threads", "counter ns/inc", "locked ns/inc"))
+    for threads in args.threads:
+        counter = MetricsRegistry().counter("kickoffs_total", "Kickoffs.", ["agenda"])
+        lock = threading.Lock()
+        locked: Dict[Tuple[str, ...], int] = {}
+
+        def inc_counter(i: int) -> None:
+            counter.inc(names[i % len(names)])
+
+        def inc_locked(i: int) -> None:
+            key = (names[i % len(names)],)
+            with lock:
+                locked[key] = locked.get(key, 0) + 1
+
+        counter_time = run_threads(threads, args.updates, inc_counter)
+        locked_time = run_threads(threads, args.updates, inc_locked)
+        assert sum(counter.values().values()) == sum(locked.values()) == threads * args.updates
+        print("%8d %16.1f %16.1f" % (threads, 1e9 * counter_time, 1e9 * locked_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Latency benchmark: react() latency with a TurnProfiler profiling a fraction of the turns.
+
+Runs the same conversations over the shipped agendas with stub trigger detectors, with no profiler and with profilers
+sampling one in every N turns, and prints the mean and p99 latencies. The summary of the last profiler is then
+printed, and its samples can be written as collapsed stacks, e.g., for flamegraph.pl.
+
+Run from the directory containing the puppeteer package:
+
+    python -m puppeteer.benchmarks.profiler_overhead --every 100 10 1 --collapsed stacks.txt
+"""
+import argparse
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from puppeteer import Agenda, Extractions, Puppeteer, TurnProfiler
+from puppeteer.benchmarks.common import load_agendas, message
+from puppeteer.logging import Logger
+
+
+def run(agendas: List[Agenda], conversations: int, turns: int, profiler: Optional[TurnProfiler]) -> List[float]:
+    """Runs conversations, returning the time of each turn, in seconds."""
+    np.random.seed(0)
+    times = []
+    for c in range(conversations):
+        puppeteer = Puppeteer(agendas, log_level=Logger.DISABLED, profiler=profiler)
+        extractions = Extractions()
+        for t in range(turns):
+            start = time.perf_counter()
+            (_, new_extractions) = puppeteer.react(message(t, c), extractions)
+            times.append(time.perf_counter() - start)
+            extractions.update(new_extractions)
+    return times
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--copies", type=int, default=4, help="Number of copies of each shipped agenda to load.")
+    parser.add_argument("--conversations", type=int, default=50, help="Number of conversations.")
+    parser.add_argument("--turns", type=int, default=10, help="Number of turns per conversation.")
+    parser.add_argument("--every", type=int, nargs="+", default=[100, 10, 1],
+                        help="Profile one in every this many turns.")
+    parser.add_argument("--collapsed", help="File to write the collapsed stacks of the last profiler to.")
+    args = parser.parse_args()
+
+    agendas = load_agendas(copies=args.copies)
+    print("%10s %12s %12s %10s %10s" % ("every", "mean ms", "p99 ms", "profiled", "samples"))
+    times = run(agendas, args.conversations, args.turns, None)
+    print("%10s %12.3f %12.3f %10d %10d" % ("none", 1000 * np.mean(times), 1000 * np.percentile(times, 99), 0, 0))
+    profiler = None
+    for every in args.every:
+        with TurnProfiler(every=every) as profiler:
+            times = run(agendas, args.conversations, args.turns, profiler)
+        print("%10d %12.3f %12.3f %10d %10d" % (every, 1000 * np.mean(times), 1000 * np.percentile(times, 99),
+                                                 profiler.profiled_turns, profiler.samples))
+    if profiler is not None:
+        print()
+        print(profiler.report())
+        if args.collapsed:
+            with open(args.collapsed, "w") as file:
+                profiler.write_collapsed(file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Throughput benchmark: PuppeteerPool.react_batch() with Spacy processing batched through nlp.pipe().
+
+The location triggers of the shipped get_location agenda are detected by a detector using Spacy for sentence
+splitting and named entity recognition. All other triggers use stub detectors. Requires Spacy and the given model.
+
+Run from the directory containing the puppeteer package:
+
+    python -m puppeteer.benchmarks.react_batch --model en_core_web_sm --conversations 1024
+"""
+import argparse
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from puppeteer import (
+    Extractions,
+    MessageObservation,
+    Observation,
+    PuppeteerPool,
+    SpacyEngine,
+    TriggerDetector
+)
+from puppeteer.benchmarks.common import MESSAGES, load_agendas
+
+
+class LocationEntityTriggerDetector(TriggerDetector):
+    """Detects location triggers using Spacy named entity recognition."""
+
+    def __init__(self, nlp: SpacyEngine) -> None:
+        self._nlp = nlp
+
+    @property
+    def trigger_names(self) -> List[str]:
+        return ["broad_loc", "specific_loc"]
+
+    def trigger_probabilities(self, observations: List[Observation],
+                              old_extractions: Extractions) -> Tuple[Dict[str, float], float, Extractions]:
+        text = "\n".join([o.text for o in observations if isinstance(o, MessageObservation)])
+        sentences = self._nlp.get_sentences(text)
+        locs = self._nlp.nent_extraction(text)["locs"]
+        if not locs:
+            return {}, 1.0, Extractions()
+        elif len(sentences) == 1:
+            return {"specific_loc": 1.0}, 0.0, Extractions()
+        else:
+            return {"broad_loc": 1.0}, 0.0, Extractions()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="en_core_web_sm", help="Spacy model to use.")
+    parser.add_argument("--conversations", type=int, default=1024, help="Number of conversations.")
+    parser.add_argument("--turns", type=int, default=4, help="Number of turns per conversation.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 64, 256], help="Batch sizes to run.")
+    args = parser.parse_args()
+
+    nlp = SpacyEngine.load(args.model)
+    agendas = load_agendas(detectors=[LocationEntityTriggerDetector(nlp)])
+
+    for batch_size in args.batch_sizes:
+        np.random.seed(0)
+        pool = PuppeteerPool(agendas)
+        extractions = {}
+        for c in range(args.conversations):
+            pool.create(str(c))
+            extractions[str(c)] = Extractions()
+        start = time.perf_counter()
+        for t in range(args.turns):
+            for first in range(0, args.conversations, batch_size):
+                turns = []
+                for c in range(first, min(first + batch_size, args.conversations)):
+                    text = "%s I moved here from Paris in %d." % (MESSAGES[(t + c) % len(MESSAGES)], 1900 + c % 100)
+                    turns.append((str(c), [MessageObservation(text)], extractions[str(c)]))
+                for ((conversation_id, _, _), (_, new_extractions)) in zip(turns, pool.react_batch(turns, batch_size)):
+                    extractions[conversation_id].update(new_extractions)
+        elapsed = time.perf_counter() - start
+        print("batch size %4d: %8.1f turns/s" % (batch_size, args.conversations * args.turns / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Memory benchmark: conversations per GB with one Puppeteer per conversation vs. a PuppeteerPool.
+
+Run from the directory containing the puppeteer package:
+
+    python -m puppeteer.benchmarks.session_memory --conversations 2000 --turns 3
+"""
+import argparse
+import gc
+import tracemalloc
+from typing import Callable
+
+import numpy as np
+
+from puppeteer import Extractions, Puppeteer, PuppeteerPool
+from puppeteer.benchmarks.common import load_agendas, message
+
+
+def measure(setup: Callable[[], object]) -> int:
+    """Returns the number of bytes allocated, and still held, by the given setup function."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = setup()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return after - before
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=2000, help="Number of conversations.")
+    parser.add_argument("--turns", type=int, default=3, help="Number of turns to run in each conversation.")
+    parser.add_argument("--copies", type=int, default=4, help="Number of copies of each shipped agenda to load.")
+    args = parser.parse_args()
+
+    agendas = load_agendas(copies=args.copies)
+    extractions = Extractions()
+
+    def puppeteers() -> object:
+        np.random.seed(0)
+        conversations = []
+        for c in range(args.conversations):
+            puppeteer = Puppeteer(agendas)
+            for t in range(args.turns):
+                puppeteer.react(message(t, c), extractions)
+            conversations.append(puppeteer)
+        return conversations
+
+    def pool() -> object:
+        np.random.seed(0)
+        pool = PuppeteerPool(agendas)
+        for c in range(args.conversations):
+            conversation_id = "conversation-%d" % c
+            pool.create(conversation_id)
+            for t in range(args.turns):
+                pool.react(conversation_id, message(t, c), extractions)
+        return pool
+
+    print("%d agendas, %d conversations, %d turns per conversation" %
+          (len(agendas), args.conversations, args.turns))
+    for (name, setup) in [("Puppeteer per conversation", puppeteers), ("PuppeteerPool", pool)]:
+        size = measure(setup)
+        per_conversation = size / args.conversations
+        print("%-28s %10.0f bytes/conversation %12.0f conversations/GB" %
+              (name, per_conversation, 2**30 / per_conversation))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Turn latency benchmark: one Snips trigger detector per agenda against a single detector shared by all agendas.
+
+Loads --agendas synthetic agendas, each with a kickoff trigger and a chain of --triggers transition triggers, all
+detected by Snips intents drawn from --intents synthetic intents, or from the intents under --snips-path. The agendas
+are loaded twice:
+
+    separate:  With a TriggerDetectorLoader, giving each agenda Snips trigger detectors of its own, for kickoff and for
+               transition triggers, each parsing every sentence of every message.
+    shared:    With a TriggerDetectorLoader created with shared_snips_engine=True, giving all agendas a single Snips
+               trigger detector, trained on the union of their intents, which parses every sentence once per turn.
+
+For each loader, the table shows the time to load the agendas, and the number of sentences parsed by Snips engines
+and the latency per turn, serving conversations of --turns turns of random messages. Requires Snips and the default
+Spacy model.
+
+Run from the directory containing the puppeteer package:
+
+    python -m puppeteer.benchmarks.shared_snips_engine --agendas 12 --intents 24
+    python -m puppeteer.benchmarks.shared_snips_engine --snips-path training_data --multi-engine
+"""
+import argparse
+import random
+import tempfile
+import time
+from os.path import basename, join
+from typing import List
+
+from puppeteer import (
+    Action,
+    Agenda,
+    Extractions,
+    MessageObservation,
+    Puppeteer,
+    SnipsEngine,
+    State,
+    Trigger,
+    TriggerDetectorLoader,
+    metrics_registry
+)
+from puppeteer.benchmarks.common import SNIPS_WORDS, intent_paths, write_synthetic_intents
+
+
+def synthetic_snips_agenda(name: str, intent_names: List[str], loader: TriggerDetectorLoader,
+                           multi_engine: bool) -> Agenda:
+    """Returns an agenda kicked off by the first intent, with a chain of states, one per other intent."""
+    agenda = Agenda(name)
+    agenda.add_kickoff_trigger(Trigger(intent_names[0]))
+    for trigger_name in intent_names[1:]:
+        agenda.add_transition_trigger(Trigger(trigger_name))
+    for i in range(len(intent_names)):
+        agenda.add_state(State("state_%d" % i))
+        agenda.add_action(Action("action_%d" % i))
+        agenda.add_action_for_state("action_%d" % i, "state_%d" % i)
+    for (i, trigger_name) in enumerate(intent_names[1:]):
+        agenda.add_transition("state_%d" % i, trigger_name, "state_%d" % (i + 1))
+    agenda.set_start_state("state_0")
+    agenda.add_terminus("state_%d" % (len(intent_names) - 1))
+    for detector in loader.load(name, intent_names[1:], snips_multi_engine=multi_engine):
+        agenda.add_transition_trigger_detector(detector)
+    for detector in loader.load(name, intent_names[:1], snips_multi_engine=multi_engine):
+        agenda.add_kickoff_trigger_detector(detector)
+    return agenda
+
+
+def parses() -> float:
+    metric = metrics_registry().metric("puppeteer_snips_parses_total")
+    return 0 if metric is None else metric.value()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--snips-path", help="Root path of Snips training data. Defaults to synthetic intents.")
+    parser.add_argument("--intents", type=int, default=24, help="Number of synthetic intents.")
+    parser.add_argument("--examples", type=int, default=30, help="Number of example sentences per synthetic intent.")
+    parser.add_argument("--agendas", type=int, default=12, help="Number of agendas.")
+    parser.add_argument("--triggers", type=int, default=3, help="Number of transition triggers per agenda.")
+    parser.add_argument("--multi-engine", action="store_true", help="Load Snips detectors in multi-engine mode.")
+    parser.add_argument("--conversations", type=int, default=10, help="Number of conversations.")
+    parser.add_argument("--turns", type=int, default=10, help="Number of turns per conversation.")
+    parser.add_argument("--sentences", type=int, default=2, help="Number of sentences per message.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    messages = ["\n".join(" ".join(rng.choice(SNIPS_WORDS) for _ in range(rng.randint(3, 10))).capitalize() + "."
+                          for _ in range(args.sentences))
+                for _ in range(args.turns)]
+    with tempfile.TemporaryDirectory() as directory:
+        root = args.snips_path
+        if root is None:
+            root = join(directory, "intents")
+            write_synthetic_intents(root, args.intents, args.examples, args.seed)
+        names = [basename(p) for p in intent_paths(root)]
+        agenda_intents = [rng.sample(names, min(len(names), args.triggers + 1)) for _ in range(args.agendas)]
+
+        print("%d agendas, %d intents" % (args.agendas, len(names)))
+        print("%-10s %10s %16s %14s" % ("loader", "load", "parses per turn", "turn latency"))
+        for shared in [False, True]:
+            SnipsEngine._engines.clear()
+            loader = TriggerDetectorLoader(default_snips_path=root, shared_snips_engine=shared)
+            start = time.perf_counter()
+            loader.preload([("agenda_%d" % i, intents) for (i, intents) in enumerate(agenda_intents)],
+                           snips_multi_engine=args.multi_engine)
+            agendas = [synthetic_snips_agenda("agenda_%d" % i, intents, loader, args.multi_engine)
+                       for (i, intents) in enumerate(agenda_intents)]
+            load = time.perf_counter() - start
+
+            before = parses()
+            start = time.perf_counter()
+            for _ in range(args.conversations):
+                puppeteer = Puppeteer(agendas)
+                extractions = Extractions()
+                for message in messages:
+                    (_, new_extractions) = puppeteer.react([MessageObservation(message)], extractions)
+                    extractions.update(new_extractions)
+            turns = args.conversations * args.turns
+            latency = (time.perf_counter() - start) / turns
+            print("%-10s %9.2fs %16.1f %12.2fms" % ("shared" if shared else "separate", load,
+                                                    (parses() - before) / turns, 1000 * latency))
+        SnipsEngine._engines.clear()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Startup benchmark: loading Snips engines with a cold, warm and in-memory engine cache.
+
+Loads Snips engines for all intents under --snips-path, or, if not given, for --intents synthetic intents with random
+example sentences, in single-engine mode or, with --multi-engine, with one engine per intent as SnipsTriggerDetector
+does in multi-engine mode. The engines are loaded three times:
+
+    cold:    With an empty disk cache, so that all engines are trained, and written to the cache.
+    warm:    With the engines dropped from memory, so that all engines are read from the disk cache, as when a new
+             process starts.
+    memory:  With the engines still in memory.
+
+The warm engines are checked to parse a sample of the training sentences exactly as the cold ones.
+
+Run from the directory containing the puppeteer package:
+
+    python -m puppeteer.benchmarks.snips_cache --intents 20 --multi-engine
+    python -m puppeteer.benchmarks.snips_cache --snips-path training_data
+"""
+import argparse
+import os
+import tempfile
+import time
+from os.path import basename, isfile, join
+from typing import List
+
+from puppeteer import SnipsEngine, SpacyEngine
+from puppeteer.benchmarks.common import intent_paths, write_synthetic_intents
+
+
+def load_all(paths_list: List[List[str]], nlp: SpacyEngine) -> float:
+    """Loads an engine for each list of paths, returning the time taken, in seconds."""
+    start = time.perf_counter()
+    for paths in paths_list:
+        SnipsEngine.load(paths, nlp)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--snips-path", help="Root path of Snips training data. Defaults to synthetic intents.")
+    parser.add_argument("--intents", type=int, default=10, help="Number of synthetic intents.")
+    parser.add_argument("--examples", type=int, default=50, help="Number of example sentences per synthetic intent.")
+    parser.add_argument("--multi-engine", action="store_true", help="Load one engine per intent.")
+    parser.add_argument("--spacy-model", default="en_core_web_lg", help="Spacy model used by the engines.")
+    args = parser.parse_args()
+
+    nlp = SpacyEngine.load(args.spacy_model)
+    with tempfile.TemporaryDirectory() as directory:
+        root = args.snips_path
+        if root is None:
+            root = join(directory, "intents")
+            write_synthetic_intents(root, args.intents, args.examples)
+        paths = intent_paths(root)
+        paths_list = [[p] for p in paths] if args.multi_engine else [paths]
+        SnipsEngine.set_cache_directory(join(directory, "cache"))
+        SnipsEngine._engines.clear()
+        cold = load_all(paths_list, nlp)
+        cold_engines = [SnipsEngine.load(p, nlp) for p in paths_list]
+        SnipsEngine._engines.clear()
+        warm = load_all(paths_list, nlp)
+        warm_engines = [SnipsEngine.load(p, nlp) for p in paths_list]
+        memory = load_all(paths_list, nlp)
+        cache_bytes = sum(os.path.getsize(join(directory, "cache", f)) for f in os.listdir(join(directory, "cache")))
+
+        sentences = []
+        for path in paths[:10]:
+            filename = join(path, "%s.txt" % basename(path))
+            if isfile(filename):
+                with open(filename, "r") as file:
+                    sentences.extend(line.strip() for line in list(file)[:5] if line.strip())
+        same = all(c._engine.parse(s) == w._engine.parse(s)
+                   for (c, w) in zip(cold_engines, warm_engines) for s in sentences)
+        SnipsEngine.set_cache_directory(None)
+
+    print("%d intents, %d engines, %.1f MB cached" % (len(paths), len(paths_list), cache_bytes / 1e6))
+    print("%-8s %10s" % ("start", "seconds"))
+    for (name, seconds) in [("cold", cold), ("warm", warm), ("memory", memory)]:
+        print("%-8s %10.3f" % (name, seconds))
+    print("warm engines parse as cold engines: %s" % same)
+
+
+if __name__ == "__main__":
+    main()
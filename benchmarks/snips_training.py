@@ -0,0 +1,53 @@
+"""Startup benchmark: training Snips engines in multi-engine mode, with a growing number of worker processes.
+
+Trains one Snips engine per intent, as SnipsTriggerDetector does in multi-engine mode, for all intents under
+--snips-path or, if not given, for --intents synthetic intents, using SnipsEngine.load_many() with each of the given
+numbers of worker processes. The disk cache is not used, so all engines are trained in every run. With enough cores,
+the time should go down about linearly with the number of workers, up to the number of intents.
+
+Run from the directory containing the puppeteer package:
+
+    python -m puppeteer.benchmarks.snips_training --intents 16 --workers 1 2 4 8
+"""
+import argparse
+import os
+import tempfile
+import time
+from os.path import join
+
+from puppeteer import SnipsEngine, SpacyEngine
+from puppeteer.benchmarks.common import intent_paths, write_synthetic_intents
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--snips-path", help="Root path of Snips training data. Defaults to synthetic intents.")
+    parser.add_argument("--intents", type=int, default=8, help="Number of synthetic intents.")
+    parser.add_argument("--examples", type=int, default=50, help="Number of example sentences per synthetic intent.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Numbers of worker processes.")
+    parser.add_argument("--spacy-model", default="en_core_web_lg", help="Spacy model used by the engines.")
+    args = parser.parse_args()
+
+    nlp = SpacyEngine.load(args.spacy_model)
+    SnipsEngine.set_cache_directory(None)
+    with tempfile.TemporaryDirectory() as directory:
+        root = args.snips_path
+        if root is None:
+            root = join(directory, "intents")
+            write_synthetic_intents(root, args.intents, args.examples)
+        paths_list = [[p] for p in intent_paths(root)]
+        print("%d intents, %d CPUs" % (len(paths_list), os.cpu_count() or 1))
+        print("%8s %10s %8s" % ("workers", "seconds", "speedup"))
+        base = None
+        for workers in args.workers:
+            SnipsEngine._engines.clear()
+            start = time.perf_counter()
+            SnipsEngine.load_many(paths_list, nlp, workers=workers)
+            elapsed = time.perf_counter() - start
+            base = elapsed if base is None else base
+            print("%8d %10.3f %7.2fx" % (workers, elapsed, base / elapsed))
+        SnipsEngine._engines.clear()
+
+
+if __name__ == "__main__":
+    main()
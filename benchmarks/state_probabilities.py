@@ -0,0 +1,49 @@
+"""Micro-benchmark: DefaultStateProbabilities vs. VectorizedStateProbabilities on large agendas.
+
+Uses the synthetic chain agendas of the compiled_agenda benchmark, and reports the time of one state probability
+update with each class, once every state has enough probability mass to take part in transitions.
+
+Run from the directory containing the puppeteer package:
+
+    python -m puppeteer.benchmarks.state_probabilities --states 10 100 1000 10000
+"""
+import argparse
+
+from puppeteer import (
+    AgendaState,
+    DefaultStateProbabilities,
+    Extractions,
+    MessageObservation,
+    VectorizedStateProbabilities
+)
+from puppeteer.benchmarks.common import synthetic_agenda, timeit
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--states", type=int, nargs="+", default=[10, 100, 1000, 10000],
+                        help="Numbers of agenda states.")
+    parser.add_argument("--triggers", type=int, default=10, help="Number of transition triggers.")
+    parser.add_argument("--budget", type=float, default=1.0, help="Approximate number of seconds per measurement.")
+    args = parser.parse_args()
+
+    print("%8s %14s %14s %10s" % ("states", "default ms", "vectorized ms", "speedup"))
+    for num_states in args.states:
+        times = []
+        for cls in [DefaultStateProbabilities, VectorizedStateProbabilities]:
+            agenda = synthetic_agenda(num_states, args.triggers, state_probabilities_cls=cls)
+            state = AgendaState(agenda)
+            state.update([], [MessageObservation("benchmark")], Extractions())
+            snapshot = state.state_probabilities.get_state()
+
+            def update() -> None:
+                state.state_probabilities.set_state(snapshot)
+                state.state_probabilities.update(state.transition_trigger_probabilities, [])
+
+            repeats = max(1, int(args.budget / max(timeit(update, 1), 1e-6)))
+            times.append(timeit(update, repeats))
+        print("%8d %14.3f %14.3f %10.1f" % (num_states, 1000 * times[0], 1000 * times[1], times[0] / times[1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""Benchmark suite: micro, meso and macro benchmarks, saved as JSON and compared against a baseline.
+
+The suite has three tiers:
+
+    micro: Single agenda-level operations on the shipped get_location agenda, with stub trigger detectors:
+           DefaultTriggerProbabilities.update(), DefaultStateProbabilities.update(), DefaultAgendaPolicy.is_done() and
+           DefaultAgendaPolicy.pick_actions().
+    meso:  Whole conversations through Puppeteer.react() over the shipped agendas, with deterministic stub trigger
+           detectors. Times are per turn.
+    macro: The real NLP path: Spacy sentence splitting and entity extraction, and, if --snips-path is given, whole
+           conversations with Snips trigger detectors trained on the data under that path. Benchmarks whose models or
+           data are not available are skipped.
+
+Each benchmark is calibrated to run for about --budget seconds, split into --rounds rounds. The median time per
+operation over the rounds is the main result, reported with the minimum and the spread of the rounds. Results are
+written to --output as JSON. With --baseline, each result is compared to the one in an earlier output file, and the
+run fails if any benchmark is slower than the baseline by more than --threshold.
+
+Run from the directory containing the puppeteer package:
+
+    python -m puppeteer.benchmarks.suite --tiers micro meso --output results.json
+    python -m puppeteer.benchmarks.suite --tiers micro meso --output new.json --baseline results.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+from puppeteer import (
+    Agenda,
+    AgendaState,
+    Extractions,
+    Puppeteer,
+    SpacyEngine,
+    TriggerDetectorLoader
+)
+from puppeteer.benchmarks.common import (
+    MESSAGES,
+    StubTriggerDetector,
+    agenda_files,
+    agenda_trigger_names,
+    load_agendas,
+    message
+)
+from puppeteer.logging import Logger
+
+TIERS = ("micro", "meso", "macro")
+
+# A benchmark setup function returns a function running one or more operations, and the number of operations run by
+# each call. It raises an exception if the benchmark cannot run, e.g., when a model is missing.
+Setup = Callable[[argparse.Namespace], Tuple[Callable[[], object], int]]
+
+
+def micro_agenda_state() -> Tuple[Agenda, AgendaState]:
+    """Returns the shipped get_location agenda, and its state updated with a first message."""
+    np.random.seed(0)
+    agenda = [a for a in load_agendas() if a.name == "get_location"][0]
+    agenda_state = AgendaState(agenda)
+    agenda_state.update([], message(0), Extractions())
+    return agenda, agenda_state
+
+
+def micro_trigger_probabilities(args: argparse.Namespace) -> Tuple[Callable[[], object], int]:
+    (agenda, _) = micro_agenda_state()
+    trigger_probabilities = agenda.trigger_probabilities_cls(agenda, kickoff=False)
+    observations = [message(t) for t in range(len(MESSAGES))]
+    extractions = Extractions()
+
+    def run() -> None:
+        for o in observations:
+            trigger_probabilities.update(o, extractions)
+    return run, len(observations)
+
+
+def micro_state_probabilities(args: argparse.Namespace) -> Tuple[Callable[[], object], int]:
+    (agenda, agenda_state) = micro_agenda_state()
+    trigger_probabilities = agenda_state.transition_trigger_probabilities
+
+    def run() -> None:
+        state_probabilities = agenda.state_probabilities_cls(agenda)
+        for _ in range(10):
+            state_probabilities.update(trigger_probabilities, [])
+    return run, 10
+
+
+def micro_is_done(args: argparse.Namespace) -> Tuple[Callable[[], object], int]:
+    (agenda, agenda_state) = micro_agenda_state()
+    return (lambda: agenda.policy.is_done(agenda_state)), 1
+
+
+def micro_pick_actions(args: argparse.Namespace) -> Tuple[Callable[[], object], int]:
+    (agenda, agenda_state) = micro_agenda_state()
+    return (lambda: agenda.policy.pick_actions(agenda_state, [], 0)), 1
+
+
+def conversations(agendas: List[Agenda], args: argparse.Namespace, **kwargs: Any) -> Tuple[Callable[[], object], int]:
+    """Returns a function running a conversation of --turns turns through Puppeteer.react()."""
+    def run() -> None:
+        np.random.seed(0)
+        puppeteer = Puppeteer(agendas, log_level=Logger.DISABLED, **kwargs)
+        extractions = Extractions()
+        for t in range(args.turns):
+            (_, new_extractions) = puppeteer.react(message(t), extractions)
+            extractions.update(new_extractions)
+    return run, args.turns
+
+
+def meso_react(args: argparse.Namespace) -> Tuple[Callable[[], object], int]:
+    return conversations(load_agendas(), args)
+
+
+def meso_react_x4(args: argparse.Namespace) -> Tuple[Callable[[], object], int]:
+    return conversations(load_agendas(copies=4), args)
+
+
+def meso_react_x4_indexed(args: argparse.Namespace) -> Tuple[Callable[[], object], int]:
+    return conversations(load_agendas(copies=4), args, update_inactive_agendas=False, kickoff_evaluation="indexed")
+
+
+def meso_react_debug_log(args: argparse.Namespace) -> Tuple[Callable[[], object], int]:
+    agendas = load_agendas()
+
+    def run() -> None:
+        np.random.seed(0)
+        puppeteer = Puppeteer(agendas, log_level=Logger.DEBUG)
+        extractions = Extractions()
+        for t in range(args.turns):
+            (_, new_extractions) = puppeteer.react(message(t), extractions)
+            extractions.update(new_extractions)
+            assert puppeteer.log is not None
+    return run, args.turns
+
+
+def macro_spacy(args: argparse.Namespace) -> Tuple[Callable[[], object], int]:
+    nlp = SpacyEngine.load(args.spacy_model)
+
+    def run() -> None:
+        for text in MESSAGES:
+            nlp.get_sentences(text)
+            nlp.nent_extraction(text)
+    return run, len(MESSAGES)
+
+
+def macro_snips_react(args: argparse.Namespace) -> Tuple[Callable[[], object], int]:
+    if args.snips_path is None:
+        raise ValueError("No --snips-path given")
+    if not os.path.isdir(args.snips_path):
+        raise ValueError("No Snips training data at %s" % args.snips_path)
+    SpacyEngine.load(args.spacy_model)
+    intent_dirs = set()
+    for (_, dirs, _) in os.walk(args.snips_path):
+        intent_dirs.update(dirs)
+    loader = TriggerDetectorLoader(default_snips_path=args.snips_path)
+    for name in sorted(agenda_trigger_names(agenda_files())):
+        if name not in intent_dirs:
+            # Triggers without training data get stub detectors.
+            loader.register_detector(StubTriggerDetector([name]))
+    return conversations([Agenda.load(filename, loader) for filename in agenda_files()], args)
+
+
+BENCHMARKS: List[Tuple[str, str, Setup]] = [
+    ("micro", "trigger_probabilities_update", micro_trigger_probabilities),
+    ("micro", "state_probabilities_update", micro_state_probabilities),
+    ("micro", "policy_is_done", micro_is_done),
+    ("micro", "policy_pick_actions", micro_pick_actions),
+    ("meso", "react", meso_react),
+    ("meso", "react_x4", meso_react_x4),
+    ("meso", "react_x4_indexed", meso_react_x4_indexed),
+    ("meso", "react_debug_log", meso_react_debug_log),
+    ("macro", "spacy_sentences_entities", macro_spacy),
+    ("macro", "snips_react", macro_snips_react),
+]
+
+
+def measure(function: Callable[[], object], operations: int, budget: float, rounds: int) -> Dict[str, Any]:
+    """Times a benchmark function.
+
+    The function is first called repeatedly for a tenth of the budget, to warm up and to estimate the time of a call.
+    The number of calls per round is then calibrated so that all rounds together take about the given budget.
+
+    Args:
+        function: The benchmark function.
+        operations: The number of operations run by each call.
+        budget: The approximate number of seconds to spend.
+        rounds: The number of rounds.
+
+    Returns:
+        The median, minimum and maximum time per operation over the rounds, in seconds, and the number of rounds and
+        operations per round.
+    """
+    warmup_calls = 0
+    start = time.perf_counter()
+    while True:
+        function()
+        warmup_calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= budget / 10:
+            break
+    calls = max(1, int(budget / rounds / (elapsed / warmup_calls)))
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        times.append((time.perf_counter() - start) / (calls * operations))
+    return {
+        "median": float(np.median(times)),
+        "min": float(np.min(times)),
+        "max": float(np.max(times)),
+        "rounds": rounds,
+        "operations_per_round": calls * operations,
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            threshold: float) -> List[Tuple[str, float, float, float, bool]]:
+    """Compares results to a baseline.
+
+    Args:
+        results: The results of the current run, by benchmark name.
+        baseline: The results of the baseline run, by benchmark name.
+        threshold: The relative slowdown above which a benchmark is a regression, e.g., 0.1 for 10%.
+
+    Returns:
+        For each benchmark with results in both runs, the name, the baseline and current median times, the ratio of
+        the current time to the baseline time, and whether the benchmark regressed.
+    """
+    comparisons = []
+    for (name, result) in results.items():
+        old = baseline.get(name)
+        if old is None or "median" not in old or "median" not in result:
+            continue
+        ratio = result["median"] / old["median"]
+        comparisons.append((name, old["median"], result["median"], ratio, ratio > 1.0 + threshold))
+    return comparisons
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tiers", nargs="+", choices=TIERS, default=list(TIERS), help="Tiers to run.")
+    parser.add_argument("--only", nargs="+", help="Names of benchmarks to run, e.g., micro.policy_is_done.")
+    parser.add_argument("--budget", type=float, default=2.0, help="Approximate number of seconds per benchmark.")
+    parser.add_argument("--rounds", type=int, default=7, help="Number of rounds per benchmark.")
+    parser.add_argument("--turns", type=int, default=10, help="Number of turns per conversation.")
+    parser.add_argument("--spacy-model", default="en_core_web_lg", help="Spacy model for the macro tier.")
+    parser.add_argument("--snips-path", help="Root path of Snips training data for the macro tier.")
+    parser.add_argument("--output", help="JSON file to write the results to.")
+    parser.add_argument("--baseline", help="JSON file with baseline results to compare to.")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative slowdown from the baseline counted as a regression.")
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, Any]] = {}
+    print("%-40s %12s %12s %12s" % ("benchmark", "median us", "min us", "max us"))
+    for (tier, name, setup) in BENCHMARKS:
+        full_name = "%s.%s" % (tier, name)
+        if tier not in args.tiers or (args.only and full_name not in args.only):
+            continue
+        try:
+            (function, operations) = setup(args)
+        except Exception as e:
+            results[full_name] = {"skipped": "%s: %s" % (type(e).__name__, e)}
+            print("%-40s skipped (%s)" % (full_name, results[full_name]["skipped"]))
+            continue
+        result = measure(function, operations, args.budget, args.rounds)
+        results[full_name] = result
+        print("%-40s %12.2f %12.2f %12.2f" % (full_name, 1e6 * result["median"], 1e6 * result["min"],
+                                              1e6 * result["max"]))
+
+    if args.output:
+        metadata = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "arguments": {k: v for (k, v) in vars(args).items() if k not in ("output", "baseline")},
+        }
+        with open(args.output, "w") as file:
+            json.dump({"metadata": metadata, "results": results}, file, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)["results"]
+        comparisons = compare(results, baseline, args.threshold)
+        print()
+        print("%-40s %12s %12s %8s" % ("benchmark", "baseline us", "current us", "change"))
+        for (name, old, new, ratio, regressed) in comparisons:
+            print("%-40s %12.2f %12.2f %+7.1f%%%s" % (name, 1e6 * old, 1e6 * new, 100 * (ratio - 1),
+                                                      "  REGRESSION" if regressed else ""))
+        if any(regressed for (_, _, _, _, regressed) in comparisons):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
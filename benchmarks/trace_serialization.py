@@ -0,0 +1,71 @@
+"""Throughput benchmark: rendering and serializing turn traces.
+
+Records the traces of conversations over the shipped agendas with stub trigger detectors, at the DEBUG log level,
+and reports the time per trace of rendering them to text, and of writing them as JSON Lines and in the packed binary
+format, as well as the size per trace of each format. The traces read back from both formats are checked to render
+to the same text as the recorded ones.
+
+Run from the directory containing the puppeteer package:
+
+    python -m puppeteer.benchmarks.trace_serialization --conversations 100
+"""
+import argparse
+import io
+
+import numpy as np
+
+from puppeteer import Extractions, Puppeteer, dump_binary, dump_jsonl, load_binary, load_jsonl
+from puppeteer.benchmarks.common import load_agendas, message, timeit
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=100, help="Number of conversations.")
+    parser.add_argument("--turns", type=int, default=10, help="Number of turns per conversation.")
+    args = parser.parse_args()
+
+    agendas = load_agendas()
+    np.random.seed(0)
+    traces = []
+    for c in range(args.conversations):
+        puppeteer = Puppeteer(agendas)
+        extractions = Extractions()
+        for t in range(args.turns):
+            (_, new_extractions) = puppeteer.react(message(t, c), extractions)
+            extractions.update(new_extractions)
+            traces.append(puppeteer.trace.copy())
+
+    rendered = [trace.render() for trace in traces]
+    text = io.StringIO()
+    binary = io.BytesIO()
+
+    def write_text() -> None:
+        text.seek(0)
+        text.truncate()
+        for trace in traces:
+            dump_jsonl(trace, text)
+
+    def write_binary() -> None:
+        binary.seek(0)
+        binary.truncate()
+        for trace in traces:
+            dump_binary(trace, binary)
+
+    render_time = timeit(lambda: [trace.render() for trace in traces], 3) / len(traces)
+    jsonl_time = timeit(write_text, 3) / len(traces)
+    binary_time = timeit(write_binary, 3) / len(traces)
+    text.seek(0)
+    binary.seek(0)
+    assert [trace.render() for trace in load_jsonl(text)] == rendered
+    assert [trace.render() for trace in load_binary(binary)] == rendered
+
+    n = len(traces)
+    print("%d traces, %.1f events per trace" % (n, sum(len(trace) for trace in traces) / n))
+    print("%-10s %14s %14s" % ("format", "us/trace", "bytes/trace"))
+    print("%-10s %14.1f %14.0f" % ("text", 1e6 * render_time, sum(len(r.encode("utf-8")) for r in rendered) / n))
+    print("%-10s %14.1f %14.0f" % ("jsonl", 1e6 * jsonl_time, len(text.getvalue().encode("utf-8")) / n))
+    print("%-10s %14.1f %14.0f" % ("binary", 1e6 * binary_time, len(binary.getvalue()) / n))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Latency benchmark: react() latency with and without a TraceSink.
+
+Runs conversations over the shipped agendas with stub trigger detectors in a PuppeteerPool, without a trace sink, and
+with trace sinks sampling a fraction of the conversations. Reports the mean and 99th percentile of the react()
+latency, and the numbers of records written and dropped by the sink.
+
+Run from the directory containing the puppeteer package:
+
+    python -m puppeteer.benchmarks.trace_sink --conversations 1000 --sample-rates 0.01 1.0
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from puppeteer import Extractions, PuppeteerPool, TraceSink
+from puppeteer.benchmarks.common import load_agendas, message
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=1000, help="Number of conversations.")
+    parser.add_argument("--turns", type=int, default=10, help="Number of turns per conversation.")
+    parser.add_argument("--sample-rates", type=float, nargs="+", default=[0.01, 1.0], help="Sample rates.")
+    parser.add_argument("--format", choices=TraceSink.FILE_FORMATS, default="binary", help="Trace file format.")
+    parser.add_argument("--overflow", choices=TraceSink.OVERFLOW_POLICIES, default=TraceSink.DROP_NEWEST,
+                        help="Overflow policy.")
+    args = parser.parse_args()
+
+    agendas = load_agendas()
+    print("%12s %12s %12s %12s %12s" % ("sample rate", "mean ms", "p99 ms", "written", "dropped"))
+    for sample_rate in [None] + args.sample_rates:
+        with tempfile.TemporaryDirectory() as directory:
+            sink = None if sample_rate is None else TraceSink(directory, sample_rate=sample_rate,
+                                                              file_format=args.format, overflow=args.overflow)
+            pool = PuppeteerPool(agendas, trace_sink=sink)
+            np.random.seed(0)
+            latencies = []
+            for c in range(args.conversations):
+                conversation_id = "conversation-%d" % c
+                pool.create(conversation_id)
+                extractions = Extractions()
+                for t in range(args.turns):
+                    start = time.perf_counter()
+                    (_, new_extractions) = pool.react(conversation_id, message(t, c), extractions)
+                    latencies.append(time.perf_counter() - start)
+                    extractions.update(new_extractions)
+                pool.evict(conversation_id)
+            (mean, p99) = (1000 * np.mean(latencies), 1000 * np.percentile(latencies, 99))
+            if sink is None:
+                print("%12s %12.3f %12.3f %12s %12s" % ("none", mean, p99, "-", "-"))
+            else:
+                sink.close()
+                print("%12.2f %12.3f %12.3f %12d %12d" % (sample_rate, mean, p99, sink.written, sink.dropped))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Generates synthetic conversation transcripts as JSON Lines, for load tests and replay benchmarks.
+
+Conversations are random walks over the state graphs of the given agendas, by default the shipped agendas, generated
+by TranscriptGenerator. Utterances are sampled from the Snips training data under --snips-path, if given, and are the
+trigger names otherwise, which fire the stub trigger detectors of the other benchmarks. Turns are streamed to the
+output as they are generated, so any volume can be generated in constant memory. The generation rate is reported on
+standard error.
+
+Run from the directory containing the puppeteer package:
+
+    python -m puppeteer.benchmarks.transcripts --conversations 1000 --concurrency 50 --output transcripts.jsonl
+    python -m puppeteer.benchmarks.transcripts --turns 1000000 --snips-path training_data --noise 0.2 > big.jsonl
+"""
+import argparse
+import sys
+import time
+
+from puppeteer import TranscriptGenerator, UtteranceSampler, load_agenda_graphs, write_transcripts
+from puppeteer.benchmarks.common import agenda_files
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agendas", nargs="+", help="Agenda files to follow. Defaults to the shipped agendas.")
+    parser.add_argument("--snips-path", nargs="*", default=[], help="Root paths of Snips training data.")
+    parser.add_argument("--conversations", type=int, help="Number of conversations to generate.")
+    parser.add_argument("--turns", type=int, help="Number of turns to generate.")
+    parser.add_argument("--noise", type=float, default=0.1, help="Probability of a noise turn.")
+    parser.add_argument("--max-turns", type=int, default=20, help="Maximum number of turns per conversation.")
+    parser.add_argument("--concurrency", type=int, default=1, help="Number of interleaved conversations.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator.")
+    parser.add_argument("--output", help="File to write to. Defaults to standard output.")
+    args = parser.parse_args()
+    if args.conversations is None and args.turns is None:
+        parser.error("Need --conversations or --turns")
+
+    generator = TranscriptGenerator(load_agenda_graphs(args.agendas or agenda_files()),
+                                    UtteranceSampler(args.snips_path), noise_rate=args.noise,
+                                    max_turns=args.max_turns, concurrency=args.concurrency, seed=args.seed)
+    turns = generator.turns(conversations=args.conversations, turns=args.turns)
+    start = time.perf_counter()
+    if args.output is None:
+        count = write_transcripts(turns, sys.stdout)
+    else:
+        with open(args.output, "w") as file:
+            count = write_transcripts(turns, file)
+    elapsed = time.perf_counter() - start
+    print("%d turns in %.2f s (%.0f turns/s)" % (count, elapsed, count / max(elapsed, 1e-9)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Startup benchmark: loading the shipped agendas with and without background warm-up.
+
+Loads the shipped agendas twice, and serves a benchmark conversation:
+
+    blocking:  With a TriggerDetectorLoader, which loads all trigger detectors before Agenda.load_all() returns.
+    warmup:    With a WarmupTriggerDetectorLoader, which loads and warms up the detectors in the background, with
+               --threads threads. The agendas are usable right away, in degraded mode until the Warmup is ready.
+
+For each mode, the table shows the time to first listen, i.e., until the agendas are loaded and the first turn can be
+served, the time until all detectors are ready, and the latency of the first turn served once ready, against the
+steady-state latency of the following turns.
+
+By default, the triggers are detected by stub detectors, one per trigger, taking --load-seconds to load, and
+--first-call-seconds more on their first call, to mimic lazy initialization in NLP engines. With --snips-path, the
+triggers are detected by Snips trigger detectors, trained on the intents under that path, using the default Spacy
+model, as in production.
+
+Run from the directory containing the puppeteer package:
+
+    python -m puppeteer.benchmarks.warmup --load-seconds 0.05 --first-call-seconds 0.01 --threads 4
+    python -m puppeteer.benchmarks.warmup --snips-path training_data
+"""
+import argparse
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from puppeteer import (
+    Agenda,
+    Extractions,
+    Observation,
+    Puppeteer,
+    SnipsEngine,
+    SpacyEngine,
+    TriggerDetectorLoader,
+    Warmup,
+    WarmupTriggerDetectorLoader
+)
+from puppeteer.benchmarks.common import StubTriggerDetector, agenda_files, agenda_trigger_names, message
+
+
+class SlowStubTriggerDetector(StubTriggerDetector):
+    """StubTriggerDetector which is slow to load, and slower on its first call."""
+
+    def __init__(self, trigger_names: List[str], load_seconds: float, first_call_seconds: float) -> None:
+        super(SlowStubTriggerDetector, self).__init__(trigger_names)
+        self._load_seconds = load_seconds
+        self._first_call_seconds = first_call_seconds
+
+    def load(self) -> None:
+        time.sleep(self._load_seconds)
+
+    def trigger_probabilities(self, observations: List[Observation],
+                              old_extractions: Extractions) -> Tuple[Dict[str, float], float, Extractions]:
+        if self.calls == 0:
+            end = time.perf_counter() + self._first_call_seconds
+            while time.perf_counter() < end:
+                pass
+        return super(SlowStubTriggerDetector, self).trigger_probabilities(observations, old_extractions)
+
+
+def run(loader: TriggerDetectorLoader, ready: Callable[[], None], turns: int) -> List[float]:
+    """Loads the shipped agendas and serves a conversation.
+
+    Returns:
+        The time to first listen, the time until ready, the first turn latency and the steady-state latency, in
+        seconds.
+    """
+    start = time.perf_counter()
+    agendas = Agenda.load_all(agenda_files(), loader)
+    first_listen = time.perf_counter() - start
+    ready()
+    until_ready = time.perf_counter() - start
+    puppeteer = Puppeteer(agendas)
+    latencies = []
+    for turn in range(turns):
+        turn_start = time.perf_counter()
+        puppeteer.react(message(turn), Extractions())
+        latencies.append(time.perf_counter() - turn_start)
+    return [first_listen, until_ready, latencies[0], sum(latencies[1:]) / max(1, turns - 1)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--snips-path", help="Root path of Snips training data. Defaults to stub detectors.")
+    parser.add_argument("--load-seconds", type=float, default=0.05, help="Load time of each stub detector.")
+    parser.add_argument("--first-call-seconds", type=float, default=0.01,
+                        help="Extra time of the first call to each stub detector.")
+    parser.add_argument("--threads", type=int, default=4, help="Number of warm-up threads.")
+    parser.add_argument("--turns", type=int, default=20, help="Number of turns served.")
+    args = parser.parse_args()
+
+    def new_loader(warmup: Optional[Warmup]) -> TriggerDetectorLoader:
+        if warmup is None:
+            loader = TriggerDetectorLoader(default_snips_path=args.snips_path)
+        else:
+            loader = WarmupTriggerDetectorLoader(warmup, default_snips_path=args.snips_path)
+        if args.snips_path is None:
+            for name in sorted(agenda_trigger_names(agenda_files())):
+                loader.register_detector(SlowStubTriggerDetector([name], args.load_seconds, args.first_call_seconds))
+        return loader
+
+    print("%-10s %14s %14s %14s %14s" % ("mode", "first listen", "ready", "first turn", "steady state"))
+    results = run(new_loader(None), lambda: None, args.turns)
+    print("%-10s %12.1fms %12.1fms %12.1fms %12.1fms" % tuple(["blocking"] + [1000 * r for r in results]))
+    # Start the second run from scratch.
+    SnipsEngine._engines.clear()
+    SpacyEngine._engines.clear()
+    with Warmup(threads=args.threads) as warmup:
+        results = run(new_loader(warmup), warmup.wait, args.turns)
+        print("%-10s %12.1fms %12.1fms %12.1fms %12.1fms" % tuple(["warmup"] + [1000 * r for r in results]))
+        if warmup.errors():
+            for (trigger_names, error) in warmup.errors():
+                print("Failed to load detector for %s: %r" % (", ".join(trigger_names), error))
+
+
+if __name__ == "__main__":
+    main()
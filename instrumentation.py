@@ -0,0 +1,287 @@
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+PHASE_TURN = "turn"
+PHASE_UPDATE = "update"
+PHASE_ACT = "act"
+PHASE_DETECTOR = "detector"
+PHASE_SNIPS = "snips"
+PHASE_SPACY = "spacy"
+
+
+class Instrument:
+    """Receives notifications around the timed phases of a turn.
+
+    The timed phases are:
+
+        "turn":     A whole call to Puppeteer.react() or Puppeteer.react_async().
+        "update":   The update phase of a turn, where all agendas update their trigger and state probabilities.
+        "act":      The act phase of a turn, where the policy picks actions.
+        "detector": A call to the trigger_probabilities() method of a trigger detector. Results served from a
+                    TriggerDetectorCache are not timed. The name is given by detector_name().
+        "snips":    A call to SnipsEngine.detect(). The name is the intent names of the engine.
+        "spacy":    A call to a Spacy model, processing a single text or, through SpacyEngine.prefetch(), a batch of
+                    texts. The name is the name of the model.
+
+    The phases of the turn, update and act phases have an empty name. Phases may be nested, e.g., detectors run
+    during the update phase. An Instrument receives notifications from all threads.
+
+    Instruments are registered with add_instrument(). When no instrument is registered, timing costs next to nothing.
+    This base class does nothing, subclasses override enter() and/or exit().
+    """
+
+    def enter(self, phase: str, name: str) -> None:
+        """Called when a phase is entered.
+
+        Args:
+            phase: The phase.
+            name: The name of the timed object, e.g., a trigger detector.
+        """
+        pass
+
+    def exit(self, phase: str, name: str, seconds: float) -> None:
+        """Called when a phase is exited.
+
+        Args:
+            phase: The phase.
+            name: The name of the timed object, e.g., a trigger detector.
+            seconds: The time spent in the phase.
+        """
+        pass
+
+
+_instruments: Tuple[Instrument, ...] = ()
+
+
+def add_instrument(instrument: Instrument) -> None:
+    """Registers an instrument, to be notified around all timed phases, in all threads.
+
+    Args:
+        instrument: The instrument.
+    """
+    global _instruments
+    _instruments = _instruments + (instrument,)
+
+
+def remove_instrument(instrument: Instrument) -> None:
+    """Unregisters an instrument.
+
+    Args:
+        instrument: The instrument.
+    """
+    global _instruments
+    if instrument not in _instruments:
+        raise ValueError("Instrument is not registered")
+    _instruments = tuple(i for i in _instruments if i is not instrument)
+
+
+def instruments() -> List[Instrument]:
+    """Returns the registered instruments."""
+    return list(_instruments)
+
+
+TimingToken = Tuple[str, str, float]
+
+
+def begin_timing(phase: str, name: str = "") -> Optional[TimingToken]:
+    """Enters a timed phase.
+
+    Args:
+        phase: The phase.
+        name: The name of the timed object, e.g., a trigger detector.
+
+    Returns:
+        A token to be given to end_timing(), or None if no instrument is registered.
+    """
+    if not _instruments:
+        return None
+    for instrument in _instruments:
+        instrument.enter(phase, name)
+    return (phase, name, time.perf_counter())
+
+
+def begin_detector_timing(detector: object) -> Optional[TimingToken]:
+    """Enters the timed phase of a trigger detector call, named by detector_name().
+
+    Args:
+        detector: The trigger detector.
+
+    Returns:
+        A token to be given to end_timing(), or None if no instrument is registered.
+    """
+    if not _instruments:
+        return None
+    return begin_timing(PHASE_DETECTOR, detector_name(detector))
+
+
+def end_timing(token: Optional[TimingToken]) -> None:
+    """Exits a timed phase.
+
+    Args:
+        token: The token returned by begin_timing(). If None, nothing is done.
+    """
+    if token is None:
+        return
+    (phase, name, start) = token
+    seconds = time.perf_counter() - start
+    for instrument in _instruments:
+        instrument.exit(phase, name, seconds)
+
+
+def detector_name(detector: object) -> str:
+    """Returns the name of a trigger detector used for timing: its class name and trigger names."""
+    return "%s(%s)" % (type(detector).__name__, ",".join(getattr(detector, "trigger_names", [])))
+
+
+class Histogram:
+    """Histogram of positive values, with logarithmic buckets.
+
+    Values are counted in buckets whose bounds grow by a constant factor, so percentiles are estimated with a bounded
+    relative error: with the default 16 buckets per doubling, about 2%. Memory use is constant.
+    """
+
+    def __init__(self, min_value: float = 1e-7, max_value: float = 1e3, buckets_per_doubling: int = 16) -> None:
+        """Initializes a new, empty Histogram.
+
+        Args:
+            min_value: Values below this are counted in the first bucket.
+            max_value: Values above this are counted in the last bucket.
+            buckets_per_doubling: The number of buckets between a value and twice that value.
+        """
+        if not 0.0 < min_value < max_value:
+            raise ValueError("Need 0 < min_value < max_value, got %f and %f" % (min_value, max_value))
+        self._min_value = min_value
+        self._scale = buckets_per_doubling / math.log(2.0)
+        self._counts = [0] * (int(math.log(max_value / min_value) * self._scale) + 2)
+        self._count = 0
+        self._total = 0.0
+        self._min = math.inf
+        self._max = 0.0
+
+    @property
+    def count(self) -> int:
+        """Returns the number of values."""
+        return self._count
+
+    @property
+    def total(self) -> float:
+        """Returns the sum of the values."""
+        return self._total
+
+    @property
+    def mean(self) -> float:
+        """Returns the mean value, or 0 if there are no values."""
+        return self._total / self._count if self._count > 0 else 0.0
+
+    @property
+    def min(self) -> float:
+        """Returns the smallest value, or 0 if there are no values."""
+        return self._min if self._count > 0 else 0.0
+
+    @property
+    def max(self) -> float:
+        """Returns the largest value, or 0 if there are no values."""
+        return self._max
+
+    def add(self, value: float) -> None:
+        """Adds a value.
+
+        Args:
+            value: The value.
+        """
+        if value > self._min_value:
+            bucket = min(int(math.log(value / self._min_value) * self._scale) + 1, len(self._counts) - 1)
+        else:
+            bucket = 0
+        self._counts[bucket] += 1
+        self._count += 1
+        self._total += value
+        if value < self._min:
+            self._min = value
+        if value > self._max:
+            self._max = value
+
+    def percentile(self, q: float) -> float:
+        """Returns an estimate of a percentile of the values.
+
+        The estimate is the geometric midpoint of the bucket holding the percentile, clamped to the range of the
+        values.
+
+        Args:
+            q: The percentile, between 0 and 100.
+
+        Returns:
+            The estimated percentile, or 0 if there are no values.
+        """
+        if not 0.0 <= q <= 100.0:
+            raise ValueError("q must be between 0 and 100, got %f" % q)
+        if self._count == 0:
+            return 0.0
+        rank = max(1, math.ceil(q / 100.0 * self._count))
+        seen = 0
+        for (bucket, count) in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                break
+        if bucket == 0:
+            return self._min
+        value = self._min_value * math.exp((bucket - 0.5) / self._scale)
+        return min(max(value, self._min), self._max)
+
+
+class HistogramCollector(Instrument):
+    """Instrument keeping a histogram of the times of each phase and name.
+
+    Example:
+
+        collector = HistogramCollector()
+        add_instrument(collector)
+        ...
+        print(collector.report())
+    """
+
+    def __init__(self) -> None:
+        """Initializes a new HistogramCollector, with no histograms."""
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def exit(self, phase: str, name: str, seconds: float) -> None:
+        """Adds the time spent in a phase to its histogram. See documentation of the method in Instrument."""
+        with self._lock:
+            histogram = self._histograms.get((phase, name))
+            if histogram is None:
+                histogram = Histogram()
+                self._histograms[(phase, name)] = histogram
+            histogram.add(seconds)
+
+    def histogram(self, phase: str, name: str = "") -> Optional[Histogram]:
+        """Returns the histogram of a phase and name, or None if the phase has not been timed with the name.
+
+        Args:
+            phase: The phase.
+            name: The name of the timed object.
+        """
+        return self._histograms.get((phase, name))
+
+    def keys(self) -> List[Tuple[str, str]]:
+        """Returns the (phase, name) pairs with a histogram, sorted."""
+        with self._lock:
+            return sorted(self._histograms.keys())
+
+    def reset(self) -> None:
+        """Discards all histograms."""
+        with self._lock:
+            self._histograms = {}
+
+    def report(self) -> str:
+        """Returns a table of the count, mean, p50, p95, p99 and max times of each phase and name, in milliseconds."""
+        lines = ["%-10s %-40s %8s %10s %10s %10s %10s %10s" % ("phase", "name", "count", "mean ms", "p50 ms",
+                                                               "p95 ms", "p99 ms", "max ms")]
+        with self._lock:
+            for ((phase, name), h) in sorted(self._histograms.items()):
+                lines.append("%-10s %-40s %8d %10.3f %10.3f %10.3f %10.3f %10.3f" %
+                             (phase, name, h.count, 1000 * h.mean, 1000 * h.percentile(50),
+                              1000 * h.percentile(95), 1000 * h.percentile(99), 1000 * h.max))
+        return "\n".join(lines)
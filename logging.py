@@ -1,4 +1,8 @@
-from typing import List, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, List, Optional, Tuple
+
+from .trace import Trace
 
 
 class Logger:
@@ -9,6 +13,10 @@ class Logger:
     the begin() and end() methods, where begin() increases and end() decreases
     the indentation level.
 
+    Lines are recorded as events of a Trace, which is rendered to text by the log
+    property. Besides free-form lines, structured events such as trigger and
+    state probabilities are recorded through the event() method.
+
     Example (without any interleaved "real" code):
 
         logger = Logger()
@@ -16,7 +24,7 @@ class Logger:
         logger.add("Some more text...")
         logger.begin("Sub-task")
         logger.add("Some text concerning the sub-task...")
-        logger.add("Some more text concerning the sub-task...")
+        logger.add("Some more text concerning %s...", "the sub-task")
         logger.end()
         logger.add("Closing the application.")
         print(logger.log)
@@ -29,59 +37,178 @@ class Logger:
             Some text concerning the sub-task...
             Some more text concerning the sub-task...
         Closing the application.
+
+    Each line has a level, INFO by default, and lines below the level of the logger are dropped. The DEBUG level is
+    used for detailed information such as trigger and state probabilities, and the DISABLED level drops everything.
+    A section started by begin() with a dropped header is not indented.
+
+    Formatting is deferred: a line may be given as a %-style format string with arguments, and is only formatted when
+    the log property is read. The arguments must therefore not be modified after the call. Code building arguments
+    that are costly to compute should first check is_enabled_for(), so that a disabled logger costs close to nothing.
+
+    Each conversation has its own Logger. Code logging on behalf of a conversation, e.g., agenda states and policies,
+    gets it through current_logger(), which returns the logger activated in the current context:
+
+        with logger.activate():
+            ...
+            current_logger().add("Logged to logger.")
+
+    The current logger is held in a context variable, so it is local to each thread and to each asyncio task, and
+    conversations running concurrently do not mix their logs. Outside of any activated logger, current_logger()
+    returns a disabled logger, dropping everything.
     """
 
-    INDENT_SIZE = 4
-    _instance = None
+    DEBUG = 10
+    INFO = 20
+    DISABLED = 100
 
-    def __init__(self) -> None:
-        """Initializes a new empty Logger."""
-        self._lines: List[str] = []
-        self._indent_level = 0
-        self._stack: List[int] = []
+    def __init__(self, level: int = DEBUG) -> None:
+        """Initializes a new empty Logger.
 
-    def __new__(cls) -> "Logger":
-        """Creates a new Logger."""
-        if cls._instance is None:
-            cls._instance = super(Logger, cls).__new__(cls)
-        return cls._instance
+        Args:
+            level: The level of the logger.
+        """
+        self._trace = Trace()
+        self._stack: List[Optional[int]] = []
+        self._level = level
+
+    @property
+    def level(self) -> int:
+        """Returns the level of the logger. Lines below this level are dropped."""
+        return self._level
+
+    @level.setter
+    def level(self, level: int) -> None:
+        """Sets the level of the logger. The level should only be changed when the logger is cleared.
+
+        Args:
+            level: The new level, e.g., Logger.DEBUG, Logger.INFO or Logger.DISABLED.
+        """
+        self._level = level
+
+    def is_enabled_for(self, level: int) -> bool:
+        """Returns true if lines of the given level are kept by the logger.
+
+        Args:
+            level: The line level.
+        """
+        return level >= self._level
 
     @property
     def log(self) -> Optional[str]:
         """Returns the entire log string, containing all log lines."""
-        if self._lines:
-            return "\n".join(self._lines)
-        else:
-            return None
+        return self._trace.render()
 
-    def add(self, line: Optional[str]) -> None:
+    @property
+    def trace(self) -> Trace:
+        """Returns the trace of recorded events. The trace is reused, and overwritten once the logger is cleared."""
+        return self._trace
+
+    def add(self, line: Optional[str], *args: Any, level: int = INFO) -> None:
         """Add a log line.
         Args:
-            line: Line text to add to the log, or None to skip adding anything.
+            line: Line text to add to the log, or None to skip adding anything. If arguments are given, this is a
+                %-style format string, formatted with the arguments when the log is read.
+            args: Format arguments.
+            level: The line level.
+        """
+        if line is not None and level >= self._level:
+            self._trace.append(Trace.MESSAGE, level, (line, args))
+
+    def event(self, kind: int, data: Tuple[Any, ...], level: int = INFO) -> None:
+        """Add a structured event.
+
+        Args:
+            kind: The event kind, e.g., Trace.DETECTOR.
+            data: The event data. See documentation of class Trace. As for the arguments of add(), the data must not
+                be modified after the call.
+            level: The event level.
         """
-        if line is not None:
-            indent = " " * self._indent_level * self.INDENT_SIZE
-            self._lines.append(indent + line)
+        if level >= self._level:
+            self._trace.append(kind, level, data)
 
-    def begin(self, header: str) -> None:
+    def begin(self, header: str, *args: Any, level: int = INFO) -> None:
         """Increase indentation level, with header line.
 
         Args:
-            header: Header line preceding the indented section.
+            header: Header line preceding the indented section, possibly a format string as for add().
+            args: Format arguments.
+            level: The header level. If the header is dropped, the indentation level is left unchanged.
         """
-        self.add(header)
-        self._indent_level += 1
-        self._stack.append(len(self._lines))
+        if level >= self._level:
+            self._trace.append(Trace.BEGIN, level, (header, args))
+            self._stack.append(level)
+        else:
+            self._stack.append(None)
 
     def end(self) -> None:
         """Decrease indentation level."""
-        if self._stack.pop() == len(self._lines):
-            # Remove the header if there was nothing added.
-            self._lines.pop()
-        self._indent_level -= 1
+        level = self._stack.pop()
+        if level is not None:
+            if self._trace.last_kind() == Trace.BEGIN:
+                # Remove the header if there was nothing added.
+                self._trace.pop()
+            else:
+                self._trace.append(Trace.END, level, ())
 
     def clear(self) -> None:
         """Reset logger to initial empty state."""
-        self._lines = []
+        self._trace.clear()
         self._stack = []
-        self._indent_level = 0
+
+    @contextmanager
+    def activate(self) -> Iterator["Logger"]:
+        """Makes this logger the current logger, returned by current_logger(), until the end of the with block.
+
+        Activations may be nested. The previously current logger is restored at the end of the with block.
+        """
+        token = _current_logger.set(self)
+        try:
+            yield self
+        finally:
+            _current_logger.reset(token)
+
+
+class _DisabledLogger(Logger):
+    """Logger dropping everything, returned by current_logger() outside of any activated logger.
+
+    The disabled logger is shared by all threads, so it keeps no state at all.
+    """
+
+    def __init__(self) -> None:
+        super(_DisabledLogger, self).__init__(Logger.DISABLED)
+
+    @property
+    def level(self) -> int:
+        return Logger.DISABLED
+
+    @level.setter
+    def level(self, level: int) -> None:
+        raise ValueError("The level of the disabled logger cannot be changed")
+
+    @property
+    def log(self) -> Optional[str]:
+        return None
+
+    def add(self, line: Optional[str], *args: Any, level: int = Logger.INFO) -> None:
+        pass
+
+    def event(self, kind: int, data: Tuple[Any, ...], level: int = Logger.INFO) -> None:
+        pass
+
+    def begin(self, header: str, *args: Any, level: int = Logger.INFO) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+
+_current_logger: ContextVar[Logger] = ContextVar("puppeteer_logger", default=_DisabledLogger())
+
+
+def current_logger() -> Logger:
+    """Returns the current logger, activated by Logger.activate(), or a disabled logger if there is none."""
+    return _current_logger.get()
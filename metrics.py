@@ -0,0 +1,341 @@
+import math
+import threading
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+
+class _ShardHolder:
+    """Thread-local object whose lifetime marks the lifetime of a thread's shard of a Metric."""
+
+
+class Metric:
+    """Base class of named metrics, with optional labels.
+
+    Updates are made without locks. Each thread adds to its own shard of values, and the shards are only summed up
+    when the metric is read, e.g., when the metrics are exposed. An update therefore costs a few dictionary operations,
+    and concurrent updates from different threads never contend or lose increments. When a thread exits, its shard is
+    merged into a base shard, so that the number of shards does not grow with the number of threads that ever updated
+    the metric.
+    """
+
+    TYPE = ""
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()) -> None:
+        """Initializes a new metric, with no values.
+
+        Args:
+            name: The name of the metric.
+            help: A description of the metric.
+            label_names: The names of the labels of the metric.
+        """
+        self._name = name
+        self._help = help
+        self._label_names = tuple(label_names)
+        self._local = threading.local()
+        # The values of exited threads.
+        self._base_shard: Dict[LabelValues, float] = {}
+        # The shards of live threads.
+        self._shards: List[Dict[LabelValues, float]] = []
+        self._shards_lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        """Returns the name of the metric."""
+        return self._name
+
+    @property
+    def help(self) -> str:
+        """Returns the description of the metric."""
+        return self._help
+
+    @property
+    def label_names(self) -> Tuple[str, ...]:
+        """Returns the names of the labels of the metric."""
+        return self._label_names
+
+    def _add(self, label_values: LabelValues, amount: float) -> None:
+        """Adds an amount to the value for the given label values, in the shard of the calling thread."""
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            # The thread-local storage of the thread is discarded when the thread exits, and with it the holder.
+            holder = _ShardHolder()
+            weakref.finalize(holder, self._merge_shard, shard)
+            self._local.holder = holder
+            self._local.shard = shard
+            with self._shards_lock:
+                self._shards.append(shard)
+        value = shard.get(label_values)
+        if value is None:
+            if len(label_values) != len(self._label_names):
+                raise ValueError("Metric %s has labels %s, got values %s" %
+                                 (self._name, self._label_names, label_values))
+            value = 0
+        shard[label_values] = value + amount
+
+    def _merge_shard(self, shard: Dict[LabelValues, float]) -> None:
+        """Merges the shard of an exited thread into the base shard."""
+        with self._shards_lock:
+            for (label_values, value) in shard.items():
+                self._base_shard[label_values] = self._base_shard.get(label_values, 0) + value
+            self._shards = [s for s in self._shards if s is not shard]
+
+    def values(self) -> Dict[LabelValues, float]:
+        """Returns the current value for each combination of label values that has been updated."""
+        values: Dict[LabelValues, float] = {}
+        # The lock keeps shards from being merged while they are summed up, which would count them twice.
+        with self._shards_lock:
+            for shard in [self._base_shard] + self._shards:
+                for (label_values, value) in list(shard.items()):
+                    values[label_values] = values.get(label_values, 0) + value
+        return values
+
+    def value(self, *label_values: str) -> float:
+        """Returns the current value for the given label values.
+
+        Args:
+            label_values: The values of the labels, in the order of the label names.
+        """
+        return self.values().get(tuple(label_values), 0)
+
+
+class Counter(Metric):
+    """A metric counting events. Its values only go up.
+
+    Example:
+
+        kickoffs = metrics_registry().counter("kickoffs_total", "Agendas kicked off.", ["agenda"])
+        kickoffs.inc("rental")
+    """
+
+    TYPE = "counter"
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        """Increments the counter for the given label values.
+
+        Args:
+            label_values: The values of the labels, in the order of the label names.
+            amount: The non-negative amount to add.
+        """
+        if amount < 0:
+            raise ValueError("Counter %s can only increase, got %f" % (self._name, amount))
+        self._add(label_values, amount)
+
+
+class Gauge(Metric):
+    """A metric holding a value that goes up and down.
+
+    A gauge is either updated with inc() and dec(), or computed when read, from functions set by set_function().
+    """
+
+    TYPE = "gauge"
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()) -> None:
+        """Initializes a new gauge. See documentation of the method in Metric."""
+        super(Gauge, self).__init__(name, help, label_names)
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        """Increases the gauge for the given label values.
+
+        Args:
+            label_values: The values of the labels, in the order of the label names.
+            amount: The amount to add.
+        """
+        self._add(label_values, amount)
+
+    def dec(self, *label_values: str, amount: float = 1) -> None:
+        """Decreases the gauge for the given label values.
+
+        Args:
+            label_values: The values of the labels, in the order of the label names.
+            amount: The amount to subtract.
+        """
+        self._add(label_values, -amount)
+
+    def set_function(self, function: Callable[[], float], *label_values: str) -> None:
+        """Computes the value for the given label values by calling a function whenever the gauge is read.
+
+        Args:
+            function: The function returning the value.
+            label_values: The values of the labels, in the order of the label names.
+        """
+        if len(label_values) != len(self._label_names):
+            raise ValueError("Metric %s has labels %s, got values %s" % (self._name, self._label_names, label_values))
+        self._functions[tuple(label_values)] = function
+
+    def values(self) -> Dict[LabelValues, float]:
+        """Returns the current value for each combination of label values. See documentation of the method in Metric."""
+        values = super(Gauge, self).values()
+        for (label_values, function) in list(self._functions.items()):
+            values[label_values] = function()
+        return values
+
+
+class MetricsRegistry:
+    """A set of metrics, exposed together in the Prometheus text format.
+
+    The metrics of the puppeteer package itself are registered in the registry returned by metrics_registry().
+    """
+
+    def __init__(self) -> None:
+        """Initializes a new, empty MetricsRegistry."""
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str, label_names: Sequence[str] = ()) -> Counter:
+        """Returns the counter with the given name, registering a new one if needed.
+
+        Args:
+            name: The name of the counter. By convention, counter names end with "_total".
+            help: A description of the counter.
+            label_names: The names of the labels of the counter.
+        """
+        return self._register(Counter, name, help, label_names)
+
+    def gauge(self, name: str, help: str, label_names: Sequence[str] = ()) -> Gauge:
+        """Returns the gauge with the given name, registering a new one if needed.
+
+        Args:
+            name: The name of the gauge.
+            help: A description of the gauge.
+            label_names: The names of the labels of the gauge.
+        """
+        return self._register(Gauge, name, help, label_names)
+
+    def _register(self, cls, name: str, help: str, label_names: Sequence[str]):
+        """Returns the metric with the given name, registering a new metric of the given class if needed."""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, help, label_names)
+                self._metrics[name] = metric
+            elif type(metric) is not cls or metric.label_names != tuple(label_names):
+                raise ValueError("Metric %s is already registered as a %s with labels %s" %
+                                 (name, metric.TYPE, metric.label_names))
+            return metric
+
+    def metric(self, name: str) -> Optional[Metric]:
+        """Returns the metric with the given name, or None if there is none."""
+        return self._metrics.get(name)
+
+    @property
+    def metrics(self) -> List[Metric]:
+        """Returns all metrics, sorted by name."""
+        with self._lock:
+            return [self._metrics[name] for name in sorted(self._metrics)]
+
+    def render(self) -> str:
+        """Returns all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append("# HELP %s %s" % (metric.name, _escape(metric.help, label=False)))
+            lines.append("# TYPE %s %s" % (metric.name, metric.TYPE))
+            values = metric.values()
+            if not values and not metric.label_names:
+                values = {(): 0}
+            for (label_values, value) in sorted(values.items()):
+                if label_values:
+                    labels = ",".join('%s="%s"' % (name, _escape(str(v), label=True))
+                                      for (name, v) in zip(metric.label_names, label_values))
+                    lines.append("%s{%s} %s" % (metric.name, labels, _format_value(value)))
+                else:
+                    lines.append("%s %s" % (metric.name, _format_value(value)))
+        return "\n".join(lines) + "\n"
+
+
+def _escape(text: str, label: bool) -> str:
+    """Escapes a help text or label value for the Prometheus text format."""
+    text = text.replace("\\", "\\\\").replace("\n", "\\n")
+    return text.replace('"', '\\"') if label else text
+
+
+def _format_value(value: float) -> str:
+    """Formats a metric value for the Prometheus text format."""
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+_registry = MetricsRegistry()
+
+
+def metrics_registry() -> MetricsRegistry:
+    """Returns the registry holding the metrics of the puppeteer package."""
+    return _registry
+
+
+class MetricsServer:
+    """A small HTTP server exposing a metrics registry in the Prometheus text format, from a background thread.
+
+    The metrics are served at the /metrics path. By default, the server only listens on the loopback interface, and
+    binds to a free port, available through the port property.
+
+    Example:
+
+        with MetricsServer(port=9464) as server:
+            ...  # Run conversations. Metrics are served at http://127.0.0.1:9464/metrics.
+    """
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None, host: str = "127.0.0.1", port: int = 0) -> None:
+        """Initializes a new MetricsServer, and starts serving.
+
+        Args:
+            registry: The registry to expose. If not given, the registry of the puppeteer package is exposed.
+            host: The address to listen on.
+            port: The port to listen on. If 0, a free port is picked.
+        """
+        exposed = metrics_registry() if registry is None else registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exposed.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="puppeteer-metrics", daemon=True)
+        self._thread.start()
+        self._closed = False
+
+    @property
+    def port(self) -> int:
+        """Returns the port the server listens on."""
+        return self._server.server_address[1]
+
+    @property
+    def url(self) -> str:
+        """Returns the URL the metrics are served at."""
+        return "http://%s:%d/metrics" % (self._server.server_address[0], self.port)
+
+    def close(self) -> None:
+        """Stops serving and releases the port."""
+        if self._closed:
+            return
+        self._closed = True
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self) -> "MetricsServer":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
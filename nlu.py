@@ -1,17 +1,38 @@
+import hashlib
 import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
 from os import walk
 from os.path import basename, join
-from typing import Any, Dict, FrozenSet, Generator, List, Tuple
+from typing import Any, Dict, FrozenSet, Generator, Iterable, Iterator, List, Optional, Tuple
 
-from snips_nlu import SnipsNLUEngine  # type: ignore
+from snips_nlu import SnipsNLUEngine, __version__ as snips_version  # type: ignore
 from snips_nlu.default_configs import CONFIG_EN  # type: ignore
 import spacy
 
+from .instrumentation import PHASE_SNIPS, PHASE_SPACY, begin_timing, end_timing
+from .metrics import metrics_registry
+
+_snips_cache = metrics_registry().counter("puppeteer_snips_engine_cache_total",
+                                          "Snips engines looked up in the disk cache, by result.", ["result"])
+_snips_parses = metrics_registry().counter("puppeteer_snips_parses_total", "Sentences parsed by Snips engines.")
+_engines = metrics_registry().gauge("puppeteer_nlu_engines", "NLU engines loaded and cached, by kind.", ["kind"])
+_engines.set_function(lambda: len(SnipsEngine._engines), "snips")
+_engines.set_function(lambda: len(SpacyEngine._engines), "spacy")
+
+# Spacy documents prefetched for the current batch, by model and text chunk. See SpacyEngine.prefetched().
+_prefetched_docs: ContextVar[Dict[str, Dict[str, Any]]] = ContextVar("puppeteer_prefetched_docs", default={})
+
 
 class SpacyEngine:
     """Wrapper around a Spacy model."""
 
     _engines: Dict[str, "SpacyEngine"] = dict()
+    _lock = threading.Lock()
 
     def __init__(self, model: str) -> None:
         """Initializes a new SpacyEngine using the given language model.
@@ -23,6 +44,7 @@ class SpacyEngine:
         Args:
             model: Name of the Spacy language model to use.
         """
+        self._model = model
         self._nlp = spacy.load(model)
 
     @classmethod
@@ -36,9 +58,81 @@ class SpacyEngine:
             An engine using the specified language model.
         """
         if model not in cls._engines:
-            cls._engines[model] = SpacyEngine(model)
+            # Models may be loaded from background threads, see Warmup. Load each model only once.
+            with cls._lock:
+                if model not in cls._engines:
+                    cls._engines[model] = SpacyEngine(model)
         return cls._engines[model]
 
+    @classmethod
+    def engines(cls) -> List["SpacyEngine"]:
+        """Returns all SpacyEngines loaded so far."""
+        return list(cls._engines.values())
+
+    @classmethod
+    @contextmanager
+    def prefetched(cls, texts: List[str], batch_size: int = 64) -> Iterator[None]:
+        """Context manager processing a number of texts in batches with all loaded engines, for reuse in the context.
+
+        Processing texts one by one, as done by get_sentences() and nent_extraction(), has a fixed overhead per call.
+        When many texts are known beforehand, e.g., the messages of many conversations handled in the same tick, this
+        method can be used to process them all through Spacy's batched pipeline first. Calls to get_sentences() and
+        nent_extraction() for the same texts, within the context, then reuse the results.
+
+        The results are only visible to the current thread, or asyncio task, so that concurrent batches do not see,
+        or discard, each other's results. Note that this excludes work handed off to other threads, e.g., through
+        run_in_executor().
+
+        Args:
+            texts: The texts to process.
+            batch_size: The number of texts in each batch processed by Spacy.
+        """
+        docs = dict(_prefetched_docs.get())
+        for engine in cls.engines():
+            docs[engine._model] = dict(docs.get(engine._model, {}), **engine.prefetch(texts, batch_size=batch_size))
+        reset_token = _prefetched_docs.set(docs)
+        try:
+            yield
+        finally:
+            _prefetched_docs.reset(reset_token)
+
+    def prefetch(self, texts: Iterable[str], batch_size: int = 64) -> Dict[str, Any]:
+        """Process a number of texts in batches.
+
+        See prefetched(), which makes the results available to get_sentences() and nent_extraction().
+
+        Args:
+            texts: The texts to process.
+            batch_size: The number of texts in each batch processed by Spacy.
+
+        Returns:
+            The processed Spacy documents, by text chunk.
+        """
+        chunks = list(dict.fromkeys(chunk for text in texts for chunk in self._generate_data_chunks(text)))
+        token = begin_timing(PHASE_SPACY, self._model)
+        try:
+            return dict(zip(chunks, self._nlp.pipe(chunks, batch_size=batch_size)))
+        finally:
+            end_timing(token)
+
+    def _doc(self, chunk: str) -> Any:
+        """Returns the processed Spacy document for a text chunk, using prefetched results if available.
+
+        Args:
+            chunk: The text chunk.
+
+        Returns:
+            The Spacy document.
+        """
+        doc = _prefetched_docs.get().get(self._model, {}).get(chunk)
+        if doc is None:
+            token = begin_timing(PHASE_SPACY, self._model)
+            try:
+                doc = self._nlp(chunk)
+            finally:
+                end_timing(token)
+        return doc
+
     def get_sentences(self, text: str) -> List[str]:
         """Extract sentences from a text.
 
@@ -50,7 +144,7 @@ class SpacyEngine:
         """
         sens = []
         for chunk in self._generate_data_chunks(text):
-            sens.extend([s.text for s in self._nlp(chunk).sents])
+            sens.extend([s.text for s in self._doc(chunk).sents])
         return sens
 
     def nent_extraction(self, text: str) -> Dict[str, List[str]]:
@@ -93,7 +187,7 @@ class SpacyEngine:
 
         # Spacy can choke on large data, so chunk if we have to.
         for chunk in self._generate_data_chunks(text):
-            doc = self._nlp(chunk)
+            doc = self._doc(chunk)
             for ent in doc.ents:
                 if ent.label_ in map_spacy_to_ours:
                     our_list = map_spacy_to_ours[ent.label_]
@@ -141,9 +235,18 @@ class SpacyEngine:
 
 
 class SnipsEngine:
-    """Wrapper around a Snips engine."""
+    """Wrapper around a Snips engine.
+
+    Trained engines are kept in memory, by the paths of their training data, and, if a cache directory is set with
+    set_cache_directory(), on disk. The disk cache is content-addressed: an engine is stored under a hash of its
+    training dataset, i.e., the intent names and example sentences read from the training files, together with the
+    Snips configuration and version. Any process loading an engine from the same training data then reads the trained
+    engine from disk instead of training it again, and an engine is only retrained when its training data, or Snips
+    itself, has changed. Stale cache files are never removed automatically.
+    """
 
     _engines: Dict[FrozenSet[str], "SnipsEngine"] = dict()
+    _cache_directory: Optional[str] = None
 
     def __init__(self, engine: SnipsNLUEngine, intent_names: List[str], nlp: SpacyEngine) -> None:
         """Initialize a new SnipsEngine.
@@ -160,13 +263,33 @@ class SnipsEngine:
         self._engine = engine
         self._intent_names = intent_names
         self._nlp = nlp
+        self._timing_name = ",".join(intent_names)
+
+    @classmethod
+    def set_cache_directory(cls, directory: Optional[str]) -> None:
+        """Sets the directory where trained engines are cached on disk, creating it if needed.
+
+        Args:
+            directory: The cache directory, or None to only keep trained engines in memory, which is the default.
+        """
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        cls._cache_directory = directory
+
+    @classmethod
+    def cache_directory(cls) -> Optional[str]:
+        """Returns the directory where trained engines are cached on disk, or None if there is none."""
+        return cls._cache_directory
 
     @classmethod
     def load(cls, path_list: List[str], nlp: SpacyEngine) -> "SnipsEngine":
         """Load a SnpisEngine trained on data stored at the given path.
 
         Refer to the documentation of class SnipsTriggerDetector for details
-        of how to organize the training data.
+        of how to organize the training data. An engine already loaded for
+        the same paths is returned as is. Otherwise, the engine is read from
+        the cache directory, if the training data is unchanged since it was
+        cached, or trained.
 
         Args:
             path_list: List of root paths where training data is located.
@@ -177,31 +300,71 @@ class SnipsEngine:
         """
         paths = frozenset(path_list)
         if paths not in cls._engines:
-            filenames = []
-            for path in paths:
-                for wpath, _, files in walk(path):
-                    for filename in files:
-                        fullpath = join(wpath, filename)
-                        filenames.append(fullpath)
             # The intent name is the name of the leaf folder
             intent_names = [basename(p) for p in paths]
-            cls._engines[paths] = cls.train(filenames, intent_names, nlp)
+            cls._engines[paths] = cls.train(cls._training_files(paths), intent_names, nlp)
         return cls._engines[paths]
 
     @classmethod
-    def train(cls, filenames: List[str], intent_names: List[str], nlp: SpacyEngine) -> "SnipsEngine":
-        """Create and train a SnipsEngine on given data.
+    def load_many(cls, path_lists: List[List[str]], nlp: SpacyEngine, workers: int = 1) -> List["SnipsEngine"]:
+        """Load a number of SnipsEngines, training them in parallel.
 
-        Refer to the documentation of class SnipsTriggerDetector for details
-        of how to organize the training data.
+        Each engine is loaded as by load(). Engines that are neither loaded
+        nor in the disk cache are trained in a pool of worker processes, and
+        the trained engines are sent back to this process, written to the
+        disk cache, if any, and kept in memory, as by load().
+
+        Args:
+            path_lists: For each engine, the list of root paths where its training data is located.
+            nlp: A SpacyEngine used internally to split text into sentences.
+            workers: The number of worker processes. If 1, the engines are trained in this process.
+
+        Returns:
+            For each list of paths, in given order, an engine trained on the data at the paths.
+        """
+        if workers < 1:
+            raise ValueError("workers must be at least 1, got %d" % workers)
+        # Datasets of the engines to train, by paths.
+        datasets: Dict[FrozenSet[str], Dict[str, Any]] = {}
+        for path_list in path_lists:
+            paths = frozenset(path_list)
+            if paths in cls._engines or paths in datasets:
+                continue
+            dataset = cls.dataset(cls._training_files(paths))
+            engine = cls._read_cache_file(cls._cache_path(dataset))
+            if engine is None:
+                datasets[paths] = dataset
+            else:
+                cls._engines[paths] = cls(engine, [basename(p) for p in paths], nlp)
+        if workers == 1 or len(datasets) <= 1:
+            for (paths, dataset) in datasets.items():
+                cls._add_trained(paths, dataset, _fit_engine(dataset), None, nlp)
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(datasets))) as executor:
+                for (paths, data) in zip(datasets, executor.map(_fit_engine_bytes, datasets.values())):
+                    cls._add_trained(paths, datasets[paths], SnipsNLUEngine.from_byte_array(data), data, nlp)
+        return [cls._engines[frozenset(path_list)] for path_list in path_lists]
+
+    @staticmethod
+    def _training_files(paths: Iterable[str]) -> List[str]:
+        """Returns the training files under the given root paths."""
+        filenames = []
+        for path in paths:
+            for wpath, _, files in walk(path):
+                for filename in files:
+                    fullpath = join(wpath, filename)
+                    filenames.append(fullpath)
+        return filenames
+
+    @staticmethod
+    def dataset(filenames: List[str]) -> Dict[str, Any]:
+        """Returns the Snips training dataset for the given training files.
 
         Args:
             filenames: List of paths to files to use as training data.
-            intent_names: The intent names the created engine detects.
-            nlp: A SpacyEngine used internally by the created engine to split text into sentences.
 
         Returns:
-            An engine trained on the given data.
+            The dataset, in the JSON format of Snips.
         """
         json_dict: Dict[str, Any] = {"intents": {}}
         for filename in filenames:
@@ -218,11 +381,99 @@ class SnipsEngine:
                     json_dict["intents"][skillname]["utterances"].append(udic)
         json_dict["entities"] = {}
         json_dict["language"] = "en"
+        return json.loads(json.dumps(json_dict, sort_keys=False))
+
+    @staticmethod
+    def dataset_key(dataset: Dict[str, Any]) -> str:
+        """Returns the key of a trained engine in the disk cache: a hash of its dataset, configuration and version.
+
+        Args:
+            dataset: The training dataset, as returned by dataset().
+        """
+        h = hashlib.sha256()
+        for part in [dataset, CONFIG_EN, snips_version]:
+            h.update(json.dumps(part, sort_keys=True).encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    @classmethod
+    def train(cls, filenames: List[str], intent_names: List[str], nlp: SpacyEngine) -> "SnipsEngine":
+        """Create and train a SnipsEngine on given data.
+
+        Refer to the documentation of class SnipsTriggerDetector for details
+        of how to organize the training data. If a cache directory is set,
+        and holds an engine trained on the same data, that engine is read
+        instead of training a new one. A newly trained engine is written to
+        the cache directory.
+
+        Args:
+            filenames: List of paths to files to use as training data.
+            intent_names: The intent names the created engine detects.
+            nlp: A SpacyEngine used internally by the created engine to split text into sentences.
 
-        engine = SnipsNLUEngine(config=CONFIG_EN)
-        engine.fit(json.loads(json.dumps(json_dict, sort_keys=False)))
+        Returns:
+            An engine trained on the given data.
+        """
+        dataset = cls.dataset(filenames)
+        cache_path = cls._cache_path(dataset)
+        engine = cls._read_cache_file(cache_path)
+        if engine is None:
+            engine = _fit_engine(dataset)
+            if cache_path is not None:
+                _snips_cache.inc("miss")
+                cls._write_cache_file(cache_path, engine.to_byte_array())
         return cls(engine, intent_names, nlp)
 
+    @classmethod
+    def _add_trained(cls, paths: FrozenSet[str], dataset: Dict[str, Any], engine: SnipsNLUEngine,
+                     data: Optional[bytes], nlp: SpacyEngine) -> None:
+        """Keeps a newly trained engine in memory, and writes it to the disk cache, if any.
+
+        Args:
+            paths: The root paths of the training data.
+            dataset: The training dataset.
+            engine: The trained engine.
+            data: The engine in serialized form, if available.
+            nlp: A SpacyEngine used internally to split text into sentences.
+        """
+        cache_path = cls._cache_path(dataset)
+        if cache_path is not None:
+            _snips_cache.inc("miss")
+            cls._write_cache_file(cache_path, engine.to_byte_array() if data is None else data)
+        cls._engines[paths] = cls(engine, [basename(p) for p in paths], nlp)
+
+    @classmethod
+    def _cache_path(cls, dataset: Dict[str, Any]) -> Optional[str]:
+        """Returns the path of the cache file of an engine trained on a dataset, or None if there is no cache."""
+        directory = cls._cache_directory
+        return None if directory is None else join(directory, "%s.snips" % cls.dataset_key(dataset))
+
+    @staticmethod
+    def _read_cache_file(cache_path: Optional[str]) -> Optional[SnipsNLUEngine]:
+        """Returns the engine in a cache file, or None if the file does not exist or cannot be read."""
+        if cache_path is None or not os.path.isfile(cache_path):
+            return None
+        try:
+            with open(cache_path, "rb") as f:
+                engine = SnipsNLUEngine.from_byte_array(f.read())
+        except Exception:
+            # A corrupt or incompatible cache file is replaced when the engine is trained again.
+            return None
+        _snips_cache.inc("hit")
+        return engine
+
+    @staticmethod
+    def _write_cache_file(cache_path: str, data: bytes) -> None:
+        """Writes a cache file atomically, so that concurrent readers never see a partly written file."""
+        (fd, temp_path) = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, cache_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
     @property
     def intent_names(self) -> List[str]:
         """Returns the intent names that this engine detects."""
@@ -242,12 +493,29 @@ class SnipsEngine:
               viewed as a reasonable confidence measure.
             - The sentence in which the intent was detected.
         """
+        token = begin_timing(PHASE_SNIPS, self._timing_name)
         intents = []
-        sens = self._nlp.get_sentences(text)
-        for sen in sens:
-            results = self._engine.parse(sen)
-            intent = results["intent"]["intentName"]
-            p = results["intent"]["probability"]
-            if intent is not None and intent != 'null':
-                intents.append((intent, p, sen))
+        try:
+            sens = self._nlp.get_sentences(text)
+            _snips_parses.inc(amount=len(sens))
+            for sen in sens:
+                results = self._engine.parse(sen)
+                intent = results["intent"]["intentName"]
+                p = results["intent"]["probability"]
+                if intent is not None and intent != 'null':
+                    intents.append((intent, p, sen))
+        finally:
+            end_timing(token)
         return sorted(intents, key=lambda tup: tup[1], reverse=True)
+
+
+def _fit_engine(dataset: Dict[str, Any]) -> SnipsNLUEngine:
+    """Returns a new Snips engine trained on a dataset."""
+    engine = SnipsNLUEngine(config=CONFIG_EN)
+    engine.fit(dataset)
+    return engine
+
+
+def _fit_engine_bytes(dataset: Dict[str, Any]) -> bytes:
+    """Returns a new Snips engine trained on a dataset, in serialized form. Run in worker processes."""
+    return _fit_engine(dataset).to_byte_array()
@@ -0,0 +1,344 @@
+import asyncio
+import itertools
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from types import FrameType
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, TextIO, Tuple
+
+from .agenda import Agenda
+from .trigger_detector import TriggerDetector
+
+NO_AGENDA = "-"
+NO_DETECTOR = "-"
+
+# The profiled turns running in the current context, as the profilers and the ids of the turns, innermost last. A
+# context usually runs at most one, but turns of different profilers may be nested. See TurnProfiler.
+_profiled_turns: ContextVar[Tuple[Tuple["TurnProfiler", int], ...]] = ContextVar("puppeteer_profiled_turns",
+                                                                                  default=())
+
+# The switch intervals requested by the profiled turns in progress in the process, by profiler and turn id, and the
+# switch interval of the process before the first of them started. See _request_switch_interval().
+_switch_interval_lock = threading.Lock()
+_switch_interval_requests: Dict[Tuple["TurnProfiler", int], float] = {}
+_original_switch_interval: Optional[float] = None
+
+
+def _request_switch_interval(turn: Tuple["TurnProfiler", int], interval: float) -> None:
+    """Lowers the switch interval of the process to at most the given interval, while a profiled turn runs.
+
+    The switch interval is process-wide, and turns of different profilers may overlap. The original switch interval is
+    therefore recorded when the first profiled turn in the process starts, the lowest interval requested by any turn
+    in progress is used, and the original is only restored when the last turn ends, see _release_switch_interval().
+
+    Args:
+        turn: The profiler and the id of the turn.
+        interval: The requested switch interval.
+    """
+    global _original_switch_interval
+    with _switch_interval_lock:
+        if not _switch_interval_requests:
+            _original_switch_interval = sys.getswitchinterval()
+        _switch_interval_requests[turn] = interval
+        sys.setswitchinterval(min(_original_switch_interval, min(_switch_interval_requests.values())))
+
+
+def _release_switch_interval(turn: Tuple["TurnProfiler", int]) -> None:
+    """Withdraws the switch interval requested for a profiled turn by _request_switch_interval().
+
+    Args:
+        turn: The profiler and the id of the turn.
+    """
+    global _original_switch_interval
+    with _switch_interval_lock:
+        if _switch_interval_requests.pop(turn, None) is None:
+            return
+        if _switch_interval_requests:
+            sys.setswitchinterval(min(_original_switch_interval, min(_switch_interval_requests.values())))
+        else:
+            sys.setswitchinterval(_original_switch_interval)
+            _original_switch_interval = None
+
+
+class TurnProfiler:
+    """Sampling profiler for a fraction of the turns of Puppeteers.
+
+    A TurnProfiler is given to a Puppeteer or PuppeteerPool, and profiles one in every N turns. While a profiled turn
+    runs, a background thread samples the stack of the thread running the turn at a fixed interval. Turns that are
+    not profiled only pay for a counter increment, and no profiling cost at all is paid outside of profiled turns.
+
+    Each sample is attributed to the agenda and the trigger detector that were running, found from the sampled
+    stack: the agenda is the one whose AgendaState or AgendaPolicy method is innermost on the stack, and the detector
+    is the outermost TriggerDetector method on the stack. Samples taken outside of any agenda or detector are
+    attributed to "-". summary() gives the number of samples per agenda and detector class, and write_collapsed()
+    writes all samples as collapsed stacks, one "frame;frame;... count" line per distinct stack, as read by
+    flamegraph.pl, speedscope and similar tools. The agenda and detector are prepended to each stack as the frames
+    "agenda:<name>" and "detector:<class>", so that flame graphs are split by agenda and detector.
+
+    Samples are taken by a Python thread, which needs the GIL to sample. A thread holding the GIL only gives it up
+    every switch interval (see sys.setswitchinterval()), 5 ms by default, which is longer than most turns, so samples
+    would mostly be taken at the few points where the GIL is released. While profiled turns run, the switch interval
+    of the process is therefore lowered to a tenth of the sampling interval, and restored when no profiled turn of
+    any profiler is running. Turns shorter than the sampling interval often get no sample at all, but over many
+    profiled turns, the number of samples is proportional to the time spent.
+
+    A TurnProfiler may be shared by Puppeteers running on different threads, or as different asyncio tasks. Each
+    profiled turn is identified by a turn id, kept in a context variable, and a thread is only sampled while it runs
+    code of a profiled turn. In react(), that is the thread calling it, for the whole turn. In react_async(), turns
+    may overlap on the thread running the event loop, which also runs code outside of any turn while a turn awaits
+    its trigger detectors. There, the event loop thread is only sampled while it runs the synchronous part of the
+    turn, see sample_thread(), and the executor threads running trigger detectors are sampled while they run them,
+    see run_in_executor(). Trigger detectors overriding trigger_probabilities_async() with natively asynchronous
+    detection are not sampled.
+
+    A TurnProfiler should be closed, using close() or a with statement, to stop the sampling thread.
+    """
+
+    def __init__(self, every: int = 100, interval: float = 0.0005, max_depth: int = 64) -> None:
+        """Initializes a new TurnProfiler.
+
+        Args:
+            every: Profile one in every this many turns.
+            interval: The number of seconds between samples.
+            max_depth: The maximum number of frames kept in a sampled stack, counted from the innermost frame.
+        """
+        if every < 1:
+            raise ValueError("every must be at least 1, got %d" % every)
+        if interval <= 0.0:
+            raise ValueError("interval must be positive, got %f" % interval)
+        self._every = every
+        self._interval = interval
+        self._max_depth = max_depth
+        self._turn_counter = itertools.count()
+        self._turn_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # Ids of the profiled turns in progress.
+        self._turns: Set[int] = set()
+        # Ids of the threads running code of profiled turns, mapped to the ids of the turns.
+        self._active: Dict[int, int] = {}
+        self._stacks: Dict[Tuple[str, ...], int] = {}
+        self._profiled_turns = 0
+        self._samples = 0
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def every(self) -> int:
+        """Returns the fraction of turns profiled, as one in every this many turns."""
+        return self._every
+
+    @property
+    def profiled_turns(self) -> int:
+        """Returns the number of turns profiled so far."""
+        return self._profiled_turns
+
+    @property
+    def samples(self) -> int:
+        """Returns the number of stack samples taken so far."""
+        return self._samples
+
+    def start_turn(self, sample_thread: bool = True) -> bool:
+        """Called by a Puppeteer at the start of a turn. Decides whether to profile the turn, and starts sampling.
+
+        If the turn is profiled, it becomes the profiled turn of this profiler in the current context, until stop_turn()
+        is called.
+
+        Args:
+            sample_thread: Whether to sample the calling thread until stop_turn() is called. If False, threads are
+                only sampled within sample_thread() and run_in_executor().
+
+        Returns:
+            True if the turn is profiled. If so, stop_turn() must be called at the end of the turn, in the same context.
+        """
+        if next(self._turn_counter) % self._every != 0:
+            return False
+        with self._lock:
+            if self._closed:
+                return False
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="puppeteer-profiler", daemon=True)
+                self._thread.start()
+            turn_id = next(self._turn_ids)
+            self._turns.add(turn_id)
+            _request_switch_interval((self, turn_id), self._interval / 10)
+            if sample_thread:
+                self._active[threading.get_ident()] = turn_id
+                self._wakeup.notify()
+            self._profiled_turns += 1
+        _profiled_turns.set(_profiled_turns.get() + ((self, turn_id),))
+        return True
+
+    def stop_turn(self) -> None:
+        """Called by a Puppeteer at the end of a profiled turn. Stops sampling all threads running code of the turn."""
+        turn_id = self._turn_id()
+        if turn_id is None:
+            return
+        _profiled_turns.set(tuple(turn for turn in _profiled_turns.get() if turn != (self, turn_id)))
+        with self._lock:
+            self._turns.discard(turn_id)
+            self._active = {t: i for (t, i) in self._active.items() if i != turn_id}
+            _release_switch_interval((self, turn_id))
+
+    @contextmanager
+    def sample_thread(self) -> Iterator[None]:
+        """Context manager sampling the calling thread as part of the profiled turn of the current context, if any.
+
+        The context should not be suspended within, e.g., by an await, as other code run by the thread meanwhile would
+        be sampled as part of the turn.
+        """
+        turn_id = self._turn_id()
+        if turn_id is None:
+            yield
+            return
+        thread_id = threading.get_ident()
+        with self._lock:
+            outer_turn_id = self._active.get(thread_id)
+            if turn_id in self._turns:
+                self._active[thread_id] = turn_id
+                self._wakeup.notify()
+        try:
+            yield
+        finally:
+            with self._lock:
+                if outer_turn_id is None or outer_turn_id not in self._turns:
+                    self._active.pop(thread_id, None)
+                else:
+                    self._active[thread_id] = outer_turn_id
+
+    async def run_in_executor(self, function: Callable[..., Any], *args: Any) -> Any:
+        """Runs a function in the default executor of the running event loop, in a copy of the current context.
+
+        The executor thread is sampled as part of the profiled turn of the current context, if any, while it runs the
+        function.
+
+        Args:
+            function: The function.
+            *args: The arguments of the function.
+
+        Returns:
+            The result of the function.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, copy_context().run, self._run_sampled, function, *args)
+
+    def _run_sampled(self, function: Callable[..., Any], *args: Any) -> Any:
+        """Runs a function within sample_thread()."""
+        with self.sample_thread():
+            return function(*args)
+
+    def _turn_id(self) -> Optional[int]:
+        """Returns the id of the turn of the current context profiled by this profiler, or None."""
+        for (profiler, turn_id) in reversed(_profiled_turns.get()):
+            if profiler is self:
+                return turn_id
+        return None
+
+    def stacks(self) -> Dict[str, int]:
+        """Returns the number of samples of each distinct stack, in the collapsed stack format without counts."""
+        with self._lock:
+            return {";".join(stack): count for (stack, count) in self._stacks.items()}
+
+    def summary(self) -> List[Tuple[str, str, int]]:
+        """Returns the number of samples per agenda and detector class.
+
+        Returns:
+            A list of (agenda name, detector class name, number of samples) tuples, by decreasing number of samples.
+            Samples taken outside of any agenda or detector have the name "-".
+        """
+        counts: Dict[Tuple[str, str], int] = {}
+        with self._lock:
+            for (stack, count) in self._stacks.items():
+                key = (stack[0][len("agenda:"):], stack[1][len("detector:"):])
+                counts[key] = counts.get(key, 0) + count
+        return sorted(((agenda, detector, count) for ((agenda, detector), count) in counts.items()),
+                      key=lambda t: (-t[2], t[0], t[1]))
+
+    def report(self) -> str:
+        """Returns summary() as a table, with the share of the samples of each agenda and detector class."""
+        lines = ["%-30s %-40s %10s %8s" % ("agenda", "detector", "samples", "share")]
+        total = max(1, self._samples)
+        for (agenda, detector, count) in self.summary():
+            lines.append("%-30s %-40s %10d %7.1f%%" % (agenda, detector, count, 100.0 * count / total))
+        return "\n".join(lines)
+
+    def write_collapsed(self, file: TextIO) -> None:
+        """Writes the samples as collapsed stacks, one "frame;frame;... count" line per distinct stack.
+
+        Args:
+            file: The text file to write to.
+        """
+        for (stack, count) in sorted(self.stacks().items()):
+            file.write("%s %d\n" % (stack, count))
+
+    def reset(self) -> None:
+        """Discards all samples."""
+        with self._lock:
+            self._stacks = {}
+            self._samples = 0
+            self._profiled_turns = 0
+
+    def close(self) -> None:
+        """Stops the sampling thread. Turns started after the profiler is closed are not profiled."""
+        with self._lock:
+            self._closed = True
+            for turn_id in self._turns:
+                _release_switch_interval((self, turn_id))
+            self._turns = set()
+            self._active = {}
+            self._wakeup.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def __enter__(self) -> "TurnProfiler":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        """Samples the threads running profiled turns, until the profiler is closed."""
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                while not self._active and not self._closed:
+                    self._wakeup.wait()
+                if self._closed:
+                    return
+                active = dict(self._active)
+            frames = sys._current_frames()
+            for (thread_id, turn_id) in active.items():
+                frame = frames.get(thread_id)
+                if frame is not None and thread_id != own_id:
+                    stack = self._stack(frame)
+                    with self._lock:
+                        # Skip the sample if the thread stopped running code of the turn while the stack was walked.
+                        if self._active.get(thread_id) == turn_id:
+                            self._stacks[stack] = self._stacks.get(stack, 0) + 1
+                            self._samples += 1
+            del frames
+            with self._lock:
+                if not self._closed:
+                    self._wakeup.wait(self._interval)
+
+    def _stack(self, frame: Optional[FrameType]) -> Tuple[str, ...]:
+        """Returns a sampled stack, root first, with the agenda and detector frames prepended."""
+        agenda = None
+        detector = NO_DETECTOR
+        names: List[str] = []
+        while frame is not None:
+            code = frame.f_code
+            if len(names) < self._max_depth:
+                names.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+            owner = frame.f_locals.get("self") if code.co_argcount > 0 else None
+            if owner is not None:
+                if isinstance(owner, TriggerDetector):
+                    detector = type(owner).__name__
+                elif agenda is None and isinstance(getattr(owner, "_agenda", None), Agenda):
+                    agenda = owner._agenda.name.replace(";", ",")
+            frame = frame.f_back
+        names.reverse()
+        return ("agenda:%s" % (NO_AGENDA if agenda is None else agenda), "detector:%s" % detector) + tuple(names)
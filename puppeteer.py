@@ -1,13 +1,30 @@
 import abc
-from typing import List, Dict, Tuple, Type
+import asyncio
+from array import array
+from typing import Any, Callable, Collection, List, Dict, Optional, Set, Tuple, Type
 
 import matplotlib.pyplot as plt
 import numpy as np
 
 from .agenda import Action, Agenda, AgendaState
-from .logging import Logger
+from .logging import Logger, current_logger
+from .metrics import metrics_registry
 from .observation import Observation
+from .profiling import TurnProfiler
 from .extractions import Extractions
+from .instrumentation import (PHASE_ACT, PHASE_TURN, PHASE_UPDATE, begin_detector_timing, begin_timing,
+                              end_timing)
+from .trace import Trace
+from .trigger_detector import TriggerDetector, TriggerDetectorCache, TriggerDetectorResult
+
+_turns = metrics_registry().counter("puppeteer_policy_turns_total", "Turns handled by DefaultPuppeteerPolicy.")
+_turns_without_agenda = metrics_registry().counter("puppeteer_turns_without_agenda_total",
+                                                   "Turns ending with no current agenda.")
+_kickoffs = metrics_registry().counter("puppeteer_kickoffs_total", "Agendas kicked off.", ["agenda"])
+_agendas_stopped = metrics_registry().counter("puppeteer_agendas_stopped_total",
+                                              "Agendas stopped, by reason: 'done' when a terminal state is reached, "
+                                              "'no_progress' after two turns without progress.",
+                                              ["agenda", "reason"])
 
 
 class PuppeteerPolicy(abc.ABC):
@@ -34,13 +51,20 @@ class PuppeteerPolicy(abc.ABC):
         self._agendas = agendas
 
     @abc.abstractmethod
-    def act(self, agenda_states: Dict[str, AgendaState]) -> List[Action]:
+    def act(self, agenda_states: Dict[str, AgendaState],
+            kickoff_candidates: Optional[Callable[[], Collection[str]]] = None) -> List[Action]:
         """"Picks zero or more appropriate actions to take, given the current state of the conversation.
 
+        The kickoff_candidates argument is only given by a Puppeteer using a KickoffIndex. It is a function returning
+        the names of the agendas that may kick off in this turn, i.e., the agendas that had at least one of their
+        kickoff triggers detected. Other agendas can be assumed not to kick off. The function runs kickoff trigger
+        detection, so it should only be called if the policy needs to look for a new agenda to start, and at most once.
+
         Args:
             agenda_states: For each agenda (indexed by name), the AgendaState object holding the current belief about
                 the state of the agenda, based on the latest observations -- the observations that this method is
                 reacting to.
+            kickoff_candidates: Optional function returning the names of the agendas that may kick off.
 
         Returns:
             A list of Action objects representing actions to take, in given order.
@@ -51,6 +75,38 @@ class PuppeteerPolicy(abc.ABC):
     def plot_state(self, fig: plt.Figure, agenda_states: Dict[str, AgendaState]) -> None:
         raise NotImplementedError()
 
+    def active_agendas(self) -> Optional[List[Agenda]]:
+        """Returns the agendas whose transition state needs to be updated in the coming turn.
+
+        This is used by a Puppeteer created with update_inactive_agendas=False, to skip transition trigger detection
+        and state probability updates for agendas that the policy will not use in the coming turn. The default
+        implementation returns None, meaning that all agendas need updating.
+
+        Returns:
+            The list of agendas needing transition updates, or None for all agendas.
+        """
+        return None
+
+    def get_state(self) -> Any:
+        """Returns a compact snapshot of the conversation-specific state held by the policy.
+
+        The snapshot must not be modified by later calls to act(). It is used, together with set_state(), to keep
+        conversation state outside of the policy, e.g., by PuppeteerPool. Policies that do not support this do not
+        need to override this method.
+
+        Returns:
+            The state snapshot.
+        """
+        raise NotImplementedError()
+
+    def set_state(self, state: Any) -> None:
+        """Restores the conversation-specific state of the policy from a snapshot returned by get_state().
+
+        Args:
+            state: The state snapshot.
+        """
+        raise NotImplementedError()
+
 
 class DefaultPuppeteerPolicy(PuppeteerPolicy):
     """Handles inter-agenda decisions about behavior.
@@ -65,14 +121,16 @@ class DefaultPuppeteerPolicy(PuppeteerPolicy):
             agendas: The agendas used by the policy.
         """
         super(DefaultPuppeteerPolicy, self).__init__(agendas)
+        self._agendas_by_name = {a.name: a for a in agendas}
+        self._agenda_indices = {a.name: i for (i, a) in enumerate(agendas)}
         # State
         self._current_agenda = None
         self._turns_without_progress = {a.name: 0 for a in agendas}
         self._times_made_current = {a.name: 0 for a in agendas}
         self._action_history: Dict[str, List[Action]] = {a.name: [] for a in agendas}
-        self._log = Logger()
 
-    def act(self, agenda_states: Dict[str, AgendaState]) -> List[Action]:
+    def act(self, agenda_states: Dict[str, AgendaState],
+            kickoff_candidates: Optional[Callable[[], Collection[str]]] = None) -> List[Action]:
         """"Picks zero or more appropriate actions to take, given the current state of the conversation.
 
         See documentation of this method in PuppeteerPolicy.
@@ -81,23 +139,22 @@ class DefaultPuppeteerPolicy(PuppeteerPolicy):
             agenda_states: For each agenda (indexed by name), the AgendaState object holding the current belief about
                 the state of the agenda, based on the latest observations -- the observations that this method is
                 reacting to.
+            kickoff_candidates: Optional function returning the names of the agendas that may kick off.
 
         Returns:
             A list of Action objects representing actions to take, in given order.
         """
+        log = current_logger()
+        _turns.inc()
         agenda = self._current_agenda
         last_agenda = None
         actions: List[Action] = []
 
         if agenda is not None:
-            self._log.begin(f"Current agenda is {agenda.name}.")
+            log.begin("Current agenda is %s.", agenda.name)
             agenda_state = agenda_states[agenda.name]
 
-            self._log.begin(f"Puppeteer policy state for {agenda.name}:")
-            self._log.add(f"Turns without progress: {self._turns_without_progress[agenda.name]}")
-            self._log.add(f"Times used: {self._times_made_current[agenda.name]}")
-            self._log.add(f"Action history: {[a.name for a in self._action_history[agenda.name]]}")
-            self._log.end()
+            self._log_policy_state(agenda)
 
             # Update agenda state based on message.
             # What to handle in output?
@@ -107,10 +164,10 @@ class DefaultPuppeteerPolicy(PuppeteerPolicy):
             # a final action.
             done_flag = progress_flag and agenda.policy.is_done(agenda_state)
             if progress_flag:
-                self._log.add("We have made progress with the agenda.")
+                log.add("We have made progress with the agenda.")
                 self._turns_without_progress[agenda.name] = 0
             else:
-                self._log.add("We have not made progress with the agenda.")
+                log.add("We have not made progress with the agenda.")
                 # At this point, the current agenda (if there is
                 # one) was the one responsible for our previous
                 # reply in this convo. Only this agenda has its
@@ -120,25 +177,27 @@ class DefaultPuppeteerPolicy(PuppeteerPolicy):
             turns_without_progress = self._turns_without_progress[agenda.name]
 
             if turns_without_progress >= 2:
-                self._log.add("The agenda has been going on for too long without progress and will be stopped.")
+                log.add("The agenda has been going on for too long without progress and will be stopped.")
+                _agendas_stopped.inc(agenda.name, "no_progress")
                 agenda_state.reset()
                 self._current_agenda = None
                 last_agenda = agenda
             else:
                 # Run and see if we get some actions.
                 action_history = self._action_history[agenda.name]
-                self._log.begin("Picking actions for the agenda.")
+                log.begin("Picking actions for the agenda.")
                 actions = agenda.policy.pick_actions(agenda_state, action_history, turns_without_progress)
-                self._log.end()
+                log.end()
                 self._action_history[agenda.name].extend(actions)
 
                 if not done_flag:
-                    self._log.add("The agenda is not in a terminal state, so keeping it as current.")
+                    log.add("The agenda is not in a terminal state, so keeping it as current.")
                     # Keep going with this agenda.
-                    self._log.end()
+                    log.end()
                     return actions
                 else:
-                    self._log.add("The agenda is in a terminal state, so will be stopped.")
+                    log.add("The agenda is in a terminal state, so will be stopped.")
+                    _agendas_stopped.inc(agenda.name, "done")
                     # We inactivate this agenda. Will choose a new agenda
                     # in the main while-loop below.
                     # We're either done with the agenda, or had too many turns
@@ -147,31 +206,32 @@ class DefaultPuppeteerPolicy(PuppeteerPolicy):
                     agenda_state.reset()
                     self._current_agenda = None
                     last_agenda = agenda
-            self._log.end()
+            log.end()
         # Try to pick a new agenda.
-        self._log.begin("Trying to find a new agenda to start.")
-        for agenda in np.random.permutation(self._agendas):
+        log.begin("Trying to find a new agenda to start.")
+        if kickoff_candidates is None:
+            agendas = np.random.permutation(self._agendas)
+        else:
+            agendas = self._ordered_candidates(kickoff_candidates())
+            log.add("Kickoff triggers detected for %d agendas.", len(agendas))
+        for agenda in agendas:
             agenda_state = agenda_states[agenda.name]
-            self._log.begin(f"Considering agenda {agenda.name}.")
+            log.begin("Considering agenda %s.", agenda.name)
 
             if agenda == last_agenda:
-                self._log.add("Just stopped this agenda, will not start it immediately again.")
-                self._log.end()
+                log.add("Just stopped this agenda, will not start it immediately again.")
+                log.end()
                 continue
             elif self._times_made_current[agenda.name] > 1:
-                self._log.add(f"This agenda has already been used {self._times_made_current[agenda.name]} times, " +
-                              "will not start it again.")
-                self._log.end()
+                log.add("This agenda has already been used %d times, will not start it again.",
+                        self._times_made_current[agenda.name])
+                log.end()
                 continue
 
             if agenda.policy.can_kick_off(agenda_state):
                 # If we can kick off, make this our active agenda, do actions and return.
-                self._log.add("The agenda can kick off. This is our new agenda!")
-                self._log.begin(f"Puppeteer policy state for {agenda.name}:")
-                self._log.add(f"Turns without progress: {self._turns_without_progress[agenda.name]}")
-                self._log.add(f"Times used: {self._times_made_current[agenda.name]}")
-                self._log.add(f"Action history: {[a.name for a in self._action_history[agenda.name]]}")
-                self._log.end()
+                log.add("The agenda can kick off. This is our new agenda!")
+                self._log_policy_state(agenda)
 
                 # TODO When can the agenda be done already here?
                 done_flag = agenda.policy.is_done(agenda_state)
@@ -180,33 +240,107 @@ class DefaultPuppeteerPolicy(PuppeteerPolicy):
                 # Make this our current agenda.
                 self._current_agenda = agenda
                 self._times_made_current[agenda.name] += 1
+                _kickoffs.inc(agenda.name)
 
                 # Do first action.
                 # TODO run_puppeteer() uses [] for the action list, not self._action_history
-                self._log.begin("Picking actions for the agenda.")
+                log.begin("Picking actions for the agenda.")
                 new_actions = agenda.policy.pick_actions(agenda_state, [], 0)
-                self._log.end()
+                log.end()
                 actions.extend(new_actions)
                 self._action_history[agenda.name].extend(new_actions)
 
                 # TODO This is the done_flag from kickoff. Should check again now? Probably better to enforce in Agenda
                 # that start states are never terminal.
                 if done_flag:
-                    self._log.add("We started the agenda, but its start state is a terminal state, so stopping it.")
-                    self._log.add("Finishing act phase without a current agenda.")
+                    log.add("We started the agenda, but its start state is a terminal state, so stopping it.")
+                    log.add("Finishing act phase without a current agenda.")
+                    _agendas_stopped.inc(agenda.name, "done")
+                    _turns_without_agenda.inc()
                     self._current_agenda = None
-                self._log.end()
-                self._log.end()
+                log.end()
+                log.end()
                 return actions
-            self._log.end()
-        self._log.end()
+            log.end()
+        log.end()
 
         # We failed to take action with an old agenda
         # and failed to kick off a new agenda. We have nothing.
-        self._log.add("Finishing act phase without a current agenda.")
+        log.add("Finishing act phase without a current agenda.")
+        _turns_without_agenda.inc()
 
         return actions
 
+    def _log_policy_state(self, agenda: Agenda) -> None:
+        """Logs the policy state for an agenda, at debug level.
+
+        Args:
+            agenda: The agenda.
+        """
+        log = current_logger()
+        if log.is_enabled_for(Logger.DEBUG):
+            log.begin("Puppeteer policy state for %s:", agenda.name, level=Logger.DEBUG)
+            log.add("Turns without progress: %d", self._turns_without_progress[agenda.name], level=Logger.DEBUG)
+            log.add("Times used: %d", self._times_made_current[agenda.name], level=Logger.DEBUG)
+            log.add("Action history: %s", [a.name for a in self._action_history[agenda.name]],
+                    level=Logger.DEBUG)
+            log.end()
+
+    def _ordered_candidates(self, candidates: Collection[str]) -> List[Agenda]:
+        """Returns the agendas with the given names, in random order.
+
+        The order is the one the agendas would have in a random permutation of all agendas, drawing the same random
+        numbers, so that the policy makes the same decisions whether kickoff candidates are given to act() or not.
+
+        Args:
+            candidates: Names of the agendas.
+
+        Returns:
+            The agendas, in random order.
+        """
+        permutation = np.random.permutation(len(self._agendas))
+        ranks = np.empty_like(permutation)
+        ranks[permutation] = np.arange(len(permutation))
+        indices = sorted((self._agenda_indices[name] for name in candidates), key=lambda i: ranks[i])
+        return [self._agendas[i] for i in indices]
+
+    def active_agendas(self) -> Optional[List[Agenda]]:
+        """Returns the agendas whose transition state needs to be updated in the coming turn.
+
+        Only the current agenda, if any, uses its transition state in act(). Other agendas have their state reset
+        when they are kicked off.
+
+        Returns:
+            A list holding the current agenda, or an empty list if there is no current agenda.
+        """
+        return [] if self._current_agenda is None else [self._current_agenda]
+
+    def get_state(self) -> Any:
+        """Returns a compact snapshot of the conversation-specific state held by the policy.
+
+        See documentation of this method in PuppeteerPolicy.
+
+        Returns:
+            The state snapshot, as a tuple of tuples.
+        """
+        current_name = None if self._current_agenda is None else self._current_agenda.name
+        return (current_name,
+                tuple(self._turns_without_progress.values()),
+                tuple(self._times_made_current.values()),
+                tuple(tuple(h) for h in self._action_history.values()))
+
+    def set_state(self, state: Any) -> None:
+        """Restores the conversation-specific state of the policy from a snapshot returned by get_state().
+
+        Args:
+            state: The state snapshot.
+        """
+        (current_name, turns_without_progress, times_made_current, action_history) = state
+        self._current_agenda = None if current_name is None else self._agendas_by_name[current_name]
+        self._turns_without_progress = dict(zip(self._turns_without_progress, turns_without_progress))
+        self._times_made_current = dict(zip(self._times_made_current, times_made_current))
+        self._action_history = {name: list(h) for (name, h) in zip(self._action_history, action_history)}
+
     def plot_state(self, fig: plt.Figure, agenda_states: Dict[str, AgendaState]) -> None:
         """Plot the state of the current agenda, if any.
 
@@ -233,6 +367,102 @@ class DefaultPuppeteerPolicy(PuppeteerPolicy):
         plt.show()
 
 
+class KickoffIndex:
+    """Index from kickoff triggers to the agendas that they may kick off.
+
+    The index is built once from the kickoff triggers and kickoff trigger detectors of a set of agendas. In each turn,
+    the candidates() method runs each distinct kickoff trigger detector once and uses the index to find the agendas
+    having at least one of their kickoff triggers detected, at a cost depending on the number of detected triggers
+    rather than on the number of agendas.
+
+    The index assumes that an agenda can only kick off if at least one of its kickoff triggers is detected with nonzero
+    probability by one of its kickoff trigger detectors. This holds for agendas using DefaultAgendaPolicy and
+    DefaultTriggerProbabilities.
+    """
+
+    def __init__(self, agendas: List[Agenda]) -> None:
+        """Initializes a new KickoffIndex.
+
+        Args:
+            agendas: The agendas to index.
+        """
+        self._detectors: List[TriggerDetector] = []
+        self._index: List[Dict[str, List[str]]] = []
+        for agenda in agendas:
+            trigger_names = {t.name for t in agenda.kickoff_triggers}
+            for detector in agenda.kickoff_trigger_detectors:
+                if detector in self._detectors:
+                    index = self._index[self._detectors.index(detector)]
+                else:
+                    index = {}
+                    self._detectors.append(detector)
+                    self._index.append(index)
+                for trigger_name in detector.trigger_names:
+                    if trigger_name in trigger_names:
+                        agenda_names = index.setdefault(trigger_name, [])
+                        if agenda.name not in agenda_names:
+                            agenda_names.append(agenda.name)
+
+    @property
+    def trigger_detectors(self) -> List[TriggerDetector]:
+        """Returns the distinct kickoff trigger detectors of the indexed agendas."""
+        return list(self._detectors)
+
+    def candidates(self, observations: List[Observation], old_extractions: Extractions,
+                   detector_cache: TriggerDetectorCache) -> Tuple[Set[str], Extractions]:
+        """Runs all kickoff trigger detectors and returns the agendas that had kickoff triggers detected.
+
+        Args:
+            observations: Observations made since the last turn.
+            old_extractions: Extractions made in the conversation.
+            detector_cache: Cache of trigger detector results for this turn. Detector results are taken from, and
+                stored in, the cache, so that the detectors are not run again when the kickoff trigger probabilities
+                of the candidate agendas are updated.
+
+        Returns:
+            A pair consisting of:
+            - The names of the agendas that had at least one kickoff trigger detected.
+            - Extractions made by the kickoff trigger detectors.
+        """
+        candidates: Set[str] = set()
+        new_extractions = Extractions()
+        for (detector, index) in zip(self._detectors, self._index):
+            (trigger_map, _, extractions) = detector_cache.trigger_probabilities(detector, observations,
+                                                                                  old_extractions)
+            new_extractions.update(extractions)
+            for (trigger_name, p) in trigger_map.items():
+                if p > 0.0 and trigger_name in index:
+                    candidates.update(index[trigger_name])
+        return candidates, new_extractions
+
+
+class PuppeteerState:
+    """Compact snapshot of the conversation-level state of a Puppeteer.
+
+    A Puppeteer holds a number of objects per agenda, most of which only hold data that is recomputed in every turn.
+    The state that actually carries over between turns is the state probabilities of each agenda, the state of the
+    PuppeteerPolicy and the actions of the last turn. This class holds exactly that state, in a compact form, and
+    is used to swap conversations in and out of a Puppeteer through its get_state() and set_state() methods.
+
+    Snapshots are never modified in place, so the same snapshot may be shared between conversations, e.g., as the
+    initial state of newly created conversations.
+    """
+
+    __slots__ = ("state_probabilities", "policy_state", "last_actions")
+
+    def __init__(self, state_probabilities: array, policy_state: Any, last_actions: Tuple[Action, ...]) -> None:
+        """Initializes a new PuppeteerState.
+
+        Args:
+            state_probabilities: The state probabilities of all agendas, concatenated in agenda order.
+            policy_state: The state of the PuppeteerPolicy, as returned by its get_state() method.
+            last_actions: The actions returned by the last turn.
+        """
+        self.state_probabilities = state_probabilities
+        self.policy_state = policy_state
+        self.last_actions = last_actions
+
+
 class Puppeteer:
     """Agendas-based dialog bot.
 
@@ -267,16 +497,65 @@ class Puppeteer:
 
     def __init__(self, agendas: List[Agenda],
                  policy_cls: Type[PuppeteerPolicy] = DefaultPuppeteerPolicy,
-                 plot_state: bool = False) -> None:
+                 plot_state: bool = False,
+                 update_inactive_agendas: bool = True,
+                 kickoff_evaluation: str = "eager",
+                 log_level: int = Logger.DEBUG,
+                 profiler: Optional[TurnProfiler] = None) -> None:
         """Initialize a new Puppeteer.
 
+        By default, all agendas are fully updated in every turn, running all of their trigger detectors. If
+        update_inactive_agendas is false, only the agendas reported by the policy's active_agendas() method get their
+        transition trigger probabilities and state probabilities updated. Other agendas only run their kickoff trigger
+        detectors. This saves a lot of trigger detection when there are many agendas, but is not guaranteed to give
+        the same decisions as the default mode: the state of an inactive agenda is no longer tracked, and extractions
+        made by its transition trigger detectors are lost.
+
+        The kickoff_evaluation argument controls when kickoff trigger detectors are run. With "eager", the default, all
+        of them are run in the update phase of each turn. With "lazy", the kickoff trigger probabilities of an agenda
+        are only computed when the policy first uses them in the act phase. The policy then only runs the kickoff
+        trigger detectors of the agendas it actually considers, in the order it considers them, and none after the
+        first agenda that kicks off. With "indexed", a KickoffIndex is built for the agendas. When the policy looks for
+        a new agenda to start, each distinct kickoff trigger detector is run once, and the policy only considers the
+        agendas that had kickoff triggers detected. The policy must then support the kickoff_candidates argument of
+        PuppeteerPolicy.act(). Decisions are the same in all modes, but with "lazy" and "indexed", extractions made by
+        kickoff trigger detectors that are not run are lost. The number of kickoff trigger probabilities evaluated and
+        skipped in the latest turn, counted in trigger detectors per agenda, are available through the
+        kickoff_detectors_evaluated and kickoff_detectors_skipped properties.
+
+        The log_level argument sets the level of the log returned by the log property. The default, Logger.DEBUG, gives
+        the full log, including trigger and state probabilities. Logger.INFO only logs inputs, outputs and decisions,
+        and Logger.DISABLED turns logging off, so that it costs close to nothing.
+
+        If a TurnProfiler is given, it decides at the start of each turn whether to profile the turn, and samples the
+        stack while profiled turns run. See documentation of TurnProfiler.
+
         Args:
             agendas: List of agendas to be used by the Puppeteer.
             policy_cls: The policy delegate class to use.
             plot_state: If true, the updated state of the current agenda is plotted after each turn.
+            update_inactive_agendas: If false, skip transition updates for agendas that are not active.
+            kickoff_evaluation: One of "eager", "lazy" and "indexed".
+            log_level: The log level.
+            profiler: Optional profiler, profiling a fraction of the turns.
         """
+        if kickoff_evaluation not in ("eager", "lazy", "indexed"):
+            raise ValueError("Unknown kickoff evaluation mode: %s" % kickoff_evaluation)
         self._agendas = agendas
+        self._update_inactive_agendas = update_inactive_agendas
+        self._lazy_kickoff = kickoff_evaluation != "eager"
+        self._kickoff_index = KickoffIndex(agendas) if kickoff_evaluation == "indexed" else None
+        self._kickoff_detectors_evaluated = 0
+        self._kickoff_detectors_skipped = 0
         self._agenda_states = {a.name: AgendaState(a) for a in agendas}
+        self._trigger_detectors: List[TriggerDetector] = []
+        for agenda_state in self._agenda_states.values():
+            for trigger_probabilities in [agenda_state.kickoff_trigger_probabilities,
+                                          agenda_state.transition_trigger_probabilities]:
+                for detector in trigger_probabilities.trigger_detectors:
+                    if detector not in self._trigger_detectors:
+                        self._trigger_detectors.append(detector)
+        self._detector_cache = TriggerDetectorCache()
         self._last_actions: List[Action] = []
         self._policy = policy_cls(agendas)
         if plot_state:
@@ -284,17 +563,81 @@ class Puppeteer:
             self._policy.plot_state(self._fig, self._agenda_states)
         else:
             self._fig = None
-        self._log = Logger()
+        self._log = Logger(log_level)
+        self._profiler = profiler
+
+    @property
+    def agendas(self) -> List[Agenda]:
+        """Returns the agendas used by the Puppeteer."""
+        return list(self._agendas)
+
+    @property
+    def detector_cache(self) -> TriggerDetectorCache:
+        """Returns the turn-scoped trigger detector cache, e.g., to inspect its hit and miss counters."""
+        return self._detector_cache
+
+    @property
+    def kickoff_detectors_evaluated(self) -> int:
+        """Returns the number of kickoff trigger detectors evaluated in the latest turn, counted per agenda."""
+        return self._kickoff_detectors_evaluated
+
+    @property
+    def kickoff_detectors_skipped(self) -> int:
+        """Returns the number of kickoff trigger detectors skipped in the latest turn, counted per agenda.
+
+        Kickoff trigger detectors are only skipped if the Puppeteer was created with kickoff_evaluation="lazy", or with
+        kickoff_evaluation="indexed" in turns where the policy does not look for a new agenda to start. When it does,
+        the kickoff index runs the kickoff trigger detectors of all agendas, and they are all counted as evaluated.
+        """
+        return self._kickoff_detectors_skipped
 
     @property
     def log(self) -> str:
         """Returns a log string from the latest call to react().
 
         The log string contains information that is helpful in understanding the inner workings of the puppeteer -- why
-        it acts the way it does based on the inputs, and what its internal state is.
+        it acts the way it does based on the inputs, and what its internal state is. It is None if logging is disabled.
+
+        Each Puppeteer has its own log, so Puppeteers reacting concurrently, e.g., on different threads, do not mix
+        their logs.
         """
         return self._log.log
 
+    @property
+    def trace(self) -> Trace:
+        """Returns the structured trace of the latest call to react(), from which the log string is rendered.
+
+        The trace holds the events of the turn: inputs, trigger detector outputs, trigger and state probabilities,
+        policy decisions and output actions, down to the log level of the Puppeteer. The trace is overwritten by the
+        next call to react(). Use Trace.copy(), or write it with dump_jsonl() or dump_binary(), to keep it.
+        """
+        return self._log.trace
+
+    def get_state(self) -> PuppeteerState:
+        """Returns a compact snapshot of the conversation-level state of the Puppeteer.
+
+        Returns:
+            The state snapshot.
+        """
+        state_probabilities = array("d")
+        for agenda_state in self._agenda_states.values():
+            state_probabilities.extend(agenda_state.state_probabilities.get_state())
+        return PuppeteerState(state_probabilities, self._policy.get_state(), tuple(self._last_actions))
+
+    def set_state(self, state: PuppeteerState) -> None:
+        """Restores the conversation-level state of the Puppeteer from a snapshot returned by get_state().
+
+        Args:
+            state: The state snapshot.
+        """
+        start = 0
+        for agenda_state in self._agenda_states.values():
+            end = start + len(agenda_state.state_probabilities.probabilities)
+            agenda_state.state_probabilities.set_state(state.state_probabilities[start:end])
+            start = end
+        self._policy.set_state(state.policy_state)
+        self._last_actions = list(state.last_actions)
+
     def react(self, observations: List[Observation], old_extractions: Extractions) -> Tuple[List[Action], Extractions]:
         """"Picks zero or more appropriate actions to take, given the input and current state of the conversation.
 
@@ -312,36 +655,201 @@ class Puppeteer:
             - An updated Extractions object, combining the input extractions with any extractions made by the Puppeteer
               in this method call.
         """
-        self._log.clear()
-        self._log.begin("Inputs")
-        self._log.begin("Observations")
-        for o in observations:
-            self._log.add(str(o))
-        self._log.end()
-        self._log.begin("Extractions")
-        for name in old_extractions.names:
-            self._log.add(f"{name}: '{old_extractions.extraction(name)}'")
-        self._log.end()
-        self._log.end()
-        new_extractions = Extractions()
-        self._log.begin("Update phase")
-        for agenda_state in self._agenda_states.values():
-            extractions = agenda_state.update(self._last_actions, observations, old_extractions)
-            new_extractions.update(extractions)
-        self._log.end()
-        self._log.begin("Act phase")
-        self._last_actions = self._policy.act(self._agenda_states)
-        self._log.end()
-        self._log.begin("Outputs")
-        self._log.begin("Actions")
-        for a in self._last_actions:
-            self._log.add(str(a))
-        self._log.end()
-        self._log.begin("Extractions")
-        for name in new_extractions.names:
-            self._log.add(f"{name}: '{new_extractions.extraction(name)}'")
-        self._log.end()
-        self._log.end()
-        if self._fig is not None:
-            self._policy.plot_state(self._fig, self._agenda_states)
-        return self._last_actions, new_extractions
+        token = begin_timing(PHASE_TURN)
+        try:
+            if self._profiler is not None and self._profiler.start_turn():
+                try:
+                    self._detector_cache.clear()
+                    return self._react(observations, old_extractions)
+                finally:
+                    self._profiler.stop_turn()
+            self._detector_cache.clear()
+            return self._react(observations, old_extractions)
+        finally:
+            end_timing(token)
+
+    async def react_async(self, observations: List[Observation],
+                          old_extractions: Extractions) -> Tuple[List[Action], Extractions]:
+        """"Asynchronous version of react().
+
+        All distinct trigger detectors needed in the update phase are first run concurrently through their
+        trigger_probabilities_async() methods. The rest of the turn then runs exactly as in react(), using the results
+        of the detectors, so the decisions made are identical to the ones made by react(). With lazy or indexed kickoff
+        evaluation, kickoff trigger detectors are not run up front, but synchronously when the policy needs them.
+
+        Note that the Puppeteer itself is not safe for concurrent use. Only one call to react() or react_async() may be
+        in progress at any given time.
+
+        Args:
+            observations: A list of Observations made since the last turn.
+            old_extractions: Extractions made during the whole conversation. This may also include extractions made by
+                other modules based on the current turn.
+
+        Returns:
+            See documentation of react().
+        """
+        token = begin_timing(PHASE_TURN)
+        try:
+            # The event loop thread runs other code while the turn awaits its detectors, so it is only sampled while
+            # it runs the synchronous part of the turn.
+            if self._profiler is not None and self._profiler.start_turn(sample_thread=False):
+                try:
+                    return await self._react_async(observations, old_extractions)
+                finally:
+                    self._profiler.stop_turn()
+            return await self._react_async(observations, old_extractions)
+        finally:
+            end_timing(token)
+
+    async def _react_async(self, observations: List[Observation],
+                           old_extractions: Extractions) -> Tuple[List[Action], Extractions]:
+        """Runs a turn of the conversation, first running all needed trigger detectors concurrently.
+
+        Args:
+            observations: A list of Observations made since the last turn.
+            old_extractions: Extractions made during the whole conversation.
+
+        Returns:
+            See documentation of react().
+        """
+        active_agendas = self._active_agendas()
+        if active_agendas is None and not self._lazy_kickoff:
+            detectors = self._trigger_detectors
+        else:
+            detectors = []
+            for agenda in self._agendas:
+                agenda_state = self._agenda_states[agenda.name]
+                trigger_probabilities_list = []
+                if not self._lazy_kickoff:
+                    trigger_probabilities_list.append(agenda_state.kickoff_trigger_probabilities)
+                if active_agendas is None or agenda in active_agendas:
+                    trigger_probabilities_list.append(agenda_state.transition_trigger_probabilities)
+                for trigger_probabilities in trigger_probabilities_list:
+                    for detector in trigger_probabilities.trigger_detectors:
+                        if detector not in detectors:
+                            detectors.append(detector)
+
+        async def run_detector(detector: TriggerDetector) -> TriggerDetectorResult:
+            detector_token = begin_detector_timing(detector)
+            try:
+                if self._profiler is not None and \
+                        type(detector).trigger_probabilities_async is TriggerDetector.trigger_probabilities_async:
+                    # Run the detector in the executor as the default implementation does, but sampling the executor
+                    # thread if the turn is profiled.
+                    return await self._profiler.run_in_executor(detector.trigger_probabilities, observations,
+                                                                old_extractions)
+                return await detector.trigger_probabilities_async(observations, old_extractions)
+            finally:
+                end_timing(detector_token)
+
+        # Let all detectors finish before raising the exception of any failed detector, so that none of them runs on
+        # after the turn.
+        outcomes = await asyncio.gather(*[run_detector(d) for d in detectors], return_exceptions=True)
+        results: List[TriggerDetectorResult] = []
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                raise outcome
+            results.append(outcome)
+        self._detector_cache.clear()
+        for (detector, result) in zip(detectors, results):
+            self._detector_cache.add(detector, result)
+        if self._profiler is None:
+            return self._react(observations, old_extractions, active_agendas)
+        with self._profiler.sample_thread():
+            return self._react(observations, old_extractions, active_agendas)
+
+    def _active_agendas(self) -> Optional[List[Agenda]]:
+        """Returns the agendas needing transition updates in the coming turn, or None for all agendas."""
+        if self._update_inactive_agendas:
+            return None
+        return self._policy.active_agendas()
+
+    def _react(self, observations: List[Observation], old_extractions: Extractions,
+               active_agendas: Optional[List[Agenda]] = None) -> Tuple[List[Action], Extractions]:
+        """Runs a turn of the conversation.
+
+        Trigger detector results are taken from the detector cache, which may already hold the results of detectors
+        that have been run beforehand for this turn. The log of the Puppeteer is the current logger during the turn, so
+        that agenda states and policies log to it.
+
+        Args:
+            observations: A list of Observations made since the last turn.
+            old_extractions: Extractions made during the whole conversation.
+            active_agendas: The agendas needing transition updates, as returned by _active_agendas(). If not given,
+                they are computed here.
+
+        Returns:
+            See documentation of react().
+        """
+        with self._log.activate():
+            self._log.clear()
+            if self._log.is_enabled_for(Logger.INFO):
+                self._log.begin("Inputs")
+                self._log.begin("Observations")
+                for o in observations:
+                    self._log.event(Trace.OBSERVATION, (str(o),))
+                self._log.end()
+                self._log.begin("Extractions")
+                for name in old_extractions.names:
+                    self._log.event(Trace.EXTRACTION, (name, old_extractions.extraction(name)))
+                self._log.end()
+                self._log.end()
+            new_extractions = Extractions()
+            if active_agendas is None:
+                active_agendas = self._active_agendas()
+            self._log.begin("Update phase")
+            token = begin_timing(PHASE_UPDATE)
+            try:
+                for agenda in self._agendas:
+                    update_transitions = active_agendas is None or agenda in active_agendas
+                    agenda_state = self._agenda_states[agenda.name]
+                    extractions = agenda_state.update(self._last_actions, observations, old_extractions,
+                                                      detector_cache=self._detector_cache,
+                                                      update_transitions=update_transitions,
+                                                      update_kickoff=not self._lazy_kickoff)
+                    new_extractions.update(extractions)
+            finally:
+                end_timing(token)
+            self._log.end()
+            self._log.begin("Act phase")
+            token = begin_timing(PHASE_ACT)
+            # True if the kickoff index ran the kickoff trigger detectors of all agendas in this turn.
+            index_used = False
+            try:
+                if self._kickoff_index is None:
+                    self._last_actions = self._policy.act(self._agenda_states)
+                else:
+                    def kickoff_candidates() -> Set[str]:
+                        nonlocal index_used
+                        index_used = True
+                        (candidates, extractions) = self._kickoff_index.candidates(observations, old_extractions,
+                                                                                   self._detector_cache)
+                        new_extractions.update(extractions)
+                        return candidates
+                    self._last_actions = self._policy.act(self._agenda_states, kickoff_candidates=kickoff_candidates)
+            finally:
+                end_timing(token)
+            self._log.end()
+            self._kickoff_detectors_evaluated = 0
+            self._kickoff_detectors_skipped = 0
+            for agenda in self._agendas:
+                agenda_state = self._agenda_states[agenda.name]
+                if agenda_state.kickoff_pending and not index_used:
+                    self._kickoff_detectors_skipped += len(agenda.kickoff_trigger_detectors)
+                else:
+                    self._kickoff_detectors_evaluated += len(agenda.kickoff_trigger_detectors)
+                    new_extractions.update(agenda_state.deferred_extractions)
+            if self._log.is_enabled_for(Logger.INFO):
+                self._log.begin("Outputs")
+                self._log.begin("Actions")
+                for a in self._last_actions:
+                    self._log.event(Trace.ACTION, (a.name, a.text))
+                self._log.end()
+                self._log.begin("Extractions")
+                for name in new_extractions.names:
+                    self._log.event(Trace.EXTRACTION, (name, new_extractions.extraction(name)))
+                self._log.end()
+                self._log.end()
+            if self._fig is not None:
+                self._policy.plot_state(self._fig, self._agenda_states)
+            return self._last_actions, new_extractions
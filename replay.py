@@ -0,0 +1,324 @@
+import hashlib
+import importlib
+import multiprocessing
+import queue
+import traceback
+import zlib
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .agenda import Agenda
+from .extractions import Extractions
+from .logging import Logger
+from .nlu import SpacyEngine
+from .observation import MessageObservation, Observation
+from .session import PuppeteerPool
+from .trigger_detector import TriggerDetectorLoader
+
+AgendaFactory = Callable[[], List[Agenda]]
+
+
+def load_agenda_files(filenames: List[str], snips_path: Optional[str] = None) -> List[Agenda]:
+    """Loads agendas from files, with trigger detectors loaded by a default TriggerDetectorLoader.
+
+    The default loader only finds Snips trigger detectors, for intents under snips_path. Every trigger of the agendas
+    must be detected by one of them, since a trigger without a detector is never detected, and replaying the agendas
+    would silently give wrong results. Agendas needing other trigger detectors should be loaded by a function using a
+    TriggerDetectorLoader with the detectors registered, used as agenda factory.
+
+    Args:
+        filenames: The agenda files.
+        snips_path: The root path of the Snips training data, if any.
+
+    Returns:
+        The agendas.
+    """
+    loader = TriggerDetectorLoader(default_snips_path=snips_path)
+    agendas = Agenda.load_all(filenames, loader)
+    for agenda in agendas:
+        for (triggers, detectors) in [(agenda.kickoff_triggers, agenda.kickoff_trigger_detectors),
+                                      (agenda.transition_triggers, agenda.transition_trigger_detectors)]:
+            detected = {name for detector in detectors for name in detector.trigger_names}
+            missing = [trigger.name for trigger in triggers if trigger.name not in detected]
+            if missing:
+                raise ValueError("No trigger detector found for triggers %s of agenda '%s', with Snips path %s" %
+                                 (", ".join(missing), agenda.name, snips_path))
+    return agendas
+
+
+def call_factory(spec: str) -> Any:
+    """Imports and calls a function without arguments, given as "module:function", e.g., as an agenda factory.
+
+    Args:
+        spec: The module and function name.
+
+    Returns:
+        The return value of the function.
+    """
+    (module_name, _, function_name) = spec.partition(":")
+    if not function_name:
+        raise ValueError("Expected module:function, got '%s'" % spec)
+    return getattr(importlib.import_module(module_name), function_name)()
+
+
+def conversation_seed(seed: int, conversation_id: str) -> int:
+    """Returns the seed of the random state of a conversation, derived from a base seed and the conversation id.
+
+    Args:
+        seed: The base seed.
+        conversation_id: The id of the conversation.
+    """
+    digest = hashlib.sha256(("%d:%s" % (seed, conversation_id)).encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "little")
+
+
+def turn_inputs(turn: Dict[str, Any]) -> Tuple[List[Observation], Extractions]:
+    """Returns the observations and external extractions of a recorded turn.
+
+    A turn holds either a single message, as a "text" and optional "intents", or a list of messages, as
+    "observations" with a "text" and optional "intents" each. External extractions, made by other modules before the
+    turn, are given as an optional "extractions" dictionary. Other items of the turn are ignored. Turns written by
+    write_transcripts() hold a single message.
+
+    Args:
+        turn: The turn, as read from a JSON Lines transcript.
+
+    Returns:
+        A pair consisting of the observations and the external extractions of the turn.
+    """
+    messages = turn["observations"] if "observations" in turn else [turn]
+    observations: List[Observation] = []
+    for m in messages:
+        observation = MessageObservation(m.get("text", ""))
+        for intent in m.get("intents") or []:
+            observation.add_intent(intent)
+        observations.append(observation)
+    extractions = Extractions()
+    for (name, value) in (turn.get("extractions") or {}).items():
+        extractions.add_extraction(name, value)
+    return observations, extractions
+
+
+class _Conversation:
+    """Replay state of a conversation, besides the state held by the PuppeteerPool."""
+
+    __slots__ = ("extractions", "random_state", "turns")
+
+    def __init__(self, seed: int) -> None:
+        self.extractions = Extractions()
+        self.random_state = np.random.RandomState(seed).get_state()
+        self.turns = 0
+
+
+class Replayer:
+    """Replays recorded conversations through a set of agendas, in the current process.
+
+    Conversations are run by a PuppeteerPool. Each conversation has its own NumPy random state, seeded from a base
+    seed and the conversation id, which is swapped in as the global NumPy random state during each turn of the
+    conversation. The decisions made in a conversation, including the random agenda order of DefaultPuppeteerPolicy,
+    therefore only depend on the seed and the turns of the conversation, and not on the order in which the turns of
+    different conversations are interleaved, or on how conversations are spread over processes.
+
+    Turns are read as described in turn_inputs(), and must have a "conversation_id". A conversation is evicted after a
+    turn marked as "last", as written by TranscriptGenerator. Conversations without such a turn are held until the
+    Replayer is discarded.
+    """
+
+    def __init__(self, agendas: List[Agenda], seed: int = 0, traces: bool = False) -> None:
+        """Initializes a new Replayer.
+
+        Args:
+            agendas: The agendas to replay the conversations through.
+            seed: The base seed of the random states of conversations.
+            traces: If true, the trace of each turn is included in its result.
+        """
+        self._pool = PuppeteerPool(agendas, log_level=Logger.DEBUG if traces else Logger.DISABLED)
+        self._seed = seed
+        self._traces = traces
+        self._conversations: Dict[str, _Conversation] = {}
+
+    def replay_batch(self, turns: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Replays a batch of turns, in the given order.
+
+        As in PuppeteerPool.react_batch(), the message texts of all turns are first processed in a batch by all loaded
+        SpacyEngines.
+
+        Args:
+            turns: The turns.
+
+        Returns:
+            For each turn, a dictionary with the conversation id, the number of the turn within the conversation, the
+            names and texts of the actions picked, the extractions of the conversation after the turn, and, if traces
+            are enabled, the trace of the turn as returned by Trace.to_dicts().
+        """
+        inputs = [turn_inputs(turn) for turn in turns]
+        texts = ["\n".join(o.text for o in observations if isinstance(o, MessageObservation))
+                 for (observations, _) in inputs]
+        outer_random_state = np.random.get_state()
+        try:
+            with SpacyEngine.prefetched(texts):
+                return [self._replay_turn(turn, observations, extractions)
+                        for (turn, (observations, extractions)) in zip(turns, inputs)]
+        finally:
+            np.random.set_state(outer_random_state)
+
+    def replay(self, turns: Iterable[Dict[str, Any]], batch_size: int = 64) -> Iterator[Dict[str, Any]]:
+        """Replays turns in batches, in the given order.
+
+        Args:
+            turns: The turns.
+            batch_size: The number of turns in each batch.
+
+        Returns:
+            An iterator over the results of the turns, as returned by replay_batch().
+        """
+        batch: List[Dict[str, Any]] = []
+        for turn in turns:
+            batch.append(turn)
+            if len(batch) >= batch_size:
+                yield from self.replay_batch(batch)
+                batch = []
+        if batch:
+            yield from self.replay_batch(batch)
+
+    def _replay_turn(self, turn: Dict[str, Any], observations: List[Observation],
+                     external_extractions: Extractions) -> Dict[str, Any]:
+        """Replays a single turn, with the random state of its conversation."""
+        conversation_id = str(turn["conversation_id"])
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None:
+            conversation = _Conversation(conversation_seed(self._seed, conversation_id))
+            self._conversations[conversation_id] = conversation
+            self._pool.create(conversation_id)
+        conversation.extractions.update(external_extractions)
+        np.random.set_state(conversation.random_state)
+        (actions, new_extractions) = self._pool.react(conversation_id, observations, conversation.extractions)
+        conversation.random_state = np.random.get_state()
+        conversation.extractions.update(new_extractions)
+        extractions = conversation.extractions
+        result = {
+            "conversation_id": conversation_id,
+            "turn": conversation.turns,
+            "actions": [a.name for a in actions],
+            "texts": [a.text for a in actions],
+            "extractions": {name: extractions.extraction(name) for name in extractions.names},
+        }
+        if self._traces:
+            result["trace"] = self._pool.trace.to_dicts()
+        conversation.turns += 1
+        if turn.get("last"):
+            del self._conversations[conversation_id]
+            self._pool.evict(conversation_id)
+        return result
+
+
+def replay_transcripts(turns: Iterable[Dict[str, Any]], agenda_factory: AgendaFactory, workers: int = 0,
+                       seed: int = 0, traces: bool = False, batch_size: int = 64) -> Iterator[Dict[str, Any]]:
+    """Replays recorded conversations through a set of agendas, optionally spread over a pool of processes.
+
+    With workers > 0, conversations are sharded over that many worker processes by a hash of their ids, so that all
+    turns of a conversation are run by the same worker, in order. Each worker calls agenda_factory once, loading the
+    agendas and their trigger detectors, and then replays its turns with a Replayer, in batches of batch_size turns.
+    Turns are read lazily, and only a bounded number of turns is in flight at any time, so transcripts of any size are
+    replayed in bounded memory, except for the state of conversations that have not ended.
+
+    Results are returned in the order of the turns. Since each conversation has its own random state, see Replayer,
+    the results do not depend on the number of workers. If a worker fails, or dies without reporting a failure, a
+    RuntimeError is raised.
+
+    Args:
+        turns: The turns, as described in Replayer.
+        agenda_factory: Function returning the agendas. With workers > 0, it must be picklable, e.g., a module-level
+            function or a functools.partial of one, such as load_agenda_files().
+        workers: The number of worker processes. If 0, turns are replayed in the current process.
+        seed: The base seed of the random states of conversations.
+        traces: If true, the trace of each turn is included in its result.
+        batch_size: The number of turns sent to a worker at a time.
+
+    Returns:
+        An iterator over the results of the turns, as returned by Replayer.replay_batch().
+    """
+    if workers < 0 or batch_size < 1:
+        raise ValueError("Need workers >= 0 and batch_size >= 1, got %d and %d" % (workers, batch_size))
+    if workers == 0:
+        yield from Replayer(agenda_factory(), seed=seed, traces=traces).replay(turns, batch_size=batch_size)
+        return
+
+    context = multiprocessing.get_context()
+    inboxes = [context.Queue() for _ in range(workers)]
+    outbox = context.Queue()
+    processes = [context.Process(target=_replay_worker, args=(agenda_factory, seed, traces, inbox, outbox),
+                                 name="puppeteer-replay-%d" % i, daemon=True)
+                 for (i, inbox) in enumerate(inboxes)]
+    for process in processes:
+        process.start()
+    # Batches being filled for each worker, of (sequence number, turn) pairs.
+    batches: List[List[Tuple[int, Dict[str, Any]]]] = [[] for _ in range(workers)]
+    results: Dict[int, Dict[str, Any]] = {}
+    window = 4 * workers * batch_size
+    read = 0
+    written = 0
+
+    def flush() -> None:
+        for (i, batch) in enumerate(batches):
+            if batch:
+                inboxes[i].put(batch)
+                batches[i] = []
+
+    def receive() -> None:
+        while True:
+            try:
+                message = outbox.get(timeout=1.0)
+                break
+            except queue.Empty:
+                # A worker killed, e.g., by a signal or by running out of memory, never sends its results.
+                for process in processes:
+                    if not process.is_alive() and process.exitcode != 0:
+                        raise RuntimeError("Replay worker %s died with exit code %s" %
+                                           (process.name, process.exitcode))
+        if isinstance(message, str):
+            raise RuntimeError("Replay worker failed:\n%s" % message)
+        results.update(message)
+
+    try:
+        for turn in turns:
+            i = zlib.crc32(str(turn["conversation_id"]).encode("utf-8")) % workers
+            batches[i].append((read, turn))
+            read += 1
+            if len(batches[i]) >= batch_size:
+                inboxes[i].put(batches[i])
+                batches[i] = []
+            if read - written >= window:
+                flush()
+                while read - written >= window // 2:
+                    while written not in results:
+                        receive()
+                    yield results.pop(written)
+                    written += 1
+        flush()
+        for inbox in inboxes:
+            inbox.put(None)
+        while written < read:
+            while written not in results:
+                receive()
+            yield results.pop(written)
+            written += 1
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+
+def _replay_worker(agenda_factory: AgendaFactory, seed: int, traces: bool,
+                   inbox: multiprocessing.Queue, outbox: multiprocessing.Queue) -> None:
+    """Worker process of replay_transcripts(): replays batches of turns from the inbox, until it gets None."""
+    try:
+        replayer = Replayer(agenda_factory(), seed=seed, traces=traces)
+        for batch in iter(inbox.get, None):
+            outputs = replayer.replay_batch([turn for (_, turn) in batch])
+            outbox.put([(sequence, output) for ((sequence, _), output) in zip(batch, outputs)])
+    except BaseException:
+        outbox.put(traceback.format_exc())
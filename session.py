@@ -0,0 +1,197 @@
+import threading
+import weakref
+from typing import Dict, List, Optional, Tuple, Type
+
+from .agenda import Action, Agenda
+from .extractions import Extractions
+from .logging import Logger
+from .metrics import metrics_registry
+from .nlu import SpacyEngine
+from .observation import MessageObservation, Observation
+from .profiling import TurnProfiler
+from .puppeteer import DefaultPuppeteerPolicy, Puppeteer, PuppeteerPolicy, PuppeteerState
+from .trace import Trace
+from .trace_sink import TraceSink
+from .trigger_detector import TriggerDetectorCache
+
+_active_conversations = metrics_registry().gauge("puppeteer_active_conversations",
+                                                 "Conversations held by all PuppeteerPools.")
+# The live pools, whose conversations are counted by _active_conversations. Pools that are garbage collected drop out,
+# along with their conversations.
+_pools: "weakref.WeakSet[PuppeteerPool]" = weakref.WeakSet()
+_pools_lock = threading.Lock()
+
+
+def _count_active_conversations() -> int:
+    """Returns the number of conversations held by all live PuppeteerPools."""
+    with _pools_lock:
+        pools = list(_pools)
+    return sum(len(pool) for pool in pools)
+
+
+_active_conversations.set_function(_count_active_conversations)
+
+
+class PuppeteerPool:
+    """Session manager handling many concurrent conversations with a shared set of agendas.
+
+    A Puppeteer handles a single conversation, and holds a number of per-agenda objects, most of which only hold data
+    that is recomputed in every turn. When running a large number of conversations with the same agendas, most of that
+    memory is wasted. A PuppeteerPool instead keeps a single working Puppeteer, holding the agendas (and through them,
+    the trigger detectors) once, and stores only a compact PuppeteerState per conversation. In each call to react(),
+    the state of the given conversation is swapped into the working Puppeteer, the turn is run, and the updated state
+    is swapped out again.
+
+    The decisions made for a conversation are identical to the ones a dedicated Puppeteer would have made, given the
+    same sequence of inputs and the same random state.
+
+    Conversations are identified by string ids chosen by the caller. A conversation must be created, using create(),
+    before it is used, and should be evicted, using evict(), when it is finished, to release its state.
+
+    Note that a PuppeteerPool is not thread-safe. Concurrent calls to react() need to be serialized by the caller.
+    """
+
+    def __init__(self, agendas: List[Agenda],
+                 policy_cls: Type[PuppeteerPolicy] = DefaultPuppeteerPolicy,
+                 update_inactive_agendas: bool = True,
+                 kickoff_evaluation: str = "eager",
+                 log_level: int = Logger.DEBUG,
+                 trace_sink: Optional[TraceSink] = None,
+                 profiler: Optional[TurnProfiler] = None) -> None:
+        """Initialize a new PuppeteerPool.
+
+        Args:
+            agendas: List of agendas to be used by the conversations of the pool.
+            policy_cls: The policy delegate class to use. The class must implement the get_state() and set_state()
+                methods of PuppeteerPolicy.
+            update_inactive_agendas: If false, skip transition updates for agendas that are not active. See
+                documentation of the Puppeteer constructor.
+            kickoff_evaluation: One of "eager", "lazy" and "indexed". See documentation of the Puppeteer constructor.
+            log_level: The log level. See documentation of the Puppeteer constructor.
+            trace_sink: Optional sink recording the trace of every turn, with the conversation id. Evicted
+                conversations are forgotten by the sink.
+            profiler: Optional profiler, profiling a fraction of the turns of all conversations. See documentation of
+                TurnProfiler.
+        """
+        self._puppeteer = Puppeteer(agendas, policy_cls=policy_cls, update_inactive_agendas=update_inactive_agendas,
+                                    kickoff_evaluation=kickoff_evaluation, log_level=log_level,
+                                    profiler=profiler)
+        self._initial_state = self._puppeteer.get_state()
+        self._states: Dict[str, PuppeteerState] = {}
+        self._trace_sink = trace_sink
+        with _pools_lock:
+            _pools.add(self)
+
+    @property
+    def agendas(self) -> List[Agenda]:
+        """Returns the agendas used by the pool."""
+        return list(self._puppeteer.agendas)
+
+    @property
+    def conversation_ids(self) -> List[str]:
+        """Returns the ids of all conversations in the pool."""
+        return list(self._states.keys())
+
+    @property
+    def detector_cache(self) -> TriggerDetectorCache:
+        """Returns the turn-scoped trigger detector cache shared by all conversations of the pool.
+
+        The hit and miss counters of the cache are accumulated over all conversations.
+        """
+        return self._puppeteer.detector_cache
+
+    @property
+    def log(self) -> Optional[str]:
+        """Returns a log string from the latest call to react(), for any conversation.
+
+        See documentation of the log property in Puppeteer.
+        """
+        return self._puppeteer.log
+
+    @property
+    def trace(self) -> Trace:
+        """Returns the trace of the latest call to react(), for any conversation.
+
+        See documentation of the trace property in Puppeteer.
+        """
+        return self._puppeteer.trace
+
+    def __len__(self) -> int:
+        """Returns the number of conversations in the pool."""
+        return len(self._states)
+
+    def __contains__(self, conversation_id: str) -> bool:
+        """Returns true if the pool holds a conversation with the given id."""
+        return conversation_id in self._states
+
+    def create(self, conversation_id: str) -> None:
+        """Create a new conversation.
+
+        Args:
+            conversation_id: The id of the new conversation.
+        """
+        if conversation_id in self._states:
+            raise ValueError("Pool already has a conversation with id '%s'" % conversation_id)
+        self._states[conversation_id] = self._initial_state
+
+    def evict(self, conversation_id: str) -> None:
+        """Remove a conversation, releasing its state.
+
+        Args:
+            conversation_id: The id of the conversation.
+        """
+        if conversation_id not in self._states:
+            raise ValueError("No conversation with id '%s'" % conversation_id)
+        del self._states[conversation_id]
+        if self._trace_sink is not None:
+            self._trace_sink.forget(conversation_id)
+
+    def react(self, conversation_id: str, observations: List[Observation],
+              old_extractions: Extractions) -> Tuple[List[Action], Extractions]:
+        """"Picks zero or more appropriate actions to take in the given conversation.
+
+        See documentation of the react() method in Puppeteer.
+
+        Args:
+            conversation_id: The id of the conversation.
+            observations: A list of Observations made since the last turn of the conversation.
+            old_extractions: Extractions made during the whole conversation.
+
+        Returns:
+            A pair consisting of:
+            - A list of Action objects representing actions to take, in given order.
+            - An updated Extractions object, combining the input extractions with any extractions made by the Puppeteer
+              in this method call.
+        """
+        if conversation_id not in self._states:
+            raise ValueError("No conversation with id '%s'" % conversation_id)
+        self._puppeteer.set_state(self._states[conversation_id])
+        result = self._puppeteer.react(observations, old_extractions)
+        self._states[conversation_id] = self._puppeteer.get_state()
+        if self._trace_sink is not None:
+            self._trace_sink.record(conversation_id, self._puppeteer.trace)
+        return result
+
+    def react_batch(self, turns: List[Tuple[str, List[Observation], Extractions]],
+                    batch_size: int = 64) -> List[Tuple[List[Action], Extractions]]:
+        """Runs a turn in each of a number of conversations.
+
+        Before any turn is run, the message texts of all turns are processed in batches by all loaded SpacyEngines,
+        see SpacyEngine.prefetched(). Trigger detectors using a SpacyEngine, such as SnipsTriggerDetector, then reuse
+        the prefetched results instead of processing one text at a time. After that, the turns are run in the given
+        order, exactly as by react().
+
+        Args:
+            turns: For each turn, a tuple consisting of the conversation id, the observations and the extractions, as
+                given to react().
+            batch_size: The number of texts in each batch processed by Spacy.
+
+        Returns:
+            For each turn, in given order, the result of react().
+        """
+        texts = []
+        for (_, observations, _) in turns:
+            texts.append("\n".join([o.text for o in observations if isinstance(o, MessageObservation)]))
+        with SpacyEngine.prefetched(texts, batch_size=batch_size):
+            return [self.react(conversation_id, observations, old_extractions)
+                    for (conversation_id, observations, old_extractions) in turns]
@@ -0,0 +1,295 @@
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .agenda import Action, Agenda, DefaultAgendaPolicy
+
+
+class BatchedStateStore:
+    """Holds the state probabilities of many conversations using the same agenda, as rows of a single array.
+
+    When many conversations share an Agenda, the state probabilities of each conversation are really rows of a
+    (conversations x states) matrix. This class keeps them that way, and applies the state probability update of
+    DefaultStateProbabilities to any number of conversations as a single vectorized operation. The is_done() and
+    made_progress() predicates of DefaultAgendaPolicy are likewise evaluated for many conversations at once, using the
+    thresholds of the agenda's policy.
+
+    The computed state probabilities are identical to the ones computed by DefaultStateProbabilities, for each
+    conversation separately. The ERROR_STATE probability is computed in closed form, as in
+    VectorizedStateProbabilities, and may differ by floating-point rounding.
+
+    Rows are identified by string conversation ids chosen by the caller. Columns are the states of the agenda, in
+    agenda order, followed by the ERROR_STATE, as in the probabilities property of StateProbabilities. Trigger
+    probabilities are given as a (conversations x triggers) array, with columns in the order of the trigger_names
+    property.
+    """
+
+    def __init__(self, agenda: Agenda, capacity: int = 1024) -> None:
+        """Initializes a new, empty BatchedStateStore.
+
+        Args:
+            agenda: The agenda used by the conversations.
+            capacity: Initial number of rows. The store grows as needed.
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be positive, got %d" % capacity)
+        self._agenda = agenda
+        compiled = agenda.compile()
+        self._compiled = compiled
+        self._state_names = compiled.state_names + ("ERROR_STATE",)
+        num_states = len(compiled.state_names)
+        num_triggers = len(compiled.trigger_names)
+        transition_array = compiled.transition_array
+
+        # For each state, the last trigger without a transition from the state, or -1 if there is none. Active
+        # states lacking a transition have their probability overwritten at this trigger. See
+        # VectorizedStateProbabilities.
+        unmatched = transition_array < 0
+        if num_triggers > 0:
+            last_unmatched = num_triggers - 1 - np.argmax(unmatched[:, ::-1], axis=1)
+            self._last_unmatched = np.where(unmatched.any(axis=1), last_unmatched, -1)
+        else:
+            self._last_unmatched = np.full(num_states, -1)
+        self._overwritten = self._last_unmatched >= 0
+
+        # Transitions in the order visited by DefaultStateProbabilities.update(), with a flag telling if the
+        # transition is visited after its end state is overwritten, if it is.
+        self._transitions = []
+        for (state_id, transitions) in enumerate(compiled.transition_table):
+            for (trigger_id, end_state_id) in transitions:
+                after = state_id * num_triggers + trigger_id > end_state_id * num_triggers + \
+                    self._last_unmatched[end_state_id]
+                self._transitions.append((state_id, trigger_id, end_state_id, after))
+        self._matched = (transition_array >= 0).ravel()
+
+        d = agenda.policy.to_dict()
+        for name in ["absolute_accept_thresh", "min_accept_thresh_w_differential", "accept_thresh_differential"]:
+            if name not in d:
+                raise ValueError("Policy of agenda '%s' has no %s threshold" % (agenda.name, name))
+        self._absolute_accept_thresh = d["absolute_accept_thresh"]
+        self._min_accept_thresh_w_differential = d["min_accept_thresh_w_differential"]
+        self._accept_thresh_differential = d["accept_thresh_differential"]
+        self._terminus = np.zeros(num_states + 1, dtype=bool)
+        self._terminus[list(compiled.terminus)] = True
+
+        self._initial = np.zeros(num_states + 1)
+        self._initial[compiled.start_state] = 1.0
+        self._values = np.zeros((capacity, num_states + 1))
+        self._rows: Dict[str, int] = {}
+        self._free: List[int] = list(range(capacity - 1, -1, -1))
+
+    @property
+    def agenda(self) -> Agenda:
+        """Returns the agenda used by the conversations."""
+        return self._agenda
+
+    @property
+    def state_names(self) -> List[str]:
+        """Returns the names of the columns of the state probability array, including the ERROR_STATE."""
+        return list(self._state_names)
+
+    @property
+    def trigger_names(self) -> List[str]:
+        """Returns the names of the columns of the trigger probability arrays given to update()."""
+        return list(self._compiled.trigger_names)
+
+    @property
+    def conversation_ids(self) -> List[str]:
+        """Returns the ids of all conversations in the store."""
+        return list(self._rows.keys())
+
+    def __len__(self) -> int:
+        """Returns the number of conversations in the store."""
+        return len(self._rows)
+
+    def __contains__(self, conversation_id: str) -> bool:
+        """Returns true if the store holds a conversation with the given id."""
+        return conversation_id in self._rows
+
+    def add(self, conversation_id: str, state: Optional[Sequence[float]] = None) -> None:
+        """Adds a conversation to the store.
+
+        Args:
+            conversation_id: The id of the conversation.
+            state: Initial state probability values, as returned by get_state(). Defaults to the initial state
+                probabilities of a newly started agenda.
+        """
+        if conversation_id in self._rows:
+            raise ValueError("Conversation already in store: %s" % conversation_id)
+        if not self._free:
+            capacity = len(self._values)
+            self._values = np.concatenate([self._values, np.zeros_like(self._values)])
+            self._free = list(range(2 * capacity - 1, capacity - 1, -1))
+        row = self._free.pop()
+        self._values[row] = self._initial if state is None else state
+        self._rows[conversation_id] = row
+
+    def remove(self, conversation_id: str) -> None:
+        """Removes a conversation from the store.
+
+        Args:
+            conversation_id: The id of the conversation.
+        """
+        if conversation_id not in self._rows:
+            raise ValueError("No conversation in store with id: %s" % conversation_id)
+        self._free.append(self._rows.pop(conversation_id))
+
+    def get_state(self, conversation_id: str) -> List[float]:
+        """Returns the state probabilities of a conversation as a flat list of values.
+
+        The values are compatible with the get_state() and set_state() methods of StateProbabilities.
+
+        Args:
+            conversation_id: The id of the conversation.
+
+        Returns:
+            The list of state probability values.
+        """
+        return self._values[self._row(conversation_id)].tolist()
+
+    def set_state(self, conversation_id: str, state: Sequence[float]) -> None:
+        """Sets the state probabilities of a conversation from a flat sequence of values.
+
+        Args:
+            conversation_id: The id of the conversation.
+            state: The state probability values.
+        """
+        self._values[self._row(conversation_id)] = state
+
+    def probabilities(self, conversation_id: str) -> Dict[str, float]:
+        """Returns the state probabilities of a conversation, by state name.
+
+        Args:
+            conversation_id: The id of the conversation.
+
+        Returns:
+            The state probabilities.
+        """
+        return dict(zip(self._state_names, self.get_state(conversation_id)))
+
+    def reset(self, conversation_ids: Sequence[str]) -> None:
+        """Resets state probabilities to the initial values for a newly started agenda.
+
+        Args:
+            conversation_ids: The ids of the conversations to reset.
+        """
+        self._values[self._row_array(conversation_ids)] = self._initial
+
+    def update(self, conversation_ids: Sequence[str], trigger_probabilities: np.ndarray,
+               non_trigger_probs: np.ndarray, last_actions: Optional[Sequence[Optional[Action]]] = None) -> None:
+        """Updates the state probabilities of many conversations based on their trigger probabilities.
+
+        This is the batched equivalent of calling DefaultStateProbabilities.update() for each conversation.
+
+        Args:
+            conversation_ids: The ids of the conversations to update. Each conversation may occur only once.
+            trigger_probabilities: Trigger probabilities, as a (conversations x triggers) array, with columns in the
+                order of the trigger_names property.
+            non_trigger_probs: The probabilities of no trigger, as an array with one value per conversation.
+            last_actions: For each conversation, the last of the actions performed in the last turn, or None if no
+                actions were performed. As in DefaultStateProbabilities.update(), conversations whose last action does
+                not belong to the agenda are not updated. Defaults to no actions for all conversations.
+        """
+        rows = self._row_array(conversation_ids)
+        if len(set(rows.tolist())) != len(rows):
+            raise ValueError("Each conversation may only be updated once per call")
+        triggers = np.asarray(trigger_probabilities, dtype=float).reshape(len(rows), len(self._compiled.trigger_names))
+        p_event = 1.0 - np.asarray(non_trigger_probs, dtype=float).reshape(len(rows))
+        if last_actions is not None:
+            action_set = self._compiled.action_set
+            keep = np.array([a is None or a in action_set for a in last_actions], dtype=bool)
+            rows = rows[keep]
+            triggers = triggers[keep]
+            p_event = p_event[keep]
+        if len(rows) == 0:
+            return
+
+        num_states = len(self._compiled.state_names)
+        num_triggers = triggers.shape[1]
+        current = self._values[rows, :num_states]
+
+        to_move = current * p_event[:, np.newaxis]
+        new_values = np.empty((len(rows), num_states + 1))
+        new_values[:, :num_states] = np.maximum(0.05, current - to_move)
+        new_values[:, num_states] = 0.0
+
+        # States taking part in transitions, i.e., with round(to_move, 1) > 0.0.
+        active = to_move >= 0.05
+        if num_triggers > 0:
+            # Active states lacking a transition get their probability overwritten, at their last unmatched trigger.
+            overwritten = active & self._overwritten
+            overwrite_values = np.maximum(0.05, current - triggers[:, self._last_unmatched])
+            new_values[:, :num_states] = np.where(overwritten, overwrite_values, new_values[:, :num_states])
+
+            # Add transition mass, in visiting order, skipping mass added before the end state was overwritten.
+            # Adding zero where no mass is moved leaves values unchanged, so each conversation sees exactly the
+            # additions made by the loop-based implementation, in the same order.
+            for (state_id, trigger_id, end_state_id, after) in self._transitions:
+                mass = to_move[:, state_id] * triggers[:, trigger_id]
+                moved = active[:, state_id]
+                if not after:
+                    moved = moved & ~overwritten[:, end_state_id]
+                new_values[:, end_state_id] += np.where(moved, mass, 0.0)
+
+            # ERROR_STATE probability, in closed form. See VectorizedStateProbabilities.update().
+            masses = to_move[:, :, np.newaxis] * triggers[:, np.newaxis, :]
+            masses = np.where(active[:, :, np.newaxis], masses, 0.0).reshape(len(rows), -1)
+            deltas = np.where(self._matched, -masses, masses)
+            totals = deltas.sum(axis=1)
+            remaining = totals[:, np.newaxis] - np.cumsum(deltas, axis=1)
+            floored = self._matched & np.repeat(active, num_triggers, axis=1)
+            floors = np.where(floored, 0.05 + remaining, -np.inf)
+            new_values[:, num_states] = np.maximum(totals, floors.max(axis=1, initial=-np.inf))
+
+        self._values[rows] = new_values
+
+    def is_done(self, conversation_ids: Sequence[str]) -> np.ndarray:
+        """Returns, for each conversation, true if the agenda is likely in a terminus state.
+
+        This is the batched equivalent of DefaultAgendaPolicy.is_done().
+
+        Args:
+            conversation_ids: The ids of the conversations.
+
+        Returns:
+            A boolean array with one value per conversation.
+        """
+        values = self._values[self._row_array(conversation_ids)]
+        n = len(values)
+        # The most likely state, and the next most likely state, breaking ties by state order as a stable sort does.
+        best = np.argmax(values, axis=1)
+        best_values = values[np.arange(n), best]
+        rest = values.copy()
+        rest[np.arange(n), best] = -np.inf
+        second_values = rest.max(axis=1)
+        terminus = self._terminus[best]
+        return terminus & ((best_values >= self._absolute_accept_thresh) |
+                           ((best_values >= self._min_accept_thresh_w_differential) &
+                            (best_values - second_values >= self._accept_thresh_differential)))
+
+    def made_progress(self, conversation_ids: Sequence[str], non_trigger_probs: np.ndarray) -> np.ndarray:
+        """Returns, for each conversation, true if the agenda made progress in the last turn.
+
+        This is the batched equivalent of DefaultAgendaPolicy.made_progress().
+
+        Args:
+            conversation_ids: The ids of the conversations.
+            non_trigger_probs: The transition probabilities of no trigger, as an array with one value per
+                conversation.
+
+        Returns:
+            A boolean array with one value per conversation.
+        """
+        error_values = self._values[self._row_array(conversation_ids), -1]
+        return ((np.asarray(non_trigger_probs) <= DefaultAgendaPolicy.PROGRESS_MAX_NON_TRIGGER_PROB) &
+                (error_values <= DefaultAgendaPolicy.PROGRESS_MAX_ERROR_STATE_PROB))
+
+    def _row(self, conversation_id: str) -> int:
+        """Returns the row of a conversation."""
+        if conversation_id not in self._rows:
+            raise ValueError("No conversation in store with id: %s" % conversation_id)
+        return self._rows[conversation_id]
+
+    def _row_array(self, conversation_ids: Sequence[str]) -> np.ndarray:
+        """Returns the rows of the given conversations, as an integer array."""
+        return np.fromiter((self._row(c) for c in conversation_ids), dtype=int, count=len(conversation_ids))
@@ -0,0 +1,96 @@
+from typing import Dict, List, Type
+
+import numpy as np
+
+from .agenda import Action, Agenda, DefaultStateProbabilities, State, StateProbabilities, Trigger
+
+
+def generate_agenda(name: str,
+                    num_states: int,
+                    num_triggers: int,
+                    branching: int = 2,
+                    num_termini: int = 1,
+                    actions_per_state: int = 1,
+                    stall_actions_per_state: int = 0,
+                    num_kickoff_triggers: int = 1,
+                    seed: int = 0,
+                    state_probabilities_cls: Type[StateProbabilities] = DefaultStateProbabilities) -> Agenda:
+    """Returns a random agenda with the given shape, built through the regular Agenda API.
+
+    The states are named state_0 to state_<num_states - 1>. The last num_termini states are termini, without outgoing
+    transitions, and state_0 is the start state. The other states form a chain, each with a transition to the next one,
+    and the last of them leads to the first terminus, so that every state can be reached from the start state and
+    every terminus can be reached. Each non-terminal state has branching outgoing transitions in total, on distinct
+    triggers, the ones beyond the chain going to random states. Each remaining terminus gets one transition from a
+    random non-terminal state.
+
+    Trigger names are prefixed with the agenda name. The agenda has no trigger detectors, which are added by the
+    caller. It can also be written to a file with Agenda.store(), and loaded again with Agenda.load(), given a trigger
+    detector loader with detectors for its triggers.
+
+    Args:
+        name: The name of the agenda.
+        num_states: Number of states.
+        num_triggers: Number of transition triggers. Must be at least the branching factor.
+        branching: Number of outgoing transitions of each non-terminal state.
+        num_termini: Number of terminus states. Must be less than the number of states.
+        actions_per_state: Number of actions of each state.
+        stall_actions_per_state: Number of stall actions of each state.
+        num_kickoff_triggers: Number of kickoff triggers.
+        seed: Seed of the random generator choosing the random transitions.
+        state_probabilities_cls: The class to use to compute state probabilities.
+
+    Returns:
+        The agenda.
+    """
+    if not 0 < num_termini < num_states:
+        raise ValueError("Need 0 < num_termini < num_states, got %d and %d" % (num_termini, num_states))
+    if not 0 < branching <= num_triggers:
+        raise ValueError("Need 0 < branching <= num_triggers, got %d and %d" % (branching, num_triggers))
+    if num_termini > 1 and num_triggers < 2:
+        raise ValueError("Need at least 2 triggers for more than one terminus")
+    rng = np.random.RandomState(seed)
+    agenda = Agenda(name, state_probabilities_cls=state_probabilities_cls)
+    trigger_names = ["%s_trigger_%d" % (name, i) for i in range(num_triggers)]
+    kickoff_names = ["%s_kickoff_%d" % (name, i) for i in range(num_kickoff_triggers)]
+    for trigger_name in trigger_names:
+        agenda.add_transition_trigger(Trigger(trigger_name))
+    for kickoff_name in kickoff_names:
+        agenda.add_kickoff_trigger(Trigger(kickoff_name))
+    state_names = ["state_%d" % i for i in range(num_states)]
+    for (i, state_name) in enumerate(state_names):
+        agenda.add_state(State(state_name))
+        for j in range(actions_per_state):
+            action_name = "action_%d_%d" % (i, j)
+            agenda.add_action(Action(action_name, text="Action %d.%d" % (i, j), allowed_repeats=2))
+            agenda.add_action_for_state(action_name, state_name)
+        for j in range(stall_actions_per_state):
+            action_name = "stall_action_%d_%d" % (i, j)
+            agenda.add_action(Action(action_name, text="Stall action %d.%d" % (i, j), allowed_repeats=2))
+            agenda.add_stall_action_for_state(action_name, state_name)
+    # Plan the transitions of the chain states first, as trigger index to end state index.
+    num_chain = num_states - num_termini
+    plan: List[Dict[int, int]] = []
+    for i in range(num_chain):
+        triggers = [int(t) for t in rng.permutation(num_triggers)[:branching]]
+        transitions = {triggers[0]: i + 1}
+        for t in triggers[1:]:
+            transitions[t] = int(rng.randint(num_chain))
+        plan.append(transitions)
+    for terminus in range(num_chain + 1, num_states):
+        # Redirect a random branch of a random chain state, or add one, so that the terminus can be reached.
+        options = []
+        for (source, transitions) in enumerate(plan):
+            options.extend((source, t) for (t, end) in sorted(transitions.items()) if source + 1 != end < num_chain)
+            options.extend((source, t) for t in range(num_triggers) if t not in transitions)
+        if not options:
+            raise ValueError("Too few states or triggers to reach %d termini" % num_termini)
+        (source, t) = options[rng.randint(len(options))]
+        plan[source][t] = terminus
+    for (i, transitions) in enumerate(plan):
+        for (t, end) in sorted(transitions.items()):
+            agenda.add_transition(state_names[i], trigger_names[t], state_names[end])
+    agenda.set_start_state(state_names[0])
+    for state_name in state_names[num_chain:]:
+        agenda.add_terminus(state_name)
+    return agenda
@@ -0,0 +1,95 @@
+import os
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from puppeteer import (
+    Action,
+    Agenda,
+    Extractions,
+    MessageObservation,
+    Observation,
+    SpacyEngine,
+    State,
+    Trigger,
+    TriggerDetector
+)
+
+
+class KeywordTriggerDetector(TriggerDetector):
+    """Detects triggers whose names occur in the message texts, and extracts the texts."""
+
+    def __init__(self, trigger_names: List[str]) -> None:
+        self._trigger_names = trigger_names
+
+    @property
+    def trigger_names(self) -> List[str]:
+        return list(self._trigger_names)
+
+    def trigger_probabilities(self, observations: List[Observation],
+                              old_extractions: Extractions) -> Tuple[Dict[str, float], float, Extractions]:
+        # Give other threads a chance to run in the middle of the turn.
+        time.sleep(0)
+        text = " ".join(o.text for o in observations if isinstance(o, MessageObservation))
+        trigger_map = {name: 1.0 for name in self._trigger_names if name in text}
+        extractions = Extractions()
+        extractions.add_extraction("text_%s" % self._trigger_names[0], text)
+        return trigger_map, 0.0 if trigger_map else 1.0, extractions
+
+
+def chain_agenda(name: str = "chain") -> Agenda:
+    agenda = Agenda(name)
+    agenda.add_kickoff_trigger(Trigger("start"))
+    agenda.add_transition_trigger(Trigger("next"))
+    for i in range(4):
+        agenda.add_state(State("s%d" % i))
+        agenda.add_action(Action("a%d" % i, text="Action %d" % i))
+        agenda.add_action_for_state("a%d" % i, "s%d" % i)
+    for i in range(3):
+        agenda.add_transition("s%d" % i, "next", "s%d" % (i + 1))
+    agenda.set_start_state("s0")
+    agenda.add_terminus("s3")
+    agenda.add_kickoff_trigger_detector(KeywordTriggerDetector(["start"]))
+    agenda.add_transition_trigger_detector(KeywordTriggerDetector(["next"]))
+    return agenda
+
+
+def write_intent(root: str, name: str, positive: List[str], negative: List[str]) -> str:
+    folder = os.path.join(root, name)
+    os.makedirs(folder)
+    for (filename, lines) in [(name, positive), ("NOT" + name, negative)]:
+        with open(os.path.join(folder, "%s.txt" % filename), "w") as file:
+            file.write("\n".join(lines) + "\n")
+    return folder
+
+
+class FakeSpan:
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+
+class FakeDoc:
+    def __init__(self, text: str) -> None:
+        self.sents = [FakeSpan(line) for line in text.split("\n") if line]
+        self.ents: List[Any] = []
+
+
+class FakeNlp:
+    """Stands in for a Spacy model, splitting texts into sentences at line breaks, and counting the texts processed
+    one by one."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def __call__(self, text: str) -> FakeDoc:
+        self.calls += 1
+        return FakeDoc(text)
+
+    def pipe(self, texts: Iterable[str], batch_size: int = 64) -> Iterator[FakeDoc]:
+        return (FakeDoc(text) for text in texts)
+
+
+def fake_engine() -> SpacyEngine:
+    engine = SpacyEngine.__new__(SpacyEngine)
+    engine._model = "fake"
+    engine._nlp = FakeNlp()
+    return engine
@@ -0,0 +1,69 @@
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from puppeteer import Agenda, Extractions, MessageObservation, Puppeteer
+from puppeteer.logging import Logger, current_logger
+from helpers import chain_agenda
+
+
+def run_conversation(agendas: List[Agenda], conversation: int) -> List[Tuple[List[str], str]]:
+    """Runs a conversation, returning the names of the actions and the log of each turn."""
+    puppeteer = Puppeteer(agendas)
+    extractions = Extractions()
+    turns = []
+    for text in ["start %d", "next %d", "what %d", "next %d", "next %d", "bye %d"]:
+        (actions, new_extractions) = puppeteer.react([MessageObservation(text % conversation)], extractions)
+        extractions.update(new_extractions)
+        turns.append(([a.name for a in actions], puppeteer.log))
+    return turns
+
+
+def test_concurrent_logs_are_separate() -> None:
+    agendas = [chain_agenda()]
+    num_conversations = 64
+    expected = [run_conversation(agendas, c) for c in range(num_conversations)]
+    assert "next 3" in expected[3][1][1]
+    assert "next 4" not in expected[3][1][1]
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        barrier = threading.Barrier(8)
+
+        def run(conversation: int) -> List[Tuple[List[str], str]]:
+            if conversation < 8:
+                barrier.wait()
+            return run_conversation(agendas, conversation)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for _ in range(5):
+                actual = list(executor.map(run, range(num_conversations)))
+                assert actual == expected
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+
+def test_current_logger() -> None:
+    assert current_logger().log is None
+    assert not current_logger().is_enabled_for(Logger.INFO)
+    current_logger().begin("Dropped")
+    current_logger().add("Dropped")
+    current_logger().end()
+    outer = Logger()
+    inner = Logger(Logger.INFO)
+    with outer.activate():
+        current_logger().add("outer %d", 1)
+        with inner.activate():
+            current_logger().add("inner")
+            current_logger().add("debug", level=Logger.DEBUG)
+        current_logger().add("outer %d", 2)
+    assert current_logger().log is None
+    assert outer.log == "outer 1\nouter 2"
+    assert inner.log == "inner"
+
+
+if __name__ == "__main__":
+    test_concurrent_logs_are_separate()
+    test_current_logger()
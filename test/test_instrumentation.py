@@ -0,0 +1,137 @@
+import asyncio
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from puppeteer import (
+    PHASE_ACT,
+    PHASE_DETECTOR,
+    PHASE_TURN,
+    PHASE_UPDATE,
+    Extractions,
+    Histogram,
+    HistogramCollector,
+    Instrument,
+    MessageObservation,
+    Observation,
+    Puppeteer,
+    add_instrument,
+    instruments,
+    remove_instrument
+)
+
+from helpers import KeywordTriggerDetector, chain_agenda
+
+
+class NestingInstrument(Instrument):
+    """Records the phases entered and exited, checking that they are properly nested."""
+
+    def __init__(self) -> None:
+        self.stack = []
+        self.exited = []
+
+    def enter(self, phase: str, name: str) -> None:
+        self.stack.append((phase, name))
+
+    def exit(self, phase: str, name: str, seconds: float) -> None:
+        assert self.stack.pop() == (phase, name)
+        assert seconds >= 0.0
+        self.exited.append((phase, name))
+
+
+class FailingTriggerDetector(KeywordTriggerDetector):
+    """A KeywordTriggerDetector raising an error on every call."""
+
+    def trigger_probabilities(self, observations: List[Observation],
+                              old_extractions: Extractions) -> Tuple[Dict[str, float], float, Extractions]:
+        raise RuntimeError("Detector failed")
+
+
+def test_histogram_percentiles() -> None:
+    np.random.seed(0)
+    values = np.random.lognormal(mean=-7.0, sigma=1.5, size=20000)
+    histogram = Histogram()
+    for value in values:
+        histogram.add(value)
+    assert histogram.count == len(values)
+    assert np.isclose(histogram.mean, np.mean(values))
+    assert histogram.min == np.min(values) and histogram.max == np.max(values)
+    for q in [1, 50, 95, 99]:
+        assert abs(histogram.percentile(q) / np.percentile(values, q) - 1.0) < 0.03
+    assert histogram.percentile(100) == np.max(values)
+    assert Histogram().percentile(50) == 0.0
+
+
+def test_collector() -> None:
+    collector = HistogramCollector()
+    nesting = NestingInstrument()
+    add_instrument(collector)
+    add_instrument(nesting)
+    try:
+        puppeteer = Puppeteer([chain_agenda()])
+        extractions = Extractions()
+        for text in ["start", "next", "next", "next"]:
+            puppeteer.react([MessageObservation(text)], extractions)
+    finally:
+        remove_instrument(collector)
+        remove_instrument(nesting)
+    assert instruments() == []
+    assert nesting.stack == []
+
+    assert collector.histogram(PHASE_TURN).count == 4
+    assert collector.histogram(PHASE_UPDATE).count == 4
+    assert collector.histogram(PHASE_ACT).count == 4
+    assert collector.histogram(PHASE_DETECTOR, "KeywordTriggerDetector(start)").count == 4
+    assert collector.histogram(PHASE_DETECTOR, "KeywordTriggerDetector(next)").count > 0
+    assert (PHASE_DETECTOR, "KeywordTriggerDetector(next)") in collector.keys()
+    assert "KeywordTriggerDetector(start)" in collector.report()
+    # Detectors run within the update phase, which runs within the turn.
+    assert nesting.exited[:5] == [(PHASE_DETECTOR, "KeywordTriggerDetector(start)"),
+                                  (PHASE_DETECTOR, "KeywordTriggerDetector(next)"),
+                                  (PHASE_UPDATE, ""), (PHASE_ACT, ""), (PHASE_TURN, "")]
+
+    collector.reset()
+    assert collector.keys() == []
+
+
+class BalanceInstrument(Instrument):
+    """Counts the phases entered and not yet exited, which may overlap when detectors run concurrently."""
+
+    def __init__(self) -> None:
+        self.open: Dict[Tuple[str, str], int] = {}
+        self.exited = []
+
+    def enter(self, phase: str, name: str) -> None:
+        self.open[(phase, name)] = self.open.get((phase, name), 0) + 1
+
+    def exit(self, phase: str, name: str, seconds: float) -> None:
+        self.open[(phase, name)] -= 1
+        self.exited.append((phase, name))
+
+
+def test_failing_detector() -> None:
+    agenda = chain_agenda()
+    agenda.add_kickoff_trigger_detector(FailingTriggerDetector(["start"]))
+    balance = BalanceInstrument()
+    add_instrument(balance)
+    try:
+        puppeteer = Puppeteer([agenda])
+        for react in [lambda: puppeteer.react([MessageObservation("start")], Extractions()),
+                      lambda: asyncio.run(puppeteer.react_async([MessageObservation("start")], Extractions()))]:
+            try:
+                react()
+                assert False
+            except RuntimeError:
+                pass
+            # Every phase entered is exited, also when a detector fails.
+            assert set(balance.open.values()) == {0}
+            assert (PHASE_DETECTOR, "FailingTriggerDetector(start)") in balance.exited
+            assert balance.exited[-1] == (PHASE_TURN, "")
+    finally:
+        remove_instrument(balance)
+
+
+if __name__ == "__main__":
+    test_histogram_percentiles()
+    test_collector()
+    test_failing_detector()
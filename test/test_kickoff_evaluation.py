@@ -0,0 +1,124 @@
+import random
+import zlib
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from puppeteer import (
+    Action,
+    Agenda,
+    Extractions,
+    MessageObservation,
+    Observation,
+    Puppeteer,
+    State,
+    Trigger,
+    TriggerDetector
+)
+
+WORDS = ["kick0", "kick1", "kick2", "kick3", "kick4", "kick5", "next", "skip", "hello", "what", "bye"]
+
+
+class HashTriggerDetector(TriggerDetector):
+    """Detects triggers whose names occur in the message texts, and others at random, decided by a hash of the text.
+
+    If extract is true, the detector also extracts the text.
+    """
+
+    def __init__(self, trigger_names: List[str], extract: bool = False) -> None:
+        self._trigger_names = trigger_names
+        self._extract = extract
+
+    @property
+    def trigger_names(self) -> List[str]:
+        return list(self._trigger_names)
+
+    def trigger_probabilities(self, observations: List[Observation],
+                              old_extractions: Extractions) -> Tuple[Dict[str, float], float, Extractions]:
+        text = " ".join(o.text for o in observations if isinstance(o, MessageObservation))
+        trigger_map = {}
+        for name in self._trigger_names:
+            if name in text:
+                trigger_map[name] = 1.0
+            elif zlib.crc32((text + "|" + name).encode("utf-8")) % 10 == 0:
+                trigger_map[name] = 0.5
+        extractions = Extractions()
+        if self._extract:
+            extractions.add_extraction("text_%s" % self._trigger_names[0], text)
+        return trigger_map, 1.0 - max(trigger_map.values(), default=0.0), extractions
+
+
+def agendas() -> List[Agenda]:
+    """Returns agendas with kickoff triggers detected by a shared detector, some of them kicked off by the same
+    trigger. The kickoff detector makes no extractions, since extractions of kickoff detectors that are not run are
+    lost in the lazy and indexed modes."""
+    kickoff_detector = HashTriggerDetector(["kick%d" % i for i in range(6)])
+    result = []
+    for i in range(8):
+        agenda = Agenda("agenda%d" % i)
+        agenda.add_kickoff_trigger(Trigger("kick%d" % (i % 6)))
+        agenda.add_transition_trigger(Trigger("next"))
+        agenda.add_transition_trigger(Trigger("skip"))
+        for j in range(4):
+            agenda.add_state(State("s%d" % j))
+            agenda.add_action(Action("agenda%d_a%d" % (i, j)))
+            agenda.add_action_for_state("agenda%d_a%d" % (i, j), "s%d" % j)
+        for j in range(3):
+            agenda.add_transition("s%d" % j, "next", "s%d" % (j + 1))
+        agenda.add_transition("s0", "skip", "s2")
+        agenda.set_start_state("s0")
+        agenda.add_terminus("s3")
+        agenda.add_kickoff_trigger_detector(kickoff_detector)
+        agenda.add_transition_trigger_detector(HashTriggerDetector(["next", "skip"], extract=True))
+        result.append(agenda)
+    return result
+
+
+def play(kickoff_evaluation: str, seed: int, turns: int = 60) -> List[Tuple[List[str], Dict[str, Any]]]:
+    """Plays a seeded random conversation, returning the actions and extractions of each turn."""
+    rng = random.Random(seed)
+    np.random.seed(seed)
+    puppeteer = Puppeteer(agendas(), kickoff_evaluation=kickoff_evaluation)
+    extractions = Extractions()
+    result = []
+    for _ in range(turns):
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3)))
+        (actions, new_extractions) = puppeteer.react([MessageObservation(text)], extractions)
+        extractions.update(new_extractions)
+        result.append(([a.name for a in actions], {name: new_extractions.extraction(name)
+                                                   for name in new_extractions.names}))
+    return result
+
+
+def test_kickoff_evaluation_is_equivalent() -> None:
+    for seed in range(5):
+        eager = play("eager", seed)
+        assert sum(1 for (actions, _) in eager if actions) > 10
+        assert play("lazy", seed) == eager
+        assert play("indexed", seed) == eager
+
+
+def test_kickoff_detector_counts() -> None:
+    np.random.seed(0)
+    lazy = Puppeteer(agendas(), kickoff_evaluation="lazy")
+    indexed = Puppeteer(agendas(), kickoff_evaluation="indexed")
+    for puppeteer in [lazy, indexed]:
+        # No agenda is active, so the policy looks for an agenda to kick off.
+        puppeteer.react([MessageObservation("hello")], Extractions())
+        assert puppeteer.kickoff_detectors_evaluated + puppeteer.kickoff_detectors_skipped == 8
+    # The lazy policy considers every agenda, as none kicks off.
+    assert lazy.kickoff_detectors_skipped == 0
+    # The index runs the shared kickoff detector for all agendas, and none is skipped.
+    assert indexed.kickoff_detectors_evaluated == 8 and indexed.kickoff_detectors_skipped == 0
+
+    # Once an agenda is active, no other agenda is considered.
+    for puppeteer in [lazy, indexed]:
+        (actions, _) = puppeteer.react([MessageObservation("kick0")], Extractions())
+        assert actions
+        puppeteer.react([MessageObservation("what")], Extractions())
+        assert puppeteer.kickoff_detectors_evaluated == 0 and puppeteer.kickoff_detectors_skipped == 8
+
+
+if __name__ == "__main__":
+    test_kickoff_evaluation_is_equivalent()
+    test_kickoff_detector_counts()
@@ -0,0 +1,145 @@
+import gc
+import threading
+import urllib.error
+import urllib.request
+
+from puppeteer import (
+    Extractions,
+    MessageObservation,
+    MetricsRegistry,
+    MetricsServer,
+    PuppeteerPool,
+    metrics_registry
+)
+
+from helpers import chain_agenda
+
+
+def test_concurrent_updates() -> None:
+    registry = MetricsRegistry()
+    counter = registry.counter("events_total", "Events.", ["kind"])
+    gauge = registry.gauge("level", "Level.")
+
+    def run() -> None:
+        for i in range(10000):
+            counter.inc("even" if i % 2 == 0 else "odd")
+            gauge.inc()
+        gauge.dec(amount=5000)
+
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.values() == {("even",): 40000, ("odd",): 40000}
+    assert gauge.value() == 40000
+    assert registry.counter("events_total", "Events.", ["kind"]) is counter
+    for (register, labels) in [(registry.gauge, ["kind"]), (registry.counter, ["other"])]:
+        try:
+            register("events_total", "Events.", labels)
+            assert False
+        except ValueError:
+            pass
+    try:
+        counter.inc("even", "odd")
+        assert False
+    except ValueError:
+        pass
+
+
+def test_thread_churn() -> None:
+    registry = MetricsRegistry()
+    counter = registry.counter("events_total", "Events.", ["kind"])
+    counter.inc("main")
+    for _ in range(50):
+        threads = [threading.Thread(target=counter.inc, args=("worker",)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert counter.values() == {("main",): 1, ("worker",): 200}
+    # The shards of exited threads are merged, and only the shard of the main thread is left.
+    assert len(counter._shards) == 1
+
+
+def test_render() -> None:
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests\nhandled.", ["path"]).inc('/a"b\\', amount=3)
+    registry.gauge("ratio", "A ratio.").set_function(lambda: 0.25)
+    assert registry.render() == "\n".join([
+        "# HELP ratio A ratio.",
+        "# TYPE ratio gauge",
+        "ratio 0.25",
+        "# HELP requests_total Requests\\nhandled.",
+        "# TYPE requests_total counter",
+        'requests_total{path="/a\\"b\\\\"} 3',
+        ""])
+
+
+def test_puppeteer_metrics() -> None:
+    registry = metrics_registry()
+    names = ["puppeteer_kickoffs_total", "puppeteer_agendas_stopped_total", "puppeteer_policy_turns_total",
+             "puppeteer_turns_without_agenda_total", "puppeteer_pick_actions_total", "puppeteer_active_conversations",
+             "puppeteer_detector_runs_total", "puppeteer_detector_cache_hits_total"]
+    before = {name: registry.metric(name).values() for name in names}
+
+    pool = PuppeteerPool([chain_agenda()])
+    pool.create("a")
+    pool.create("b")
+    assert registry.metric("puppeteer_active_conversations").value() == before["puppeteer_active_conversations"].get(
+        (), 0) + 2
+    extractions = Extractions()
+    # No agenda, kickoff, a stall, and a stop after two turns without progress, then no agenda again.
+    for text in ["hello", "start", "hello", "hello", "hello"]:
+        pool.react("a", [MessageObservation(text)], extractions)
+    pool.evict("a")
+    pool.evict("b")
+
+    def delta(name: str, *label_values: str) -> float:
+        return registry.metric(name).value(*label_values) - before[name].get(tuple(label_values), 0)
+
+    assert delta("puppeteer_active_conversations") == 0
+    assert delta("puppeteer_policy_turns_total") == 5
+    assert delta("puppeteer_kickoffs_total", "chain") == 1
+    assert delta("puppeteer_agendas_stopped_total", "chain", "no_progress") == 1
+    assert delta("puppeteer_turns_without_agenda_total") == 3
+    assert delta("puppeteer_pick_actions_total", "chain", "normal") == 1
+    assert delta("puppeteer_pick_actions_total", "chain", "stall") == 1
+    assert delta("puppeteer_detector_runs_total") == 10
+    assert delta("puppeteer_detector_cache_hits_total") == 0
+
+
+def test_active_conversations_of_dropped_pool() -> None:
+    gauge = metrics_registry().metric("puppeteer_active_conversations")
+    before = gauge.value()
+    pool = PuppeteerPool([chain_agenda()])
+    for conversation_id in ["a", "b", "c"]:
+        pool.create(conversation_id)
+    assert gauge.value() == before + 3
+    # Conversations that are never evicted stop being counted when their pool is dropped.
+    del pool
+    gc.collect()
+    assert gauge.value() == before
+
+
+def test_server() -> None:
+    registry = MetricsRegistry()
+    registry.counter("hits_total", "Hits.").inc()
+    with MetricsServer(registry) as server:
+        with urllib.request.urlopen(server.url, timeout=10) as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert response.read().decode("utf-8") == registry.render()
+        try:
+            urllib.request.urlopen(server.url.replace("/metrics", "/other"), timeout=10)
+            assert False
+        except urllib.error.HTTPError as e:
+            assert e.code == 404
+
+
+if __name__ == "__main__":
+    test_concurrent_updates()
+    test_thread_churn()
+    test_render()
+    test_puppeteer_metrics()
+    test_active_conversations_of_dropped_pool()
+    test_server()
@@ -0,0 +1,118 @@
+import asyncio
+import io
+import math
+import sys
+import time
+from typing import Dict, List, Tuple
+
+from puppeteer import Extractions, MessageObservation, Observation, Puppeteer, PuppeteerPool, TurnProfiler
+
+from helpers import KeywordTriggerDetector, chain_agenda
+
+
+class SlowTriggerDetector(KeywordTriggerDetector):
+    """A KeywordTriggerDetector taking a few milliseconds per call."""
+
+    def trigger_probabilities(self, observations: List[Observation],
+                              old_extractions: Extractions) -> Tuple[Dict[str, float], float, Extractions]:
+        time.sleep(0.005)
+        return super(SlowTriggerDetector, self).trigger_probabilities(observations, old_extractions)
+
+
+def test_profiler() -> None:
+    agenda = chain_agenda()
+    agenda.add_transition_trigger_detector(SlowTriggerDetector(["next"]))
+    with TurnProfiler(every=2, interval=0.0005) as profiler:
+        pool = PuppeteerPool([agenda], profiler=profiler)
+        pool.create("a")
+        for text in ["start", "next", "next", "next"] * 5:
+            pool.react("a", [MessageObservation(text)], Extractions())
+        assert profiler.profiled_turns == 10
+        assert profiler.samples > 0
+
+        summary = profiler.summary()
+        assert sum(count for (_, _, count) in summary) == profiler.samples
+        assert ("chain", "SlowTriggerDetector") == summary[0][:2]
+        assert "SlowTriggerDetector" in profiler.report()
+
+        output = io.StringIO()
+        profiler.write_collapsed(output)
+        lines = output.getvalue().splitlines()
+        assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) == profiler.samples
+        slow = [line for line in lines if line.startswith("agenda:chain;detector:SlowTriggerDetector;")]
+        assert any("trigger_probabilities (test_profiling.py" in line for line in slow)
+
+        profiler.reset()
+        assert profiler.samples == 0 and profiler.summary() == []
+    assert not profiler.start_turn()
+
+
+def test_overlapping_profilers() -> None:
+    original = sys.getswitchinterval()
+    with TurnProfiler(every=1, interval=0.001) as first, TurnProfiler(every=1, interval=0.0005) as second:
+        assert first.start_turn()
+        assert math.isclose(sys.getswitchinterval(), 0.0001)
+        assert second.start_turn()
+        assert math.isclose(sys.getswitchinterval(), 0.00005)
+        first.stop_turn()
+        assert math.isclose(sys.getswitchinterval(), 0.00005)
+        second.stop_turn()
+        assert sys.getswitchinterval() == original
+
+        # Closing a profiler with a turn in progress restores the interval it requested.
+        assert first.start_turn()
+        assert second.start_turn()
+    assert sys.getswitchinterval() == original
+
+
+def busy(seconds: float) -> None:
+    """Keeps the calling thread busy for a number of seconds."""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+async def unprofiled_work(turns: int) -> None:
+    """Keeps the event loop thread busy while the profiled turns await their trigger detectors."""
+    for _ in range(turns * 4):
+        busy(0.002)
+        await asyncio.sleep(0)
+
+
+def test_profiler_async() -> None:
+    # With lazy kickoff evaluation, the kickoff detector runs synchronously on the event loop thread, as part of the
+    # agenda policy, while the transition detector runs up front in an executor thread, outside of any agenda.
+    agendas = []
+    for name in ["chain", "chain2"]:
+        agenda = chain_agenda(name)
+        agenda.add_kickoff_trigger_detector(SlowTriggerDetector(["start"]))
+        agenda.add_transition_trigger_detector(SlowTriggerDetector(["next"]))
+        agendas.append(agenda)
+    texts = ["start", "next", "next", "next"] * 5
+
+    async def conversation() -> None:
+        puppeteer = Puppeteer(agendas, kickoff_evaluation="lazy", profiler=profiler)
+        for text in texts:
+            await puppeteer.react_async([MessageObservation(text)], Extractions())
+
+    async def main() -> None:
+        # Two overlapping profiled conversations, and unprofiled work on the event loop thread.
+        await asyncio.gather(conversation(), conversation(), unprofiled_work(len(texts)))
+
+    with TurnProfiler(every=1, interval=0.0005) as profiler:
+        asyncio.run(main())
+        assert profiler.profiled_turns == 2 * len(texts)
+        counts = {(agenda, detector): count for (agenda, detector, count) in profiler.summary()}
+        assert counts.get(("-", "SlowTriggerDetector"), 0) > 0
+        assert counts.get(("chain", "SlowTriggerDetector"), 0) + counts.get(("chain2", "SlowTriggerDetector"), 0) > 0
+        # Code run by the event loop thread outside of the turns is not sampled.
+        assert not any("busy (test_profiling.py" in stack for stack in profiler.stacks())
+        assert not any("unprofiled_work (test_profiling.py" in stack for stack in profiler.stacks())
+        # No thread is left sampled after the turns.
+        assert profiler._active == {} and profiler._turns == set()
+
+
+if __name__ == "__main__":
+    test_profiler()
+    test_profiler_async()
+    test_overlapping_profilers()
@@ -0,0 +1,103 @@
+import os
+from os.path import dirname, join, realpath
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from puppeteer import Agenda, Replayer, TranscriptGenerator, load_agenda_files, replay_transcripts, turn_inputs
+from puppeteer.__main__ import main
+from helpers import chain_agenda
+
+
+def chain_agendas() -> List[Agenda]:
+    # Two agendas, so that DefaultPuppeteerPolicy orders them at random.
+    return [chain_agenda(), chain_agenda("chain2")]
+
+
+def dying_agendas() -> List[Agenda]:
+    # Exits the worker process without any message, as if killed.
+    os._exit(3)
+
+
+def by_conversation(results: List[dict]) -> Dict[str, List[Tuple[List[str], dict]]]:
+    conversations: Dict[str, List[Tuple[List[str], dict]]] = {}
+    for result in results:
+        conversations.setdefault(result["conversation_id"], []).append((result["actions"], result["extractions"]))
+    return conversations
+
+
+def test_replay_deterministic() -> None:
+    turns = list(TranscriptGenerator(chain_agendas(), noise_rate=0.2, concurrency=8, seed=3).turns(conversations=40))
+    results = list(replay_transcripts(turns, chain_agendas, seed=5))
+    assert [r["conversation_id"] for r in results] == [t["conversation_id"] for t in turns]
+    assert any(r["actions"] for r in results)
+
+    # The same results are given with worker processes, in the same order.
+    assert list(replay_transcripts(turns, chain_agendas, workers=2, seed=5, batch_size=4)) == results
+
+    # The results of a conversation do not depend on how it is interleaved with others.
+    regrouped = sorted(turns, key=lambda t: t["conversation_id"])
+    assert by_conversation(list(replay_transcripts(regrouped, chain_agendas, seed=5))) == by_conversation(results)
+
+    # The global NumPy random state is left as it was.
+    np.random.seed(1)
+    expected = np.random.random()
+    np.random.seed(1)
+    list(replay_transcripts(turns, chain_agendas, seed=5))
+    assert np.random.random() == expected
+
+
+def test_replay_inputs() -> None:
+    turn = {"conversation_id": "c", "observations": [{"text": "start", "intents": ["greeting"]}, {"text": "next"}],
+            "extractions": {"name": "Alice"}}
+    (observations, extractions) = turn_inputs(turn)
+    assert [o.text for o in observations] == ["start", "next"]
+    assert observations[0].has_intent("greeting") and not observations[1].has_intent("greeting")
+    assert extractions.extraction("name") == "Alice"
+
+    replayer = Replayer([chain_agenda()], traces=True)
+    [result] = replayer.replay_batch([dict(turn, last=True)])
+    assert result["turn"] == 0
+    assert result["extractions"]["name"] == "Alice"
+    assert result["extractions"]["text_start"] == "start next"
+    assert result["trace"]
+    # The conversation was evicted after its last turn, and starts over.
+    [result] = replayer.replay_batch([{"conversation_id": "c", "text": "hello"}])
+    assert result["turn"] == 0 and "name" not in result["extractions"]
+
+
+def test_replay_dead_worker() -> None:
+    turns = list(TranscriptGenerator(chain_agendas(), concurrency=4, seed=3).turns(conversations=8))
+    try:
+        list(replay_transcripts(turns, dying_agendas, workers=2, batch_size=4))
+        assert False
+    except RuntimeError as e:
+        assert "puppeteer-replay-" in str(e) and "exit code 3" in str(e)
+
+
+def test_load_agenda_files_without_detectors() -> None:
+    # The shipped agendas need Snips training data, or custom trigger detectors.
+    filename = join(dirname(dirname(realpath(__file__))), "agendas", "simple.yaml")
+    try:
+        load_agenda_files([filename])
+        assert False
+    except ValueError as e:
+        assert "kickoff" in str(e) and "'ask_for_the_time'" in str(e)
+
+
+def test_replay_command_needs_agendas() -> None:
+    # Exactly one of --agendas and --agenda-factory must be given.
+    for argv in [["replay", "-"], ["replay", "-", "--agendas", "a.yaml", "--agenda-factory", "module:function"]]:
+        try:
+            main(argv)
+            assert False
+        except SystemExit as e:
+            assert e.code == 2
+
+
+if __name__ == "__main__":
+    test_replay_deterministic()
+    test_replay_inputs()
+    test_replay_dead_worker()
+    test_load_agenda_files_without_detectors()
+    test_replay_command_needs_agendas()
@@ -0,0 +1,151 @@
+import asyncio
+import random
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from puppeteer import Agenda, Extractions, MessageObservation, Puppeteer, PuppeteerPool
+from helpers import chain_agenda
+
+TEXTS = ["start", "next", "what", "bye", "start next", "next next"]
+
+
+def agendas() -> List[Agenda]:
+    # Two agendas, so that DefaultPuppeteerPolicy orders them at random.
+    return [chain_agenda(), chain_agenda("chain2")]
+
+
+def script(seed: int, conversations: int = 6, turns: int = 48) -> List[Tuple[str, str]]:
+    """Returns a seeded random interleaving of turns of a number of conversations, as (conversation id, text)."""
+    rng = random.Random(seed)
+    return [("c%d" % rng.randrange(conversations), rng.choice(TEXTS)) for _ in range(turns)]
+
+
+def result(reaction: Tuple[List[Any], Extractions]) -> Tuple[List[str], Dict[str, Any]]:
+    (actions, extractions) = reaction
+    return [a.name for a in actions], {name: extractions.extraction(name) for name in extractions.names}
+
+
+def play_dedicated(turns: List[Tuple[str, str]], use_async: bool = False,
+                   kickoff_evaluation: str = "eager") -> List[Tuple[List[str], Dict[str, Any]]]:
+    """Plays the turns with a dedicated Puppeteer per conversation, with react() or react_async()."""
+    shared = agendas()
+    puppeteers: Dict[str, Puppeteer] = {}
+    extractions: Dict[str, Extractions] = {}
+    results = []
+    for (conversation_id, text) in turns:
+        if conversation_id not in puppeteers:
+            puppeteers[conversation_id] = Puppeteer(shared, kickoff_evaluation=kickoff_evaluation)
+            extractions[conversation_id] = Extractions()
+        puppeteer = puppeteers[conversation_id]
+        if use_async:
+            reaction = asyncio.run(puppeteer.react_async([MessageObservation(text)], extractions[conversation_id]))
+        else:
+            reaction = puppeteer.react([MessageObservation(text)], extractions[conversation_id])
+        extractions[conversation_id] = reaction[1]
+        results.append(result(reaction))
+    return results
+
+
+def play_pool(turns: List[Tuple[str, str]], batch_size: int = 0) -> List[Tuple[List[str], Dict[str, Any]]]:
+    """Plays the turns with a PuppeteerPool, with react() or, if batch_size is nonzero, with react_batch()."""
+    pool = PuppeteerPool(agendas())
+    extractions: Dict[str, Extractions] = {}
+    results = []
+    batch: List[Tuple[str, str]] = []
+
+    def flush() -> None:
+        reactions = pool.react_batch([(c, [MessageObservation(t)], extractions[c]) for (c, t) in batch])
+        for ((c, _), reaction) in zip(batch, reactions):
+            extractions[c] = reaction[1]
+            results.append(result(reaction))
+        batch.clear()
+
+    for (conversation_id, text) in turns:
+        if conversation_id not in pool:
+            pool.create(conversation_id)
+            extractions[conversation_id] = Extractions()
+        if batch_size == 0:
+            reaction = pool.react(conversation_id, [MessageObservation(text)], extractions[conversation_id])
+            extractions[conversation_id] = reaction[1]
+            results.append(result(reaction))
+        else:
+            # A conversation may only appear once in a batch, since its extractions come from its previous turn.
+            if any(c == conversation_id for (c, _) in batch) or len(batch) == batch_size:
+                flush()
+            batch.append((conversation_id, text))
+    if batch:
+        flush()
+    return results
+
+
+def test_pool_async_and_batch_match_react() -> None:
+    for seed in range(3):
+        turns = script(seed)
+        np.random.seed(seed)
+        expected = play_dedicated(turns)
+        assert sum(1 for (actions, _) in expected if actions) > 5
+
+        np.random.seed(seed)
+        assert play_pool(turns) == expected
+        np.random.seed(seed)
+        assert play_pool(turns, batch_size=4) == expected
+        np.random.seed(seed)
+        assert play_dedicated(turns, use_async=True) == expected
+        # With lazy or indexed kickoff evaluation, the kickoff detectors that are not run make no extractions, so only
+        # the actions are the same.
+        for kickoff_evaluation in ["lazy", "indexed"]:
+            np.random.seed(seed)
+            results = play_dedicated(turns, use_async=True, kickoff_evaluation=kickoff_evaluation)
+            assert [actions for (actions, _) in results] == [actions for (actions, _) in expected]
+
+
+def test_state_round_trip() -> None:
+    np.random.seed(0)
+    shared = agendas()
+    puppeteer = Puppeteer(shared)
+    extractions = Extractions()
+    for text in ["start", "next"]:
+        (_, extractions) = puppeteer.react([MessageObservation(text)], extractions)
+    state = puppeteer.get_state()
+
+    # A fresh Puppeteer restored from the state continues exactly as the original one.
+    random_state = np.random.get_state()
+    texts = ["next", "what", "start", "next"]
+    expected = [result(puppeteer.react([MessageObservation(text)], extractions)) for text in texts]
+    assert any(actions for (actions, _) in expected)
+    restored = Puppeteer(shared)
+    restored.set_state(state)
+    np.random.set_state(random_state)
+    assert [result(restored.react([MessageObservation(text)], extractions)) for text in texts] == expected
+
+    # The snapshot is not modified by later turns, so the conversation can be continued from it again.
+    restored.set_state(state)
+    np.random.set_state(random_state)
+    assert [result(restored.react([MessageObservation(text)], extractions)) for text in texts] == expected
+
+
+def test_pool_errors() -> None:
+    pool = PuppeteerPool(agendas())
+    pool.create("a")
+    assert "a" in pool and len(pool) == 1
+    for f in [lambda: pool.create("a"), lambda: pool.evict("b"),
+              lambda: pool.react("b", [MessageObservation("start")], Extractions())]:
+        try:
+            f()
+            assert False
+        except ValueError:
+            pass
+    pool.evict("a")
+    assert "a" not in pool and len(pool) == 0
+    try:
+        pool.evict("a")
+        assert False
+    except ValueError:
+        pass
+
+
+if __name__ == "__main__":
+    test_pool_async_and_batch_match_react()
+    test_state_round_trip()
+    test_pool_errors()
@@ -0,0 +1,114 @@
+import tempfile
+from os.path import join
+from typing import List, Optional
+
+from puppeteer import (
+    Action,
+    Agenda,
+    Extractions,
+    MessageObservation,
+    Puppeteer,
+    SnipsEngine,
+    SpacyEngine,
+    State,
+    Trigger,
+    TriggerDetectorLoader,
+    metrics_registry
+)
+from helpers import write_intent
+
+
+class LineSplitter:
+    """Stands in for the default Spacy model, splitting texts into sentences at line breaks."""
+
+    def get_sentences(self, text: str) -> List[str]:
+        return [line for line in text.split("\n") if line]
+
+
+def parses() -> float:
+    metric = metrics_registry().metric("puppeteer_snips_parses_total")
+    return 0 if metric is None else metric.value()
+
+
+def agenda(name: str, kickoff: str, transition: str, loader: Optional[TriggerDetectorLoader] = None) -> Agenda:
+    agenda = Agenda(name)
+    agenda.add_kickoff_trigger(Trigger(kickoff))
+    agenda.add_transition_trigger(Trigger(transition))
+    for i in range(2):
+        agenda.add_state(State("s%d" % i))
+        agenda.add_action(Action("%s_a%d" % (name, i)))
+        agenda.add_action_for_state("%s_a%d" % (name, i), "s%d" % i)
+    agenda.add_transition("s0", transition, "s1")
+    agenda.set_start_state("s0")
+    agenda.add_terminus("s1")
+    if loader is None:
+        return agenda
+    for detector in loader.load(name, [transition]):
+        agenda.add_transition_trigger_detector(detector)
+    for detector in loader.load(name, [kickoff]):
+        agenda.add_kickoff_trigger_detector(detector)
+    return agenda
+
+
+def test_shared_snips_engine() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        write_intent(directory, "greet", ["hello there", "hi", "good morning", "hey"], ["what time is it", "bye"])
+        write_intent(directory, "pay", ["send me the money", "pay now", "transfer it"], ["hello there", "hi"])
+        write_intent(directory, "leave", ["bye", "goodbye", "see you later"], ["hello there", "pay now"])
+        SnipsEngine._engines.clear()
+        SpacyEngine._engines["en_core_web_lg"] = LineSplitter()  # type: ignore
+        try:
+            loader = TriggerDetectorLoader(default_snips_path=directory, shared_snips_engine=True)
+            loader.preload([("a", ["greet"]), ("a", ["pay"]), ("b", ["greet"]), ("b", ["leave"])])
+            assert len(SnipsEngine._engines) == 1
+            agendas = [agenda("a", "greet", "pay", loader), agenda("b", "greet", "leave", loader)]
+            # All agendas share a single detector, trained once on all intents.
+            detectors = {id(d) for a in agendas for d in a.kickoff_trigger_detectors + a.transition_trigger_detectors}
+            assert len(detectors) == 1
+            assert sorted(agendas[0].kickoff_trigger_detectors[0].trigger_names) == ["greet", "leave", "pay"]
+            assert len(SnipsEngine._engines) == 1
+
+            # Each sentence is parsed once per turn, for all agendas.
+            puppeteer = Puppeteer(agendas)
+            before = parses()
+            puppeteer.react([MessageObservation("hello there\ngood morning")], Extractions())
+            assert parses() == before + 2
+            assert puppeteer.detector_cache.misses == 1
+
+            # An agenda with new intents retrains the shared engine, for all agendas.
+            write_intent(directory, "ask", ["what time is it", "what is your name"], ["hi", "bye"])
+            detector = loader.load("c", ["ask"])[0]
+            assert detector is agendas[0].kickoff_trigger_detectors[0]
+            assert sorted(detector.trigger_names) == ["ask", "greet", "leave", "pay"]
+        finally:
+            SpacyEngine._engines.pop("en_core_web_lg")
+            SnipsEngine._engines.clear()
+
+
+def test_load_all() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        write_intent(directory, "greet", ["hello there", "hi", "good morning", "hey"], ["pay now", "bye"])
+        write_intent(directory, "pay", ["send me the money", "pay now", "transfer it"], ["hello there", "hi"])
+        write_intent(directory, "leave", ["bye", "goodbye", "see you later"], ["hello there", "pay now"])
+        filenames = [join(directory, "a.yaml"), join(directory, "b.yaml")]
+        agenda("a", "greet", "pay").store(filenames[0])
+        agenda("b", "greet", "leave").store(filenames[1])
+        SnipsEngine._engines.clear()
+        SpacyEngine._engines["en_core_web_lg"] = LineSplitter()  # type: ignore
+        try:
+            loader = TriggerDetectorLoader(default_snips_path=directory, shared_snips_engine=True)
+            agendas = Agenda.load_all(filenames, loader)
+            assert [a.name for a in agendas] == ["a", "b"]
+            # The triggers of all agendas are preloaded, so a single engine is trained on all intents.
+            assert len(SnipsEngine._engines) == 1
+            detectors = {id(d) for a in agendas for d in a.kickoff_trigger_detectors + a.transition_trigger_detectors}
+            assert len(detectors) == 1
+            assert sorted(agendas[1].transition_trigger_detectors[0].trigger_names) == ["greet", "leave", "pay"]
+        finally:
+            SpacyEngine._engines.pop("en_core_web_lg")
+            SnipsEngine._engines.clear()
+
+
+if __name__ == "__main__":
+    test_shared_snips_engine()
+    test_load_all()
@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+from typing import List
+
+from puppeteer import SnipsEngine, metrics_registry
+from helpers import write_intent
+
+
+def cache_counts() -> List[float]:
+    cache = metrics_registry().metric("puppeteer_snips_engine_cache_total")
+    return [0, 0] if cache is None else [cache.value("hit"), cache.value("miss")]
+
+
+def test_snips_cache() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        greet = write_intent(os.path.join(directory, "a"), "greet", ["hello there", "hi", "good morning"],
+                             ["what time is it", "bye"])
+        pay = write_intent(os.path.join(directory, "a"), "pay", ["send me the money", "pay now", "transfer it"],
+                           ["hello there", "what is your name"])
+        SnipsEngine.set_cache_directory(os.path.join(directory, "cache"))
+        try:
+            (hits, misses) = cache_counts()
+            SnipsEngine._engines.clear()
+            cold = SnipsEngine.load([greet, pay], None)
+            assert cache_counts() == [hits, misses + 1]
+            assert len(os.listdir(os.path.join(directory, "cache"))) == 1
+
+            # A new process, or a copy of the same training data elsewhere, reads the engine from the cache.
+            moved = shutil.copytree(os.path.join(directory, "a"), os.path.join(directory, "b"))
+            SnipsEngine._engines.clear()
+            warm = SnipsEngine.load([os.path.join(moved, "greet"), os.path.join(moved, "pay")], None)
+            assert cache_counts() == [hits + 1, misses + 1]
+            assert sorted(warm.intent_names) == ["greet", "pay"]
+            for text in ["hello there", "pay now", "what time is it"]:
+                assert warm._engine.parse(text) == cold._engine.parse(text)
+
+            # Changed training data gives a new key, and a new engine.
+            with open(os.path.join(pay, "pay.txt"), "a") as file:
+                file.write("wire the funds\n")
+            SnipsEngine._engines.clear()
+            SnipsEngine.load([greet, pay], None)
+            assert cache_counts() == [hits + 1, misses + 2]
+            assert len(os.listdir(os.path.join(directory, "cache"))) == 2
+        finally:
+            SnipsEngine.set_cache_directory(None)
+            SnipsEngine._engines.clear()
+
+
+def test_snips_load_many() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [write_intent(directory, name, ["%s one" % name, "%s two" % name], ["other"])
+                 for name in ["alpha", "beta", "gamma"]]
+        SnipsEngine._engines.clear()
+        try:
+            engines = SnipsEngine.load_many([[p] for p in paths] + [[paths[0]]], None, workers=2)
+            assert [e.intent_names for e in engines] == [["alpha"], ["beta"], ["gamma"], ["alpha"]]
+            assert engines[0] is engines[3]
+            # The engines are kept in memory, and found by load().
+            assert SnipsEngine.load([paths[1]], None) is engines[1]
+            sequential = SnipsEngine.load_many([[p] for p in paths], None, workers=1)
+            assert sequential == engines[:3]
+        finally:
+            SnipsEngine._engines.clear()
+
+
+def test_dataset_key() -> None:
+    dataset = {"intents": {"a": {"utterances": [{"data": [{"text": "x"}]}]}}, "entities": {}, "language": "en"}
+    reordered = {"language": "en", "entities": {}, "intents": dataset["intents"]}
+    changed = {"intents": {"a": {"utterances": [{"data": [{"text": "y"}]}]}}, "entities": {}, "language": "en"}
+    assert SnipsEngine.dataset_key(dataset) == SnipsEngine.dataset_key(reordered)
+    assert SnipsEngine.dataset_key(dataset) != SnipsEngine.dataset_key(changed)
+
+
+if __name__ == "__main__":
+    test_snips_cache()
+    test_snips_load_many()
+    test_dataset_key()
@@ -0,0 +1,59 @@
+import threading
+from typing import Any, List
+
+from puppeteer import SpacyEngine
+from helpers import fake_engine
+
+
+def test_prefetched() -> None:
+    engine = fake_engine()
+    SpacyEngine._engines["fake"] = engine
+    try:
+        with SpacyEngine.prefetched(["a\nb", "c"]):
+            assert engine.get_sentences("a\nb") == ["a", "b"]
+            assert engine.get_sentences("c") == ["c"]
+            assert engine._nlp.calls == 0
+            # Texts that were not prefetched are processed one by one.
+            assert engine.get_sentences("d") == ["d"]
+            assert engine._nlp.calls == 1
+        # Prefetched results are discarded at the end of the batch.
+        assert engine.get_sentences("c") == ["c"]
+        assert engine._nlp.calls == 2
+    finally:
+        del SpacyEngine._engines["fake"]
+
+
+def test_prefetched_is_scoped_to_thread() -> None:
+    engine = fake_engine()
+    SpacyEngine._engines["fake"] = engine
+    inside = threading.Event()
+    done = threading.Event()
+    seen: List[Any] = []
+
+    def batch() -> None:
+        with SpacyEngine.prefetched(["a"]):
+            inside.set()
+            done.wait(10)
+            calls = engine._nlp.calls
+            seen.append(engine.get_sentences("a"))
+            seen.append(engine._nlp.calls - calls)
+
+    thread = threading.Thread(target=batch)
+    thread.start()
+    try:
+        assert inside.wait(10)
+        # Another thread neither sees the batch, nor discards it when its own batch ends.
+        with SpacyEngine.prefetched(["b"]):
+            calls = engine._nlp.calls
+            assert engine.get_sentences("a") == ["a"]
+            assert engine._nlp.calls == calls + 1
+    finally:
+        done.set()
+        thread.join()
+        del SpacyEngine._engines["fake"]
+    assert seen == [["a"], 0]
+
+
+if __name__ == "__main__":
+    test_prefetched()
+    test_prefetched_is_scoped_to_thread()
@@ -0,0 +1,260 @@
+import random
+from typing import Dict, List
+
+import numpy as np
+
+from puppeteer import (
+    Action,
+    Agenda,
+    AgendaState,
+    BatchedStateStore,
+    DefaultStateProbabilities,
+    Extractions,
+    State,
+    Trigger,
+    TriggerProbabilities,
+    VectorizedStateProbabilities
+)
+
+
+class FixedTriggerProbabilities(TriggerProbabilities):
+    """Trigger probabilities set directly by the test, rather than by trigger detectors."""
+
+    def __init__(self, agenda: Agenda, probabilities: Dict[str, float], non_trigger_prob: float) -> None:
+        super(FixedTriggerProbabilities, self).__init__(agenda)
+        self._probabilities.update(probabilities)
+        self._non_trigger_prob = non_trigger_prob
+
+    def update(self, observations, old_extractions, detector_cache=None) -> Extractions:
+        return Extractions()
+
+
+class ProgressState:
+    """The parts of an AgendaState read by DefaultAgendaPolicy.made_progress(), set directly by the test."""
+
+    def __init__(self, transition_trigger_probabilities: TriggerProbabilities,
+                 state_probabilities: DefaultStateProbabilities) -> None:
+        self.transition_trigger_probabilities = transition_trigger_probabilities
+        self.state_probabilities = state_probabilities
+
+
+def random_agenda(rng: random.Random) -> Agenda:
+    """Returns an agenda with random states, triggers, transitions (including self-loops) and actions."""
+    agenda = Agenda("random")
+    num_states = rng.randint(1, 25)
+    num_triggers = rng.randint(1, 6)
+    states = ["s%d" % i for i in range(num_states)]
+    triggers = ["t%d" % i for i in range(num_triggers)]
+    for name in states:
+        agenda.add_state(State(name))
+        agenda.add_action(Action("a_" + name))
+        agenda.add_action_for_state("a_" + name, name)
+    for name in triggers:
+        agenda.add_transition_trigger(Trigger(name))
+    density = rng.random()
+    for start in states:
+        for trigger in triggers:
+            if rng.random() < density:
+                agenda.add_transition(start, trigger, rng.choice(states))
+    agenda.set_start_state(rng.choice(states))
+    for name in states:
+        if rng.random() < 0.3:
+            agenda.add_terminus(name)
+    return agenda
+
+
+def random_value(rng: random.Random) -> float:
+    """Returns a random probability, often exactly at or close to the thresholds used by the update."""
+    return rng.choice([0.0, 0.0, 1.0, 0.05, 0.05 - 1e-17, 0.05 + 1e-17, 0.1, 0.5, rng.random(), rng.random()])
+
+
+def random_trigger_probabilities(rng: random.Random, agenda: Agenda) -> FixedTriggerProbabilities:
+    probabilities = {t.name: random_value(rng) for t in agenda.transition_triggers}
+    return FixedTriggerProbabilities(agenda, probabilities, random_value(rng))
+
+
+def random_state(rng: random.Random, agenda: Agenda) -> List[float]:
+    return [random_value(rng) * rng.choice([1.0, 1.0, 1.5]) for _ in range(len(agenda.states) + 1)]
+
+
+def assert_equivalent(default: DefaultStateProbabilities, vectorized: VectorizedStateProbabilities) -> None:
+    assert list(default.probabilities) == list(vectorized.probabilities)
+    expected = np.array(list(default.probabilities.values()))
+    actual = np.array(list(vectorized.probabilities.values()))
+    # State probabilities are computed with the same floating-point operations, in the same order. The ERROR_STATE
+    # probability is computed in closed form, and may differ by rounding.
+    assert np.array_equal(expected[:-1], actual[:-1]), (expected, actual)
+    assert np.allclose(expected[-1], actual[-1], rtol=1e-12, atol=1e-12), (expected, actual)
+
+
+def name_keyed_update(agenda: Agenda, probabilities: Dict[str, float], trigger_probabilities: TriggerProbabilities,
+                      actions: List[Action]) -> Dict[str, float]:
+    """The state update of DefaultStateProbabilities, looking up states, transitions and actions by name in the
+    agenda rather than in its compiled form."""
+    if actions and not actions[-1] in agenda.actions:
+        return probabilities
+    trigger_map = trigger_probabilities.probabilities
+    p_event = 1.0 - trigger_probabilities.non_trigger_prob
+    new_probabilities = {st: 0.0 for st in agenda.state_names}
+    new_probabilities["ERROR_STATE"] = 0.0
+    for st in agenda.state_names:
+        to_move = probabilities[st] * p_event
+        new_probabilities[st] = max(0.05, probabilities[st] - to_move, new_probabilities[st])
+    for st in agenda.state_names:
+        to_move = probabilities[st] * p_event
+        if round(to_move, 1) > 0.0:
+            for event in trigger_map:
+                trans_prob = to_move * trigger_map[event]
+                if event in agenda.transition_trigger_names(st):
+                    st2 = agenda.transition_end_state_name(st, event)
+                    new_probabilities[st2] = new_probabilities[st2] + trans_prob
+                    new_probabilities["ERROR_STATE"] = max(0.05, new_probabilities["ERROR_STATE"] - trans_prob)
+                else:
+                    new_probabilities[st] = max(0.05, probabilities[st] - trigger_map[event])
+                    new_probabilities["ERROR_STATE"] = new_probabilities["ERROR_STATE"] + trans_prob
+    return new_probabilities
+
+
+def test_compiled_update_is_equivalent() -> None:
+    rng = random.Random(4)
+    for _ in range(300):
+        agenda = random_agenda(rng)
+        default = DefaultStateProbabilities(agenda)
+        if rng.random() < 0.5:
+            default.set_state(random_state(rng, agenda))
+        expected = dict(default.probabilities)
+        for _ in range(rng.randint(1, 8)):
+            trigger_probabilities = random_trigger_probabilities(rng, agenda)
+            actions = rng.choice([[], agenda.actions[:1], [Action("foreign")]])
+            expected = name_keyed_update(agenda, expected, trigger_probabilities, actions)
+            default.update(trigger_probabilities, actions)
+            assert default.probabilities == expected
+
+
+def test_compiled_agenda_is_invalidated() -> None:
+    agenda = Agenda("mutated")
+    agenda.add_transition_trigger(Trigger("next"))
+    for name in ["s0", "s1"]:
+        agenda.add_state(State(name))
+        agenda.add_action(Action("a_" + name))
+        agenda.add_action_for_state("a_" + name, name)
+    agenda.set_start_state("s0")
+    DefaultStateProbabilities(agenda).update(FixedTriggerProbabilities(agenda, {"next": 1.0}, 0.0), [])
+    compiled = agenda.compile()
+    assert agenda.compile() is compiled
+
+    # A state and a transition added after compile() are seen by the next update.
+    agenda.add_state(State("s2"))
+    assert agenda.compile() is not compiled
+    compiled = agenda.compile()
+    agenda.add_transition("s0", "next", "s2")
+    assert agenda.compile() is not compiled
+    default = DefaultStateProbabilities(agenda)
+    initial = dict(default.probabilities)
+    trigger_probabilities = FixedTriggerProbabilities(agenda, {"next": 1.0}, 0.0)
+    default.update(trigger_probabilities, [])
+    assert default.probabilities == name_keyed_update(agenda, initial, trigger_probabilities, [])
+    assert default.probability("s2") > 1.0 > default.probability("s0")
+
+    # So is a new start state.
+    compiled = agenda.compile()
+    agenda.set_start_state("s1")
+    assert agenda.compile() is not compiled
+    default.reset()
+    assert default.probability("s1") == 1.0 and default.probability("s0") == 0.0
+    initial = dict(default.probabilities)
+    default.update(trigger_probabilities, [])
+    # There is no transition from s1, so the probability moves to the error state rather than to s2.
+    assert default.probabilities == name_keyed_update(agenda, initial, trigger_probabilities, [])
+    assert default.probability("ERROR_STATE") == 1.0 and default.probability("s2") == 0.05
+
+
+def test_vectorized_update_is_equivalent() -> None:
+    rng = random.Random(0)
+    for _ in range(500):
+        agenda = random_agenda(rng)
+        default = DefaultStateProbabilities(agenda)
+        vectorized = VectorizedStateProbabilities(agenda)
+        if rng.random() < 0.5:
+            state = random_state(rng, agenda)
+            default.set_state(state)
+            vectorized.set_state(state)
+        assert_equivalent(default, vectorized)
+        for _ in range(rng.randint(1, 8)):
+            trigger_probabilities = random_trigger_probabilities(rng, agenda)
+            actions = rng.choice([[], agenda.actions[:1], [Action("foreign")]])
+            default.update(trigger_probabilities, actions)
+            vectorized.update(trigger_probabilities, actions)
+            assert_equivalent(default, vectorized)
+        default.reset()
+        vectorized.reset()
+        assert_equivalent(default, vectorized)
+
+
+def test_vectorized_state_round_trip() -> None:
+    agenda = random_agenda(random.Random(1))
+    vectorized = VectorizedStateProbabilities(agenda)
+    state = random_state(random.Random(2), agenda)
+    vectorized.set_state(state)
+    assert vectorized.get_state() == state
+    for (name, p) in zip(vectorized.probabilities, state):
+        assert vectorized.probability(name) == p
+
+
+def test_batched_update_is_equivalent() -> None:
+    rng = random.Random(3)
+    progress_seen = set()
+    for _ in range(100):
+        agenda = random_agenda(rng)
+        store = BatchedStateStore(agenda, capacity=4)
+        conversations = {}
+        for c in range(rng.randint(1, 12)):
+            conversation_id = "c%d" % c
+            conversations[conversation_id] = DefaultStateProbabilities(agenda)
+            store.add(conversation_id)
+            if rng.random() < 0.5:
+                state = random_state(rng, agenda)
+                conversations[conversation_id].set_state(state)
+                store.set_state(conversation_id, state)
+        for _ in range(rng.randint(1, 8)):
+            conversation_ids = rng.sample(sorted(conversations), rng.randint(1, len(conversations)))
+            trigger_probabilities = [random_trigger_probabilities(rng, agenda) for _ in conversation_ids]
+            last_actions = [rng.choice([None, agenda.actions[0], Action("foreign")]) for _ in conversation_ids]
+            for (conversation_id, t, a) in zip(conversation_ids, trigger_probabilities, last_actions):
+                conversations[conversation_id].update(t, [] if a is None else [a])
+            store.update(conversation_ids,
+                         np.array([[t.probabilities[name] for name in store.trigger_names]
+                                   for t in trigger_probabilities]),
+                         np.array([t.non_trigger_prob for t in trigger_probabilities]),
+                         last_actions)
+            for (conversation_id, default) in conversations.items():
+                expected = np.array(default.get_state())
+                actual = np.array(store.get_state(conversation_id))
+                assert np.array_equal(expected[:-1], actual[:-1]), (expected, actual)
+                assert np.allclose(expected[-1], actual[-1], rtol=1e-12, atol=1e-12), (expected, actual)
+
+            # Compare is_done() on the exact same probabilities, as the ERROR_STATE may differ by rounding.
+            agenda_state = AgendaState(agenda)
+            for (conversation_id, done) in zip(conversations, store.is_done(list(conversations))):
+                agenda_state.state_probabilities.set_state(store.get_state(conversation_id))
+                assert done == agenda.policy.is_done(agenda_state)
+
+            # Likewise for made_progress(), with non-trigger probabilities at and around its limit.
+            non_trigger_probs = [rng.choice([0.0, 0.4, 0.4 + 1e-12, 1.0, rng.random()]) for _ in conversations]
+            progress = store.made_progress(list(conversations), np.array(non_trigger_probs))
+            for (conversation_id, non_trigger_prob, made_progress) in zip(conversations, non_trigger_probs, progress):
+                state_probabilities = DefaultStateProbabilities(agenda)
+                state_probabilities.set_state(store.get_state(conversation_id))
+                progress_state = ProgressState(FixedTriggerProbabilities(agenda, {}, non_trigger_prob),
+                                               state_probabilities)
+                assert made_progress == agenda.policy.made_progress(progress_state)
+                progress_seen.add(bool(made_progress))
+    assert progress_seen == {False, True}
+
+
+if __name__ == "__main__":
+    test_compiled_update_is_equivalent()
+    test_compiled_agenda_is_invalidated()
+    test_vectorized_update_is_equivalent()
+    test_vectorized_state_round_trip()
+    test_batched_update_is_equivalent()
@@ -0,0 +1,59 @@
+import tempfile
+from os.path import join
+from typing import List, Set
+
+from puppeteer import Agenda, TriggerDetectorLoader, generate_agenda
+from helpers import KeywordTriggerDetector
+
+
+def reachable(agenda: Agenda) -> Set[str]:
+    """Returns the names of the states reachable from the start state."""
+    seen = {agenda.start_state.name}
+    todo: List[str] = [agenda.start_state.name]
+    while todo:
+        for end in agenda.transition_connected_state_names(todo.pop()):
+            if end not in seen:
+                seen.add(end)
+                todo.append(end)
+    return seen
+
+
+def test_generate_agenda() -> None:
+    agenda = generate_agenda("synthetic", 30, 5, branching=3, num_termini=4, actions_per_state=2,
+                             stall_actions_per_state=1, num_kickoff_triggers=2, seed=7)
+    assert len(agenda.states) == 30
+    assert len(agenda.terminus_names) == 4
+    assert reachable(agenda) == set(agenda.state_names)
+    for state_name in agenda.state_names:
+        if state_name not in agenda.terminus_names:
+            # Termini beyond the first may get extra transitions.
+            assert len(agenda.transition_trigger_names(state_name)) >= 3
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = join(directory, "synthetic.yaml")
+        agenda.store(filename)
+        loader = TriggerDetectorLoader()
+        loader.register_detector(KeywordTriggerDetector([t.name for t in agenda.transition_triggers]))
+        loader.register_detector(KeywordTriggerDetector([t.name for t in agenda.kickoff_triggers]))
+        loaded = Agenda.load(filename, loader)
+    assert loaded._to_dict() == agenda._to_dict()
+    assert reachable(loaded) == set(loaded.state_names)
+    assert len(loaded.transition_trigger_detectors) == 1 and len(loaded.kickoff_trigger_detectors) == 1
+
+    # The same seed gives the same agenda.
+    assert generate_agenda("synthetic", 30, 5, branching=3, num_termini=4, actions_per_state=2,
+                           stall_actions_per_state=1, num_kickoff_triggers=2, seed=7)._to_dict() == agenda._to_dict()
+
+
+def test_generate_agenda_arguments() -> None:
+    for (num_states, num_triggers, branching, num_termini) in [(3, 2, 1, 3), (3, 2, 3, 1), (3, 1, 1, 2)]:
+        try:
+            generate_agenda("synthetic", num_states, num_triggers, branching=branching, num_termini=num_termini)
+            assert False
+        except ValueError:
+            pass
+
+
+if __name__ == "__main__":
+    test_generate_agenda()
+    test_generate_agenda_arguments()
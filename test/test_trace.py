@@ -0,0 +1,78 @@
+import io
+
+from puppeteer import (
+    Extractions,
+    MessageObservation,
+    Puppeteer,
+    Trace,
+    dump_binary,
+    dump_jsonl,
+    load_binary,
+    load_jsonl
+)
+from puppeteer.logging import Logger
+
+from helpers import chain_agenda
+
+
+def conversation_traces(log_level: int = Logger.DEBUG):
+    puppeteer = Puppeteer([chain_agenda()], log_level=log_level)
+    extractions = Extractions()
+    extractions.add_extraction("first_name", "Mr")
+    traces = []
+    for text in ["start", "next", "what", "next", "next", "bye"]:
+        (_, new_extractions) = puppeteer.react([MessageObservation(text)], extractions)
+        extractions.update(new_extractions)
+        traces.append((puppeteer.trace.copy(), puppeteer.log))
+    return traces
+
+
+def test_trace_events() -> None:
+    (trace, log) = conversation_traces()[1]
+    kinds = [kind for (kind, _, _) in trace]
+    for kind in [Trace.OBSERVATION, Trace.EXTRACTION, Trace.DETECTOR, Trace.TRIGGER_PROBABILITIES,
+                 Trace.STATE_PROBABILITIES, Trace.MESSAGE, Trace.ACTION]:
+        assert kind in kinds
+    assert trace.render() == log
+    detectors = [data for (kind, _, data) in trace if kind == Trace.DETECTOR]
+    assert (["next"], {"next": 1.0}, 0.0, {"text_next": "next"}) in [tuple(d) for d in detectors]
+    assert [data for (kind, _, data) in trace if kind == Trace.OBSERVATION] == [("text: 'next',",)]
+
+
+def test_trace_levels() -> None:
+    for ((debug, _), (info, info_log)) in zip(conversation_traces(), conversation_traces(Logger.INFO)):
+        assert all(level >= Logger.INFO for (_, level, _) in info)
+        assert info.render() == info_log
+        filtered = Trace()
+        for (kind, level, data) in debug:
+            if level >= Logger.INFO:
+                filtered.append(kind, level, data)
+        assert filtered.render() == info_log
+    for (trace, log) in conversation_traces(Logger.DISABLED):
+        assert len(trace) == 0
+        assert log is None
+
+
+def test_trace_serialization() -> None:
+    traces = [trace for (trace, _) in conversation_traces()]
+    text = io.StringIO()
+    binary = io.BytesIO()
+    for trace in traces:
+        dump_jsonl(trace, text)
+        dump_binary(trace, binary)
+    text.seek(0)
+    binary.seek(0)
+    from_jsonl = list(load_jsonl(text))
+    from_binary = list(load_binary(binary))
+    assert len(from_jsonl) == len(from_binary) == len(traces)
+    for (trace, t1, t2) in zip(traces, from_jsonl, from_binary):
+        assert t1.render() == t2.render() == trace.render()
+        assert t1 == t2
+        assert t1.to_dicts() == trace.to_dicts()
+    assert len(binary.getvalue()) < len(text.getvalue())
+
+
+if __name__ == "__main__":
+    test_trace_events()
+    test_trace_levels()
+    test_trace_serialization()
@@ -0,0 +1,106 @@
+import os
+import tempfile
+import threading
+
+from puppeteer import Extractions, MessageObservation, PuppeteerPool, Trace, TraceSink, load_binary, load_jsonl
+
+from helpers import chain_agenda
+
+
+def small_trace(text: str) -> Trace:
+    trace = Trace()
+    trace.append(Trace.OBSERVATION, 20, (text,))
+    return trace
+
+
+def test_sampling_and_ring_buffer() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        with TraceSink(directory, sample_rate=0.25, ring_size=3) as sink:
+            conversation_ids = ["conversation-%d" % i for i in range(2000)]
+            sampled = [c for c in conversation_ids if sink.is_sampled(c)]
+            assert 400 < len(sampled) < 600
+            assert sampled == [c for c in conversation_ids if sink.is_sampled(c)]
+            unsampled = next(c for c in conversation_ids if not sink.is_sampled(c))
+
+            for turn in range(5):
+                sink.record(sampled[0], small_trace("sampled %d" % turn))
+                sink.record(unsampled, small_trace("unsampled %d" % turn))
+            assert [t.metadata["turn"] for t in sink.recent(unsampled)] == [2, 3, 4]
+            assert sink.flush(timeout=10.0)
+            assert sink.written == 5
+
+            # Flagging writes the turns in the ring buffer, and all later turns.
+            sink.flag(unsampled)
+            sink.record(unsampled, small_trace("unsampled 5"))
+            sink.forget(unsampled)
+            assert sink.recent(unsampled) == []
+            assert not sink.is_sampled(unsampled)
+        with open(sink.files[0], "rb") as file:
+            traces = list(load_binary(file))
+        texts = [data[0] for trace in traces for (_, _, data) in trace]
+        assert texts == ["sampled %d" % turn for turn in range(5)] + ["unsampled %d" % turn for turn in range(2, 6)]
+        assert traces[0].metadata["conversation_id"] == sampled[0]
+
+
+def test_rotation() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        with TraceSink(directory, sample_rate=1.0, file_format="jsonl", max_file_bytes=1000, max_files=3,
+                       batch_size=7) as sink:
+            for turn in range(200):
+                sink.record("conversation", small_trace("turn %d" % turn))
+        assert sink.written == 200
+        assert len(sink.files) == 3
+        assert all(os.path.getsize(f) < 1200 for f in sink.files)
+        turns = []
+        for path in sink.files:
+            with open(path, "r") as file:
+                turns.extend(t.metadata["turn"] for t in load_jsonl(file))
+        assert turns == list(range(200 - len(turns), 200))
+
+
+def test_overflow_policies() -> None:
+    for overflow in TraceSink.OVERFLOW_POLICIES:
+        with tempfile.TemporaryDirectory() as directory:
+            with TraceSink(directory, sample_rate=1.0, queue_size=4, overflow=overflow, batch_size=2) as sink:
+                def run(thread: int) -> None:
+                    for turn in range(500):
+                        sink.record("conversation-%d" % thread, small_trace("turn %d" % turn))
+
+                threads = [threading.Thread(target=run, args=(thread,)) for thread in range(4)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            assert sink.written + sink.dropped == 2000
+            assert sink.errors == 0
+            written = 0
+            for path in sink.files:
+                with open(path, "rb") as file:
+                    written += len(list(load_binary(file)))
+            assert written == sink.written
+
+
+def test_pool_records_traces() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        with TraceSink(directory, sample_rate=1.0) as sink:
+            pool = PuppeteerPool([chain_agenda()], trace_sink=sink)
+            extractions = Extractions()
+            logs = []
+            for conversation_id in ["a", "b"]:
+                pool.create(conversation_id)
+                for text in ["start", "next"]:
+                    pool.react(conversation_id, [MessageObservation(text)], extractions)
+                    logs.append(pool.log)
+                pool.evict(conversation_id)
+        with open(sink.files[0], "rb") as file:
+            traces = list(load_binary(file))
+        assert [(t.metadata["conversation_id"], t.metadata["turn"]) for t in traces] == \
+            [("a", 0), ("a", 1), ("b", 0), ("b", 1)]
+        assert [t.render() for t in traces] == logs
+
+
+if __name__ == "__main__":
+    test_sampling_and_ring_buffer()
+    test_rotation()
+    test_overflow_policies()
+    test_pool_records_traces()
@@ -0,0 +1,78 @@
+import io
+import itertools
+import os
+import tempfile
+from typing import Dict, List
+
+from puppeteer import TranscriptGenerator, UtteranceSampler, read_transcripts, write_transcripts
+from helpers import chain_agenda
+
+
+def write_examples(directory: str, examples: Dict[str, List[str]]) -> None:
+    """Writes example files in the Snips training data layout, e.g., "next.txt" and "NOTnext.txt" in "next"."""
+    for (filename, lines) in examples.items():
+        folder = os.path.join(directory, "intents", filename[3:] if filename.startswith("NOT") else filename)
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, "%s.txt" % filename), "w") as file:
+            file.write("\n".join(lines) + "\n")
+
+
+def test_transcript_walks() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        write_examples(directory, {
+            "start": ["Let's start.", "Begin please."],
+            "next": ["Go on.", "And then?"],
+            "NOTnext": ["Stop right there."],
+        })
+        generator = TranscriptGenerator([chain_agenda()], UtteranceSampler([directory]), noise_rate=0.3,
+                                        concurrency=5, seed=7)
+        turns = list(generator.turns(conversations=20))
+
+    # All conversations are complete, and each one walks the chain from the start to the terminus.
+    by_conversation: Dict[str, List[dict]] = {}
+    for turn in turns:
+        by_conversation.setdefault(turn["conversation_id"], []).append(turn)
+    assert len(by_conversation) == 20
+    for conversation in by_conversation.values():
+        assert [t["turn"] for t in conversation] == list(range(len(conversation)))
+        assert conversation[0]["kind"] == "kickoff" and conversation[0]["text"] in ["Let's start.", "Begin please."]
+        assert [t["last"] for t in conversation] == [False] * (len(conversation) - 1) + [True]
+        transitions = [t for t in conversation if t["kind"] == "transition"]
+        assert [t["state"] for t in transitions] == ["s1", "s2", "s3"]
+        assert all(t["trigger"] == "next" and t["text"] in ["Go on.", "And then?"] for t in transitions)
+        noise = [t for t in conversation if t["kind"] == "noise"]
+        assert all(t["trigger"] is None and t["text"] == "Stop right there." for t in noise)
+
+    # Conversations are interleaved, and there are noise turns.
+    assert [t["conversation_id"] for t in turns[:20]] != sorted(t["conversation_id"] for t in turns[:20])
+    assert any(t["kind"] == "noise" for t in turns)
+
+
+def test_transcript_seed() -> None:
+    def generate(seed: int) -> List[dict]:
+        generator = TranscriptGenerator([chain_agenda()], noise_rate=0.5, concurrency=3, seed=seed)
+        return list(generator.turns(turns=50))
+
+    assert generate(1) == generate(1)
+    assert generate(1) != generate(2)
+    # Without training data, utterances are the trigger names.
+    assert all(t["text"] == t["trigger"] for t in generate(1) if t["kind"] != "noise")
+
+
+def test_transcript_streaming() -> None:
+    # Turns are generated lazily, so an unbounded generator can be consumed in part.
+    generator = TranscriptGenerator([chain_agenda()], max_turns=3, concurrency=100)
+    turns = list(itertools.islice(generator.turns(), 1000))
+    assert len(turns) == 1000
+    assert all(t["turn"] < 3 for t in turns)
+
+    file = io.StringIO()
+    assert write_transcripts(turns, file) == 1000
+    file.seek(0)
+    assert list(read_transcripts(file)) == turns
+
+
+if __name__ == "__main__":
+    test_transcript_walks()
+    test_transcript_seed()
+    test_transcript_streaming()
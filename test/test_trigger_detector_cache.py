@@ -0,0 +1,87 @@
+from typing import Dict, List, Tuple
+
+from puppeteer import (
+    Action,
+    Agenda,
+    Extractions,
+    MessageObservation,
+    Observation,
+    Puppeteer,
+    State,
+    Trigger,
+    TriggerDetectorCache
+)
+from helpers import KeywordTriggerDetector
+
+
+class CountingTriggerDetector(KeywordTriggerDetector):
+    """KeywordTriggerDetector counting its calls."""
+
+    def __init__(self, trigger_names: List[str]) -> None:
+        super(CountingTriggerDetector, self).__init__(trigger_names)
+        self.calls = 0
+
+    def trigger_probabilities(self, observations: List[Observation],
+                              old_extractions: Extractions) -> Tuple[Dict[str, float], float, Extractions]:
+        self.calls += 1
+        return super(CountingTriggerDetector, self).trigger_probabilities(observations, old_extractions)
+
+
+def two_state_agenda(name: str, kickoff: KeywordTriggerDetector, transition: KeywordTriggerDetector) -> Agenda:
+    agenda = Agenda(name)
+    agenda.add_kickoff_trigger(Trigger("start"))
+    agenda.add_transition_trigger(Trigger("next"))
+    for i in range(2):
+        agenda.add_state(State("s%d" % i))
+        agenda.add_action(Action("%s_a%d" % (name, i)))
+        agenda.add_action_for_state("%s_a%d" % (name, i), "s%d" % i)
+    agenda.add_transition("s0", "next", "s1")
+    agenda.set_start_state("s0")
+    agenda.add_terminus("s1")
+    agenda.add_kickoff_trigger_detector(kickoff)
+    agenda.add_transition_trigger_detector(transition)
+    return agenda
+
+
+def test_cache() -> None:
+    detector = CountingTriggerDetector(["start", "next"])
+    cache = TriggerDetectorCache()
+    first = cache.trigger_probabilities(detector, [MessageObservation("start")], Extractions())
+    assert cache.trigger_probabilities(detector, [MessageObservation("start")], Extractions()) is first
+    assert detector.calls == 1 and cache.misses == 1 and cache.hits == 1
+
+    # After clear(), results are computed again, from the new observations.
+    cache.clear()
+    (trigger_map, _, _) = cache.trigger_probabilities(detector, [MessageObservation("next")], Extractions())
+    assert trigger_map == {"next": 1.0}
+    assert detector.calls == 2 and cache.misses == 2 and cache.hits == 1
+
+    cache.add(CountingTriggerDetector(["other"]), ({}, 1.0, Extractions()))
+    assert cache.misses == 3
+    cache.reset_counters()
+    assert cache.misses == 0 and cache.hits == 0
+
+
+def test_shared_detector_runs_once_per_turn() -> None:
+    # The shared detector is the kickoff detector of both agendas, and the transition detector of the first one.
+    shared = CountingTriggerDetector(["start", "next"])
+    other = CountingTriggerDetector(["next"])
+    puppeteer = Puppeteer([two_state_agenda("a", shared, shared), two_state_agenda("b", shared, other)])
+
+    (actions, _) = puppeteer.react([MessageObservation("start")], Extractions())
+    [started] = [a.name.split("_")[0] for a in actions]
+    assert shared.calls == 1 and other.calls == 1
+    # Four lookups, of which two are served from the cache.
+    assert puppeteer.detector_cache.misses == 2 and puppeteer.detector_cache.hits == 2
+
+    # The cache is cleared between turns, so that the detectors see the new observations. With last turn's results,
+    # "next" would not be detected, and the agenda would not move on.
+    (actions, _) = puppeteer.react([MessageObservation("next")], Extractions())
+    assert shared.calls == 2 and other.calls == 2
+    assert puppeteer.detector_cache.misses == 4 and puppeteer.detector_cache.hits == 4
+    assert [a.name for a in actions] == ["%s_a1" % started]
+
+
+if __name__ == "__main__":
+    test_cache()
+    test_shared_detector_runs_once_per_turn()
@@ -0,0 +1,150 @@
+import threading
+import time
+from typing import List
+
+from puppeteer import (
+    Action,
+    Agenda,
+    Extractions,
+    MessageObservation,
+    Puppeteer,
+    SpacyEngine,
+    State,
+    Trigger,
+    TriggerDetector,
+    Warmup,
+    WarmupTriggerDetectorLoader,
+    metrics_registry
+)
+from helpers import KeywordTriggerDetector, fake_engine
+
+
+class GatedTriggerDetector(KeywordTriggerDetector):
+    """KeywordTriggerDetector whose load() waits until the gate is opened, or for at most 10 seconds."""
+
+    def __init__(self, trigger_names: List[str], gate: threading.Event) -> None:
+        super(GatedTriggerDetector, self).__init__(trigger_names)
+        self._gate = gate
+        self.loads = 0
+
+    def load(self) -> None:
+        self._gate.wait(10)
+        self.loads += 1
+
+
+class FailingTriggerDetector(KeywordTriggerDetector):
+    def load(self) -> None:
+        raise OSError("Model not found")
+
+
+def fallbacks(fallback: str) -> float:
+    metric = metrics_registry().metric("puppeteer_detector_fallbacks_total")
+    return 0 if metric is None else metric.value(fallback)
+
+
+def test_warmup_no_trigger_fallback() -> None:
+    gate = threading.Event()
+    with Warmup() as warmup:
+        deferred = warmup.defer(lambda: GatedTriggerDetector(["start"], gate), ["start"])
+        assert deferred.trigger_names == ["start"]
+        assert warmup.state == "loading" and not deferred.ready
+        before = fallbacks("no_trigger")
+        (probabilities, non_probability, _) = deferred.trigger_probabilities([MessageObservation("start")],
+                                                                            Extractions())
+        assert probabilities == {} and non_probability == 1.0
+        assert fallbacks("no_trigger") == before + 1
+
+        gate.set()
+        assert warmup.wait(10)
+        assert warmup.status() == {"loading": 0, "ready": 1, "failed": 0}
+        (probabilities, _, extractions) = deferred.trigger_probabilities([MessageObservation("start")], Extractions())
+        assert probabilities == {"start": 1.0}
+        assert extractions.extraction("text_start") == "start"
+
+
+def test_warmup_block_fallback() -> None:
+    gate = threading.Event()
+    with Warmup() as warmup:
+        deferred = warmup.defer(lambda: GatedTriggerDetector(["start"], gate), ["start"], "block", timeout=0.05)
+        start = time.perf_counter()
+        assert deferred.trigger_probabilities([MessageObservation("start")], Extractions())[0] == {}
+        assert time.perf_counter() - start >= 0.05
+
+        # Without a timeout, a blocked call returns as soon as the detector is ready.
+        unbounded = warmup.defer(lambda: GatedTriggerDetector(["start"], gate), ["start"], "block")
+        threading.Timer(0.05, gate.set).start()
+        assert unbounded.trigger_probabilities([MessageObservation("start")], Extractions())[0] == {"start": 1.0}
+
+
+def test_warmup_failure() -> None:
+    with Warmup() as warmup:
+        deferred = warmup.defer(lambda: FailingTriggerDetector(["start"]), ["start"], "block")
+        assert not warmup.wait(10)
+        assert warmup.state == "failed" and deferred.state == "failed"
+        assert isinstance(deferred.error, OSError)
+        assert warmup.errors() == [(["start"], deferred.error)]
+        assert deferred.trigger_probabilities([MessageObservation("start")], Extractions())[0] == {}
+
+
+def test_warmup_spacy() -> None:
+    engine = fake_engine()
+    SpacyEngine._engines["fake"] = engine
+    try:
+        with Warmup() as warmup:
+            warmup.load_spacy("fake")
+            assert warmup.wait(10) and warmup.status() == {"loading": 0, "ready": 1, "failed": 0}
+            assert engine._nlp.calls > 0
+            # A model that cannot be loaded fails the warmup.
+            warmup.load_spacy("no_such_model")
+            assert not warmup.wait(10)
+            assert warmup.state == "failed"
+    finally:
+        del SpacyEngine._engines["fake"]
+
+
+def test_warmup_loader() -> None:
+    gate = threading.Event()
+    with Warmup() as warmup:
+        start = GatedTriggerDetector(["start"], gate)
+        next_ = GatedTriggerDetector(["next"], gate)
+        loader = WarmupTriggerDetectorLoader(warmup)
+        loader.register_detector(start)
+        loader.register_detector(next_)
+        kickoff: List[TriggerDetector] = loader.load("chain", ["start"])
+        transition = loader.load("chain", ["next"])
+        # Detectors used by several agendas are deferred, and loaded, only once.
+        assert loader.load("other", ["start"]) == kickoff
+        assert warmup.detectors == kickoff + transition
+
+        # Conversations are served, in degraded mode, while the detectors load.
+        agenda = Agenda("deferred")
+        agenda.add_kickoff_trigger(Trigger("start"))
+        agenda.add_transition_trigger(Trigger("next"))
+        for i in range(2):
+            agenda.add_state(State("s%d" % i))
+            agenda.add_action(Action("a%d" % i))
+            agenda.add_action_for_state("a%d" % i, "s%d" % i)
+        agenda.add_transition("s0", "next", "s1")
+        agenda.set_start_state("s0")
+        agenda.add_terminus("s1")
+        for detector in kickoff:
+            agenda.add_kickoff_trigger_detector(detector)
+        for detector in transition:
+            agenda.add_transition_trigger_detector(detector)
+        puppeteer = Puppeteer([agenda])
+        (actions, _) = puppeteer.react([MessageObservation("start")], Extractions())
+        assert actions == []
+
+        gate.set()
+        assert warmup.wait(10)
+        assert start.loads == 1 and next_.loads == 1
+        (actions, _) = puppeteer.react([MessageObservation("start")], Extractions())
+        assert [a.name for a in actions] == ["a0"]
+
+
+if __name__ == "__main__":
+    test_warmup_no_trigger_fallback()
+    test_warmup_block_fallback()
+    test_warmup_failure()
+    test_warmup_spacy()
+    test_warmup_loader()
@@ -0,0 +1,561 @@
+import json
+import struct
+import sys
+from array import array
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
+
+class Trace:
+    """Structured trace of a turn of a conversation.
+
+    A trace is a sequence of events, recorded by a Logger as a Puppeteer reacts. Each event has a kind, a level (see
+    Logger) and data, a tuple whose contents depend on the kind:
+
+        BEGIN:                  (format, args) -- Start of a section, with a header line.
+        END:                    () -- End of the latest started section.
+        MESSAGE:                (format, args) -- A free-form line, e.g., a policy decision.
+        OBSERVATION:            (text,) -- An input observation, as a string.
+        EXTRACTION:             (name, value) -- An input or output extraction.
+        DETECTOR:               (trigger_names, trigger_map, non_trigger_prob, extractions) -- The output of a
+                                trigger detector.
+        TRIGGER_PROBABILITIES:  (probabilities, non_trigger_prob) -- Final trigger probabilities of an agenda.
+        STATE_PROBABILITIES:    (probabilities,) -- Updated state probabilities of an agenda.
+        ACTION:                 (name, text) -- An output action.
+
+    Free-form lines are kept as %-style format strings with arguments, so that they can be told apart without
+    parsing the rendered text. The render() method renders a trace to the text format of the Puppeteer log.
+
+    Events are stored in a buffer that is allocated once and reused when the trace is cleared, growing only when a
+    turn has more events than any turn before. A trace is therefore overwritten by the next turn. Use copy() to keep
+    it, or write it with dump_jsonl() or dump_binary().
+
+    The metadata attribute holds a dictionary of JSON-compatible values describing the trace, e.g., the conversation
+    id and turn number set by a TraceSink. It is written and read along with the events.
+    """
+
+    BEGIN = 0
+    END = 1
+    MESSAGE = 2
+    OBSERVATION = 3
+    EXTRACTION = 4
+    DETECTOR = 5
+    TRIGGER_PROBABILITIES = 6
+    STATE_PROBABILITIES = 7
+    ACTION = 8
+    KIND_NAMES = ("begin", "end", "message", "observation", "extraction", "detector", "trigger_probabilities",
+                  "state_probabilities", "action")
+
+    INDENT_SIZE = 4
+
+    def __init__(self, capacity: int = 256) -> None:
+        """Initializes a new, empty Trace.
+
+        Args:
+            capacity: Initial number of events that fit in the buffer.
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be positive, got %d" % capacity)
+        self._kinds = array("B", bytes(capacity))
+        self._levels = array("B", bytes(capacity))
+        self._data: List[Optional[Tuple[Any, ...]]] = [None] * capacity
+        self._size = 0
+        self.metadata: Dict[str, Any] = {}
+
+    def __len__(self) -> int:
+        """Returns the number of events in the trace."""
+        return self._size
+
+    def __iter__(self) -> Iterator[Tuple[int, int, Tuple[Any, ...]]]:
+        """Iterates over the events of the trace, as (kind, level, data) tuples."""
+        for i in range(self._size):
+            yield (self._kinds[i], self._levels[i], self._data[i])
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, Trace) and self.metadata == other.metadata and list(self) == list(other)
+
+    def append(self, kind: int, level: int, data: Tuple[Any, ...]) -> None:
+        """Appends an event to the trace.
+
+        Args:
+            kind: The event kind, e.g., Trace.MESSAGE.
+            level: The event level, e.g., Logger.INFO.
+            data: The event data. See class documentation.
+        """
+        i = self._size
+        if i == len(self._data):
+            self._kinds.extend(self._kinds)
+            self._levels.extend(self._levels)
+            self._data.extend([None] * i)
+        self._kinds[i] = kind
+        self._levels[i] = level
+        self._data[i] = data
+        self._size = i + 1
+
+    def last_kind(self) -> Optional[int]:
+        """Returns the kind of the last event, or None if the trace is empty."""
+        return self._kinds[self._size - 1] if self._size > 0 else None
+
+    def pop(self) -> None:
+        """Removes the last event."""
+        if self._size == 0:
+            raise ValueError("Cannot pop from an empty trace")
+        self._size -= 1
+
+    def clear(self) -> None:
+        """Removes all events and metadata, keeping the buffer."""
+        self._size = 0
+        if self.metadata:
+            self.metadata = {}
+
+    def copy(self) -> "Trace":
+        """Returns a copy of the trace."""
+        trace = Trace(max(1, self._size))
+        for (kind, level, data) in self:
+            trace.append(kind, level, data)
+        trace.metadata = dict(self.metadata)
+        return trace
+
+    def render(self) -> Optional[str]:
+        """Renders the trace to indented text lines, as in the Puppeteer log.
+
+        Section headers are only rendered for sections that render at least one line.
+
+        Returns:
+            The rendered text, or None if there is nothing to render.
+        """
+        lines: List[str] = []
+        # Headers of started sections. Headers are rendered when the first line of their section is rendered.
+        headers: List[str] = []
+        rendered = 0
+        for (kind, _, data) in self:
+            if kind == Trace.BEGIN:
+                headers.append(_format(data[0], data[1]))
+            elif kind == Trace.END:
+                headers.pop()
+                rendered = min(rendered, len(headers))
+            else:
+                for (indent_level, line) in _RENDERERS[kind](data):
+                    while rendered < len(headers):
+                        lines.append(" " * rendered * self.INDENT_SIZE + headers[rendered])
+                        rendered += 1
+                    lines.append(" " * (len(headers) + indent_level) * self.INDENT_SIZE + line)
+        return "\n".join(lines) if lines else None
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Returns the events of the trace as JSON-compatible dictionaries.
+
+        Arguments and values that are not numbers, strings, booleans, None, lists or dictionaries are converted to
+        strings.
+        """
+        return [_to_dict(kind, level, data) for (kind, level, data) in self]
+
+    @staticmethod
+    def from_dicts(dicts: List[Dict[str, Any]]) -> "Trace":
+        """Returns a trace from events as returned by to_dicts().
+
+        Args:
+            dicts: The events.
+
+        Returns:
+            The trace.
+        """
+        trace = Trace(max(1, len(dicts)))
+        for d in dicts:
+            (kind, data) = _from_dict(d)
+            trace.append(kind, d["level"], data)
+        return trace
+
+    def to_bytes(self) -> bytes:
+        """Returns the trace in a packed binary format.
+
+        The format starts with a table of all distinct strings in the trace, which are then referred to by index. The
+        format is not self-delimiting. See dump_binary() for writing many traces to a file.
+        """
+        return _BinaryWriter().pack(self)
+
+    @staticmethod
+    def from_bytes(b: bytes) -> "Trace":
+        """Returns a trace from its packed binary format, as returned by to_bytes().
+
+        Args:
+            b: The packed trace.
+
+        Returns:
+            The trace.
+        """
+        return _BinaryReader(b).unpack()
+
+
+def dump_jsonl(trace: Trace, file: TextIO) -> None:
+    """Writes a trace to a JSON Lines file, as a single line.
+
+    Args:
+        trace: The trace.
+        file: The file, opened in text mode.
+    """
+    d: Dict[str, Any] = {"events": trace.to_dicts()}
+    if trace.metadata:
+        d["metadata"] = _plain(trace.metadata)
+    file.write(json.dumps(d, separators=(",", ":")))
+    file.write("\n")
+
+
+def load_jsonl(file: TextIO) -> Iterator[Trace]:
+    """Reads traces from a JSON Lines file, as written by dump_jsonl().
+
+    Args:
+        file: The file, opened in text mode.
+
+    Returns:
+        An iterator over the traces in the file.
+    """
+    for line in file:
+        if line.strip():
+            d = json.loads(line)
+            trace = Trace.from_dicts(d["events"])
+            trace.metadata = d.get("metadata", {})
+            yield trace
+
+
+_RECORD_HEADER = struct.Struct("<4sI")
+_MAGIC = b"PTR1"
+
+
+def dump_binary(trace: Trace, file: BinaryIO) -> None:
+    """Writes a trace to a binary file, as a length-prefixed record in the packed binary format.
+
+    Args:
+        trace: The trace.
+        file: The file, opened in binary mode.
+    """
+    b = trace.to_bytes()
+    file.write(_RECORD_HEADER.pack(_MAGIC, len(b)))
+    file.write(b)
+
+
+def load_binary(file: BinaryIO) -> Iterator[Trace]:
+    """Reads traces from a binary file, as written by dump_binary().
+
+    Args:
+        file: The file, opened in binary mode.
+
+    Returns:
+        An iterator over the traces in the file.
+    """
+    while True:
+        header = file.read(_RECORD_HEADER.size)
+        if not header:
+            return
+        if len(header) < _RECORD_HEADER.size:
+            raise ValueError("Truncated trace record header")
+        (magic, length) = _RECORD_HEADER.unpack(header)
+        if magic != _MAGIC:
+            raise ValueError("Not a trace record: %r" % magic)
+        b = file.read(length)
+        if len(b) < length:
+            raise ValueError("Truncated trace record")
+        yield Trace.from_bytes(b)
+
+
+def _format(fmt: str, args: Tuple[Any, ...]) -> str:
+    return fmt % args if args else fmt
+
+
+def _render_detector(data: Tuple[Any, ...]) -> List[Tuple[int, str]]:
+    (trigger_names, trigger_map, _, extractions) = data
+    lines = []
+    if extractions:
+        lines.append((1, "Extractions"))
+        lines.extend((2, "%s: %s" % (name, value)) for (name, value) in extractions.items())
+    if trigger_map:
+        lines.append((1, "Triggers"))
+        lines.extend((2, "%s: %.3f" % (name, p)) for (name, p) in trigger_map.items())
+    if lines:
+        lines.insert(0, (0, "Trigger detector with trigger names %s" % (trigger_names,)))
+    return lines
+
+
+def _render_probabilities(header: str, probabilities: Dict[str, float]) -> List[Tuple[int, str]]:
+    if not probabilities:
+        return []
+    return [(0, header)] + [(1, "%s: %.3f" % (name, p)) for (name, p) in probabilities.items()]
+
+
+def _render_trigger_probabilities(data: Tuple[Any, ...]) -> List[Tuple[int, str]]:
+    lines = _render_probabilities("Final trigger probabilities", data[0])
+    lines.append((1, "no trigger: %.3f" % data[1]))
+    return lines
+
+
+_RENDERERS: Dict[int, Callable[[Tuple[Any, ...]], List[Tuple[int, str]]]] = {
+    Trace.MESSAGE: lambda data: [(0, _format(data[0], data[1]))],
+    Trace.OBSERVATION: lambda data: [(0, str(data[0]))],
+    Trace.EXTRACTION: lambda data: [(0, "%s: '%s'" % data)],
+    Trace.DETECTOR: _render_detector,
+    Trace.TRIGGER_PROBABILITIES: _render_trigger_probabilities,
+    Trace.STATE_PROBABILITIES: lambda data: _render_probabilities("Updated state probabilities", data[0]),
+    Trace.ACTION: lambda data: [(0, "%s: '%s'" % data)],
+}
+
+
+def _plain(value: Any) -> Any:
+    """Returns a JSON-compatible version of a value."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _plain(v) for (k, v) in value.items()}
+    return str(value)
+
+
+def _to_dict(kind: int, level: int, data: Tuple[Any, ...]) -> Dict[str, Any]:
+    d: Dict[str, Any] = {"kind": Trace.KIND_NAMES[kind], "level": level}
+    if kind == Trace.BEGIN or kind == Trace.MESSAGE:
+        d["format"] = data[0]
+        d["args"] = _plain(data[1])
+    elif kind == Trace.OBSERVATION:
+        d["text"] = str(data[0])
+    elif kind == Trace.EXTRACTION:
+        d["name"] = data[0]
+        d["value"] = _plain(data[1])
+    elif kind == Trace.DETECTOR:
+        d["trigger_names"] = list(data[0])
+        d["triggers"] = dict(data[1])
+        d["non_trigger_prob"] = data[2]
+        d["extractions"] = _plain(data[3])
+    elif kind == Trace.TRIGGER_PROBABILITIES:
+        d["probabilities"] = dict(data[0])
+        d["non_trigger_prob"] = data[1]
+    elif kind == Trace.STATE_PROBABILITIES:
+        d["probabilities"] = dict(data[0])
+    elif kind == Trace.ACTION:
+        d["name"] = data[0]
+        d["text"] = data[1]
+    return d
+
+
+def _from_dict(d: Dict[str, Any]) -> Tuple[int, Tuple[Any, ...]]:
+    kind = Trace.KIND_NAMES.index(d["kind"])
+    if kind == Trace.BEGIN or kind == Trace.MESSAGE:
+        return kind, (d["format"], tuple(d["args"]))
+    if kind == Trace.END:
+        return kind, ()
+    if kind == Trace.OBSERVATION:
+        return kind, (d["text"],)
+    if kind == Trace.EXTRACTION:
+        return kind, (d["name"], d["value"])
+    if kind == Trace.DETECTOR:
+        return kind, (d["trigger_names"], d["triggers"], d["non_trigger_prob"], d["extractions"])
+    if kind == Trace.TRIGGER_PROBABILITIES:
+        return kind, (d["probabilities"], d["non_trigger_prob"])
+    if kind == Trace.STATE_PROBABILITIES:
+        return kind, (d["probabilities"],)
+    return kind, (d["name"], d["text"])
+
+
+# Tags of values in the packed binary format.
+_NONE = 0
+_FALSE = 1
+_TRUE = 2
+_INT = 3
+_FLOAT = 4
+_STR = 5
+_LIST = 6
+_DICT = 7
+
+_F64 = struct.Struct("<d")
+
+
+class _BinaryWriter:
+    """Packs a trace into the packed binary format.
+
+    Counts, string indices and integers are written as unsigned LEB128 varints, integers being zigzag-encoded first.
+    Probabilities are written as little-endian doubles, so that values are preserved exactly.
+    """
+
+    def __init__(self) -> None:
+        self._strings: Dict[str, int] = {}
+        self._out = bytearray()
+
+    def pack(self, trace: Trace) -> bytes:
+        out = self._out
+        self._value(_plain(trace.metadata))
+        for (kind, level, data) in trace:
+            out.append(kind)
+            out.append(level)
+            if kind == Trace.BEGIN or kind == Trace.MESSAGE:
+                self._string(data[0])
+                self._value(_plain(data[1]))
+            elif kind == Trace.OBSERVATION:
+                self._string(str(data[0]))
+            elif kind == Trace.EXTRACTION:
+                self._string(data[0])
+                self._value(_plain(data[1]))
+            elif kind == Trace.DETECTOR:
+                self._varint(len(data[0]))
+                for name in data[0]:
+                    self._string(name)
+                self._probabilities(data[1])
+                out += _F64.pack(data[2])
+                self._value(_plain(data[3]))
+            elif kind == Trace.TRIGGER_PROBABILITIES:
+                self._probabilities(data[0])
+                out += _F64.pack(data[1])
+            elif kind == Trace.STATE_PROBABILITIES:
+                self._probabilities(data[0])
+            elif kind == Trace.ACTION:
+                self._string(data[0])
+                self._string(data[1])
+        events = bytes(out)
+        out.clear()
+        self._varint(len(self._strings))
+        self._varint(len(trace))
+        for s in self._strings:
+            b = s.encode("utf-8")
+            self._varint(len(b))
+            out += b
+        return bytes(out) + events
+
+    def _varint(self, n: int) -> None:
+        while n >= 0x80:
+            self._out.append((n & 0x7f) | 0x80)
+            n >>= 7
+        self._out.append(n)
+
+    def _string(self, s: str) -> None:
+        index = self._strings.get(s)
+        if index is None:
+            index = len(self._strings)
+            self._strings[s] = index
+        self._varint(index)
+
+    def _probabilities(self, probabilities: Dict[str, float]) -> None:
+        self._varint(len(probabilities))
+        for name in probabilities:
+            self._string(name)
+        values = array("d", probabilities.values())
+        if sys.byteorder == "big":
+            values.byteswap()
+        self._out += values.tobytes()
+
+    def _value(self, value: Any) -> None:
+        out = self._out
+        if value is None:
+            out.append(_NONE)
+        elif value is True or value is False:
+            out.append(_TRUE if value else _FALSE)
+        elif isinstance(value, int):
+            out.append(_INT)
+            self._varint(2 * value if value >= 0 else -2 * value - 1)
+        elif isinstance(value, float):
+            out.append(_FLOAT)
+            out += _F64.pack(value)
+        elif isinstance(value, str):
+            out.append(_STR)
+            self._string(value)
+        elif isinstance(value, list):
+            out.append(_LIST)
+            self._varint(len(value))
+            for v in value:
+                self._value(v)
+        else:
+            out.append(_DICT)
+            self._varint(len(value))
+            for (k, v) in value.items():
+                self._string(k)
+                self._value(v)
+
+
+class _BinaryReader:
+    """Unpacks a trace from the packed binary format."""
+
+    def __init__(self, b: bytes) -> None:
+        self._b = b
+        self._pos = 0
+        self._strings: List[str] = []
+
+    def unpack(self) -> Trace:
+        num_strings = self._varint()
+        num_events = self._varint()
+        for _ in range(num_strings):
+            length = self._varint()
+            self._strings.append(self._b[self._pos:self._pos + length].decode("utf-8"))
+            self._pos += length
+        trace = Trace(max(1, num_events))
+        trace.metadata = self._value()
+        for _ in range(num_events):
+            kind = self._b[self._pos]
+            level = self._b[self._pos + 1]
+            self._pos += 2
+            if kind == Trace.BEGIN or kind == Trace.MESSAGE:
+                data: Tuple[Any, ...] = (self._string(), tuple(self._value()))
+            elif kind == Trace.END:
+                data = ()
+            elif kind == Trace.OBSERVATION:
+                data = (self._string(),)
+            elif kind == Trace.EXTRACTION:
+                data = (self._string(), self._value())
+            elif kind == Trace.DETECTOR:
+                trigger_names = [self._string() for _ in range(self._varint())]
+                data = (trigger_names, self._probabilities(), self._f64(), self._value())
+            elif kind == Trace.TRIGGER_PROBABILITIES:
+                data = (self._probabilities(), self._f64())
+            elif kind == Trace.STATE_PROBABILITIES:
+                data = (self._probabilities(),)
+            elif kind == Trace.ACTION:
+                data = (self._string(), self._string())
+            else:
+                raise ValueError("Unknown trace event kind: %d" % kind)
+            trace.append(kind, level, data)
+        if self._pos != len(self._b):
+            raise ValueError("Trailing data after trace")
+        return trace
+
+    def _varint(self) -> int:
+        n = 0
+        shift = 0
+        while True:
+            byte = self._b[self._pos]
+            self._pos += 1
+            n |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return n
+            shift += 7
+
+    def _f64(self) -> float:
+        (value,) = _F64.unpack_from(self._b, self._pos)
+        self._pos += _F64.size
+        return value
+
+    def _string(self) -> str:
+        return self._strings[self._varint()]
+
+    def _probabilities(self) -> Dict[str, float]:
+        names = [self._string() for _ in range(self._varint())]
+        end = self._pos + 8 * len(names)
+        values = array("d", self._b[self._pos:end])
+        if sys.byteorder == "big":
+            values.byteswap()
+        self._pos = end
+        return dict(zip(names, values.tolist()))
+
+    def _value(self) -> Any:
+        tag = self._b[self._pos]
+        self._pos += 1
+        if tag == _NONE:
+            return None
+        if tag == _FALSE or tag == _TRUE:
+            return tag == _TRUE
+        if tag == _INT:
+            n = self._varint()
+            return n // 2 if n % 2 == 0 else -(n + 1) // 2
+        if tag == _FLOAT:
+            return self._f64()
+        if tag == _STR:
+            return self._string()
+        if tag == _LIST:
+            return [self._value() for _ in range(self._varint())]
+        if tag == _DICT:
+            return {self._string(): self._value() for _ in range(self._varint())}
+        raise ValueError("Unknown value tag: %d" % tag)
@@ -0,0 +1,372 @@
+import os
+import re
+import threading
+import time
+import zlib
+from collections import deque
+from typing import BinaryIO, Deque, Dict, List, Optional, Set, TextIO, Union
+
+from .trace import Trace, dump_binary, dump_jsonl
+
+
+class TraceSink:
+    """Writes turn traces to local files in the background, for a sample of the conversations.
+
+    A TraceSink keeps traces off the react() path. Recording a trace, through record(), only copies it and hands it
+    over to a background writer thread, which serializes the traces and writes them to files in batches. The cost of
+    recording a trace is therefore bounded, and the react() path never waits for any I/O.
+
+    Conversations are sampled up front ("head-based" sampling): the decision to trace a conversation is made from a
+    hash of its id, so all turns of a sampled conversation are traced, and the same conversations are sampled every
+    time. Conversations can also be flagged, using flag(), to be traced regardless of sampling, e.g., to investigate a
+    reported problem.
+
+    In addition, the last turns of every conversation, sampled or not, are kept in an in-memory ring buffer, available
+    through recent(). Flagging a conversation writes the turns in its ring buffer, so that the turns leading up to a
+    problem can be traced after the fact. Call forget() when a conversation is finished, to release its ring buffer.
+
+    Records waiting to be written are held in a bounded queue. When the queue is full, the overflow policy decides
+    what happens to a new record:
+
+        "drop_newest": The new record is dropped. This is the default.
+        "drop_oldest": The oldest queued record is dropped to make room for the new one.
+        "block": The caller waits for room in the queue for at most block_timeout seconds, and then drops the record.
+
+    The number of dropped records is available through the dropped property.
+
+    Traces are written to files named <prefix>-<number>.<extension> in the given directory, in the packed binary
+    format of dump_binary() or as JSON Lines as by dump_jsonl(). The metadata of each written trace holds the
+    conversation id, the turn number within the conversation and the time of the turn. A new file is started when the
+    current file exceeds max_file_bytes, and the oldest files are removed to keep at most max_files files.
+
+    A TraceSink may be shared by Puppeteers running on different threads. It should be closed, using close() or a with
+    statement, to write all queued records.
+    """
+
+    DROP_NEWEST = "drop_newest"
+    DROP_OLDEST = "drop_oldest"
+    BLOCK = "block"
+    OVERFLOW_POLICIES = (DROP_NEWEST, DROP_OLDEST, BLOCK)
+    FILE_FORMATS = ("binary", "jsonl")
+
+    def __init__(self, directory: str,
+                 sample_rate: float = 0.01,
+                 ring_size: int = 16,
+                 file_format: str = "binary",
+                 prefix: str = "traces",
+                 max_file_bytes: int = 64 * 1024 * 1024,
+                 max_files: int = 16,
+                 queue_size: int = 4096,
+                 overflow: str = DROP_NEWEST,
+                 block_timeout: float = 0.001,
+                 batch_size: int = 256,
+                 flush_interval: float = 1.0) -> None:
+        """Initializes a new TraceSink, and starts its writer thread.
+
+        Args:
+            directory: The directory to write trace files to. It is created if it does not exist.
+            sample_rate: The fraction of conversations to trace, between 0 and 1.
+            ring_size: The number of turns to keep in memory for each conversation. Zero disables the ring buffers.
+            file_format: One of "binary" and "jsonl".
+            prefix: The prefix of the file names.
+            max_file_bytes: The size of a file at which a new file is started.
+            max_files: The maximum number of files to keep.
+            queue_size: The maximum number of records waiting to be written.
+            overflow: The overflow policy, one of "drop_newest", "drop_oldest" and "block".
+            block_timeout: The maximum number of seconds to wait for room in the queue with the "block" policy.
+            batch_size: The maximum number of records written in one batch.
+            flush_interval: The maximum number of seconds between a record being queued and written.
+        """
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError("sample_rate must be between 0 and 1, got %f" % sample_rate)
+        if ring_size < 0:
+            raise ValueError("ring_size must be non-negative, got %d" % ring_size)
+        if file_format not in self.FILE_FORMATS:
+            raise ValueError("Unknown file format: %s" % file_format)
+        if max_file_bytes < 1:
+            raise ValueError("max_file_bytes must be positive, got %d" % max_file_bytes)
+        if max_files < 1:
+            raise ValueError("max_files must be positive, got %d" % max_files)
+        if queue_size < 1:
+            raise ValueError("queue_size must be positive, got %d" % queue_size)
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy: %s" % overflow)
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive, got %d" % batch_size)
+        self._directory = directory
+        self._sample_threshold = int(sample_rate * 0x100000000)
+        self._ring_size = ring_size
+        self._file_format = file_format
+        self._prefix = prefix
+        self._extension = "bin" if file_format == "binary" else "jsonl"
+        self._max_file_bytes = max_file_bytes
+        self._max_files = max_files
+        self._queue_size = queue_size
+        self._overflow = overflow
+        self._block_timeout = block_timeout
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+
+        # Per-conversation state, guarded by _conversations_lock.
+        self._conversations_lock = threading.Lock()
+        self._flagged: Set[str] = set()
+        self._turns: Dict[str, int] = {}
+        self._rings: Dict[str, Deque[Trace]] = {}
+
+        # Queue of records to write, guarded by _lock.
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._queue: Deque[Trace] = deque()
+        self._writing = 0
+        self._flushing = 0
+        self._closed = False
+        self._dropped = 0
+        self._written = 0
+        self._errors = 0
+        self._last_error: Optional[Exception] = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._file: Optional[Union[TextIO, BinaryIO]] = None
+        self._file_number = max(self._file_numbers(), default=0)
+        self._thread = threading.Thread(target=self._run, name="TraceSink", daemon=True)
+        self._thread.start()
+
+    @property
+    def dropped(self) -> int:
+        """Returns the number of records dropped because the queue was full, or the sink was closed."""
+        return self._dropped
+
+    @property
+    def written(self) -> int:
+        """Returns the number of records written."""
+        return self._written
+
+    @property
+    def errors(self) -> int:
+        """Returns the number of batches that could not be written. See last_error."""
+        return self._errors
+
+    @property
+    def last_error(self) -> Optional[Exception]:
+        """Returns the latest error raised while writing, or None if there has been no error."""
+        return self._last_error
+
+    @property
+    def files(self) -> List[str]:
+        """Returns the paths of the trace files currently kept, oldest first."""
+        return [self._path(number) for number in sorted(self._file_numbers())]
+
+    def is_sampled(self, conversation_id: str) -> bool:
+        """Returns true if all turns of the given conversation are traced, through sampling or flagging.
+
+        Args:
+            conversation_id: The id of the conversation.
+        """
+        return conversation_id in self._flagged or \
+            zlib.crc32(conversation_id.encode("utf-8")) < self._sample_threshold
+
+    def flag(self, conversation_id: str, include_recent: bool = True) -> None:
+        """Flags a conversation, so that all its turns are traced from now on, regardless of sampling.
+
+        Args:
+            conversation_id: The id of the conversation.
+            include_recent: If true, and the conversation was not already traced, the turns in its ring buffer are
+                written too.
+        """
+        with self._conversations_lock:
+            already_sampled = self.is_sampled(conversation_id)
+            self._flagged.add(conversation_id)
+            recent = list(self._rings.get(conversation_id, ())) if include_recent and not already_sampled else []
+        for trace in recent:
+            self._enqueue(trace)
+
+    def unflag(self, conversation_id: str) -> None:
+        """Removes the flag of a conversation. Its turns are traced again only if it is sampled.
+
+        Args:
+            conversation_id: The id of the conversation.
+        """
+        with self._conversations_lock:
+            self._flagged.discard(conversation_id)
+
+    def recent(self, conversation_id: str) -> List[Trace]:
+        """Returns the traces of the last turns of a conversation, oldest first, as kept in its ring buffer.
+
+        Args:
+            conversation_id: The id of the conversation.
+        """
+        with self._conversations_lock:
+            return list(self._rings.get(conversation_id, ()))
+
+    def forget(self, conversation_id: str) -> None:
+        """Releases the ring buffer and other state kept for a finished conversation.
+
+        Args:
+            conversation_id: The id of the conversation.
+        """
+        with self._conversations_lock:
+            self._flagged.discard(conversation_id)
+            self._turns.pop(conversation_id, None)
+            self._rings.pop(conversation_id, None)
+
+    def record(self, conversation_id: str, trace: Trace) -> None:
+        """Records the trace of a turn of a conversation.
+
+        The trace is copied, so it may be reused by the caller, as the trace of a Puppeteer is. The copy is kept in the
+        ring buffer of the conversation, and queued for writing if the conversation is sampled. Empty traces, e.g.,
+        from Puppeteers with logging disabled, are ignored.
+
+        Args:
+            conversation_id: The id of the conversation.
+            trace: The trace of the turn.
+        """
+        if len(trace) == 0:
+            return
+        sampled = self.is_sampled(conversation_id)
+        if not sampled and self._ring_size == 0:
+            return
+        copy = trace.copy()
+        with self._conversations_lock:
+            turn = self._turns.get(conversation_id, 0)
+            self._turns[conversation_id] = turn + 1
+            copy.metadata = {"conversation_id": conversation_id, "turn": turn, "time": time.time()}
+            if self._ring_size > 0:
+                ring = self._rings.get(conversation_id)
+                if ring is None:
+                    ring = deque(maxlen=self._ring_size)
+                    self._rings[conversation_id] = ring
+                ring.append(copy)
+        if sampled:
+            self._enqueue(copy)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Waits until all queued records are written.
+
+        Args:
+            timeout: The maximum number of seconds to wait, or None to wait for as long as needed.
+
+        Returns:
+            True if all records were written, false if the timeout expired first.
+        """
+        with self._lock:
+            self._flushing += 1
+            try:
+                self._not_empty.notify()
+                return self._idle.wait_for(lambda: not self._queue and self._writing == 0, timeout=timeout)
+            finally:
+                self._flushing -= 1
+
+    def close(self) -> None:
+        """Writes all queued records, stops the writer thread and closes the current file.
+
+        Records recorded after the sink is closed are dropped.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+        self._thread.join()
+
+    def __enter__(self) -> "TraceSink":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def _enqueue(self, trace: Trace) -> None:
+        """Queues a record for writing, applying the overflow policy if the queue is full."""
+        with self._lock:
+            if self._closed:
+                self._dropped += 1
+                return
+            if len(self._queue) >= self._queue_size:
+                if self._overflow == self.DROP_OLDEST:
+                    self._queue.popleft()
+                    self._dropped += 1
+                else:
+                    room = self._overflow == self.BLOCK and self._not_full.wait_for(
+                        lambda: len(self._queue) < self._queue_size or self._closed, timeout=self._block_timeout)
+                    if not room or self._closed:
+                        self._dropped += 1
+                        return
+            self._queue.append(trace)
+            if len(self._queue) >= self._batch_size:
+                self._not_empty.notify()
+
+    def _run(self) -> None:
+        """Writer thread main loop."""
+        while True:
+            with self._lock:
+                self._not_empty.wait_for(
+                    lambda: len(self._queue) >= self._batch_size or self._flushing > 0 or self._closed,
+                    timeout=self._flush_interval)
+                batch = [self._queue.popleft() for _ in range(min(self._batch_size, len(self._queue)))]
+                self._writing = len(batch)
+                closed = self._closed and not self._queue
+                self._not_full.notify_all()
+            written = self._write(batch) if batch else 0
+            with self._lock:
+                self._writing = 0
+                self._written += written
+                if not self._queue:
+                    self._idle.notify_all()
+            if closed:
+                break
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, batch: List[Trace]) -> int:
+        """Writes a batch of records, rotating files as needed, and returns the number of records written."""
+        try:
+            if self._file is None:
+                self._open_next_file()
+            for trace in batch:
+                if self._file_format == "binary":
+                    dump_binary(trace, self._file)
+                else:
+                    dump_jsonl(trace, self._file)
+                if self._file.tell() >= self._max_file_bytes:
+                    self._open_next_file()
+            self._file.flush()
+            return len(batch)
+        except (OSError, ValueError) as e:
+            with self._lock:
+                self._errors += 1
+                self._last_error = e
+            if self._file is not None:
+                try:
+                    self._file.close()
+                except OSError:
+                    pass
+                self._file = None
+            return 0
+
+    def _open_next_file(self) -> None:
+        """Starts a new file, removing the oldest files if there are too many."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._file_number += 1
+        numbers = sorted(self._file_numbers())
+        for number in numbers[:max(0, len(numbers) - self._max_files + 1)]:
+            os.remove(self._path(number))
+        mode = "wb" if self._file_format == "binary" else "w"
+        self._file = open(self._path(self._file_number), mode)
+
+    def _path(self, number: int) -> str:
+        return os.path.join(self._directory, "%s-%06d.%s" % (self._prefix, number, self._extension))
+
+    def _file_numbers(self) -> List[int]:
+        """Returns the numbers of the existing trace files in the directory."""
+        pattern = re.compile(r"%s-(\d+)\.%s$" % (re.escape(self._prefix), self._extension))
+        numbers = []
+        for name in os.listdir(self._directory):
+            match = pattern.match(name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return numbers
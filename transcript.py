@@ -0,0 +1,280 @@
+import json
+import os
+import random
+from os.path import join
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+import yaml
+
+from .agenda import Agenda
+from .extractions import Extractions
+from .observation import Observation
+from .trigger_detector import TriggerDetector, TriggerDetectorLoader
+
+# Texts of noise turns, when no negative examples are available.
+FILLER_TEXTS = [
+    "Hello?",
+    "Sorry, what?",
+    "Ok.",
+    "Hmm, let me think about it.",
+    "Who is this?",
+    "I'm busy right now.",
+    "Can you repeat that?",
+    "Thanks.",
+]
+
+
+class UtteranceSampler:
+    """Samples utterances for triggers from Snips training folders.
+
+    The training data is laid out as documented in SnipsTriggerDetector: the examples for a trigger named "xyz" are in
+    a folder named "xyz", anywhere under one of the root paths, holding positive examples in "xyz.txt" and negative
+    examples in "NOTxyz.txt", one sentence per line. Example files are only read when first needed.
+
+    A trigger without training data is represented by its own name. This way, generated messages also fire the stub
+    trigger detectors used in benchmarks, which detect triggers whose names occur in message texts.
+    """
+
+    def __init__(self, snips_paths: Optional[List[str]] = None) -> None:
+        """Initializes a new UtteranceSampler.
+
+        Args:
+            snips_paths: Root paths of the training data. May be empty.
+        """
+        self._folders: Dict[str, str] = {}
+        for root_path in snips_paths or []:
+            for (root, dirs, _) in os.walk(root_path):
+                for d in sorted(dirs):
+                    self._folders.setdefault(d, join(root, d))
+        self._examples: Dict[Tuple[str, bool], List[str]] = {}
+
+    def has_examples(self, trigger_name: str) -> bool:
+        """Returns true if there is training data for the given trigger."""
+        return trigger_name in self._folders
+
+    def examples(self, trigger_name: str, positive: bool = True) -> List[str]:
+        """Returns the positive or negative examples of a trigger, or an empty list if there are none.
+
+        Args:
+            trigger_name: The name of the trigger.
+            positive: If true, returns the positive examples, otherwise the negative ones.
+        """
+        key = (trigger_name, positive)
+        examples = self._examples.get(key)
+        if examples is None:
+            examples = []
+            folder = self._folders.get(trigger_name)
+            if folder is not None:
+                path = join(folder, ("%s.txt" if positive else "NOT%s.txt") % trigger_name)
+                if os.path.isfile(path):
+                    with open(path, "r") as file:
+                        examples = [line.strip() for line in file if line.strip()]
+            self._examples[key] = examples
+        return examples
+
+    def positive(self, trigger_name: str, rng: random.Random) -> str:
+        """Returns a random utterance expressing a trigger.
+
+        Args:
+            trigger_name: The name of the trigger.
+            rng: The random generator to use.
+        """
+        examples = self.examples(trigger_name, positive=True)
+        return rng.choice(examples) if examples else trigger_name
+
+    def negative(self, trigger_names: List[str], rng: random.Random) -> str:
+        """Returns a random utterance that expresses none of the given triggers.
+
+        The utterance is a negative example of one of the triggers, or a filler text if there are none.
+
+        Args:
+            trigger_names: The names of the triggers.
+            rng: The random generator to use.
+        """
+        examples = self.examples(rng.choice(trigger_names), positive=False) if trigger_names else []
+        return rng.choice(examples) if examples else rng.choice(FILLER_TEXTS)
+
+
+class TranscriptGenerator:
+    """Generates synthetic conversations, as a stream of turns, by random walks over the state graphs of agendas.
+
+    Each conversation follows a single agenda, chosen at random. The first turn expresses one of the kickoff triggers of
+    the agenda. Each following turn either expresses a random transition trigger of the current state, moving the
+    expected state along the transition, or, with probability noise_rate, is a noise turn expressing none of the
+    triggers of the agenda. A conversation ends after reaching a terminus state, or after max_turns turns. Utterances
+    are sampled by an UtteranceSampler.
+
+    Up to concurrency conversations are in progress at the same time, and their turns are interleaved at random, as
+    in live traffic. Turns are generated lazily, so only the conversations in progress are held in memory, and any
+    number of turns can be generated. The same seed always gives the same turns.
+
+    Each turn is a dict with the following items:
+
+        conversation_id: The id of the conversation.
+        turn:            The number of the turn within the conversation, starting from 0.
+        text:            The message text.
+        agenda:          The name of the agenda followed by the conversation.
+        kind:            "kickoff", "transition" or "noise".
+        trigger:         The name of the trigger expressed by the message, or None for noise turns.
+        state:           The expected state of the agenda after the turn.
+        last:            True for the last turn of the conversation.
+    """
+
+    KICKOFF = "kickoff"
+    TRANSITION = "transition"
+    NOISE = "noise"
+
+    def __init__(self, agendas: List[Agenda],
+                 sampler: Optional[UtteranceSampler] = None,
+                 noise_rate: float = 0.1,
+                 max_turns: int = 20,
+                 concurrency: int = 1,
+                 seed: int = 0,
+                 id_prefix: str = "conversation") -> None:
+        """Initializes a new TranscriptGenerator.
+
+        Args:
+            agendas: The agendas to follow.
+            sampler: The source of utterances. By default, an UtteranceSampler without training data, representing
+                each trigger by its name.
+            noise_rate: The probability of a noise turn, after the first turn.
+            max_turns: The maximum number of turns of a conversation.
+            concurrency: The number of conversations in progress at the same time.
+            seed: The seed of the random generator.
+            id_prefix: The prefix of the conversation ids.
+        """
+        if not agendas:
+            raise ValueError("Need at least one agenda")
+        if not 0.0 <= noise_rate <= 1.0:
+            raise ValueError("noise_rate must be between 0 and 1, got %f" % noise_rate)
+        if max_turns < 1 or concurrency < 1:
+            raise ValueError("max_turns and concurrency must be at least 1, got %d and %d" % (max_turns, concurrency))
+        self._agendas = agendas
+        self._sampler = UtteranceSampler() if sampler is None else sampler
+        self._noise_rate = noise_rate
+        self._max_turns = max_turns
+        self._concurrency = concurrency
+        self._seed = seed
+        self._id_prefix = id_prefix
+
+    def turns(self, conversations: Optional[int] = None, turns: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Generates turns, until the given number of conversations or turns has been generated.
+
+        Args:
+            conversations: The number of conversations to generate. Conversations in progress when the turn limit is
+                reached are cut short.
+            turns: The number of turns to generate. If neither limit is given, turns are generated forever.
+
+        Returns:
+            An iterator over the turns.
+        """
+        rng = random.Random(self._seed)
+        active: List[Iterator[Dict[str, Any]]] = []
+        started = 0
+        generated = 0
+        while turns is None or generated < turns:
+            while len(active) < self._concurrency and (conversations is None or started < conversations):
+                conversation_id = "%s-%d" % (self._id_prefix, started)
+                active.append(self._conversation(conversation_id, rng.choice(self._agendas),
+                                                 random.Random(rng.getrandbits(64))))
+                started += 1
+            if not active:
+                return
+            i = rng.randrange(len(active))
+            turn = next(active[i])
+            if turn["last"]:
+                active[i] = active[-1]
+                active.pop()
+            generated += 1
+            yield turn
+
+    def _conversation(self, conversation_id: str, agenda: Agenda, rng: random.Random) -> Iterator[Dict[str, Any]]:
+        """Generates the turns of a conversation following the given agenda."""
+        compiled = agenda.compile()
+        kickoff_names = [t.name for t in agenda.kickoff_triggers]
+        state = compiled.start_state_name
+        for turn in range(self._max_turns):
+            last = turn == self._max_turns - 1
+            transitions = compiled.transitions[compiled.state_ids[state]]
+            if turn == 0 and kickoff_names:
+                (kind, trigger) = (self.KICKOFF, rng.choice(kickoff_names))
+                text = self._sampler.positive(trigger, rng)
+            elif turn == 0 or not transitions or rng.random() < self._noise_rate:
+                (kind, trigger) = (self.NOISE, None)
+                text = self._sampler.negative(list(compiled.trigger_names), rng)
+            else:
+                (kind, trigger) = (self.TRANSITION, rng.choice(sorted(transitions)))
+                text = self._sampler.positive(trigger, rng)
+                state = transitions[trigger]
+                last = last or state in compiled.terminus_names
+            yield {"conversation_id": conversation_id, "turn": turn, "text": text, "agenda": agenda.name,
+                   "kind": kind, "trigger": trigger, "state": state, "last": last}
+            if last:
+                return
+
+
+def write_transcripts(turns: Iterable[Dict[str, Any]], file: TextIO) -> int:
+    """Writes turns as JSON Lines, one turn per line.
+
+    Args:
+        turns: The turns, as generated by TranscriptGenerator.
+        file: The text file to write to.
+
+    Returns:
+        The number of turns written.
+    """
+    count = 0
+    for turn in turns:
+        file.write(json.dumps(turn))
+        file.write("\n")
+        count += 1
+    return count
+
+
+def read_transcripts(file: TextIO) -> Iterator[Dict[str, Any]]:
+    """Reads turns written by write_transcripts(), one at a time.
+
+    Args:
+        file: The text file to read from.
+
+    Returns:
+        An iterator over the turns.
+    """
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+class _NullTriggerDetector(TriggerDetector):
+    """Trigger detector never detecting anything, standing in for real detectors when only the agenda graph is used."""
+
+    def __init__(self, trigger_names: List[str]) -> None:
+        self._trigger_names = trigger_names
+
+    @property
+    def trigger_names(self) -> List[str]:
+        return list(self._trigger_names)
+
+    def trigger_probabilities(self, observations: List[Observation],
+                              old_extractions: Extractions) -> Tuple[Dict[str, float], float, Extractions]:
+        return {}, 1.0, Extractions()
+
+
+def load_agenda_graphs(filenames: List[str]) -> List[Agenda]:
+    """Loads agendas from files for their state graphs only, without loading any real trigger detectors.
+
+    Args:
+        filenames: The agenda files.
+
+    Returns:
+        The agendas, with trigger detectors that never detect anything.
+    """
+    agendas = []
+    for filename in filenames:
+        with open(filename, "r") as file:
+            d = yaml.load(file, Loader=yaml.FullLoader)
+        trigger_names = [t["name"] for t in d["transition_triggers"] + d["kickoff_triggers"]]
+        loader = TriggerDetectorLoader()
+        loader.register_detector(_NullTriggerDetector(trigger_names))
+        agendas.append(Agenda.load(filename, loader))
+    return agendas
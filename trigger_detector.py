@@ -1,11 +1,22 @@
 import abc
+import asyncio
 import os
 from typing import Dict, List, Optional, Tuple
 
 from .extractions import Extractions
+from .instrumentation import begin_detector_timing, end_timing
+from .metrics import metrics_registry
 from .nlu import SnipsEngine, SpacyEngine
 from .observation import Observation, MessageObservation
 
+# The result of a trigger detector call: trigger probabilities, non-trigger probability and new extractions.
+TriggerDetectorResult = Tuple[Dict[str, float], float, Extractions]
+
+_detector_runs = metrics_registry().counter("puppeteer_detector_runs_total",
+                                            "Trigger detector runs through a TriggerDetectorCache.")
+_detector_cache_hits = metrics_registry().counter("puppeteer_detector_cache_hits_total",
+                                                  "Trigger detector results served from a TriggerDetectorCache.")
+
 
 class TriggerDetector(abc.ABC):
     """Class detecting triggers in observations.
@@ -70,6 +81,102 @@ class TriggerDetector(abc.ABC):
         """
         raise NotImplementedError()
 
+    async def trigger_probabilities_async(self, observations: List[Observation],
+                                          old_extractions: Extractions) -> Tuple[Dict[str, float], float, Extractions]:
+        """Asynchronous version of trigger_probabilities().
+
+        This method is used by Puppeteer.react_async(). By default, it runs trigger_probabilities() in the default
+        executor of the running event loop, so that a slow detector does not block the event loop. Subclasses with
+        natively asynchronous detection, e.g., calling a remote NLU service, may override this method.
+
+        Args:
+            observations: New observations made this turn.
+            old_extractions: Extractions made during previous turns and, possibly, by external analysis in this turn.
+
+        Returns:
+            See documentation of trigger_probabilities().
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.trigger_probabilities, observations, old_extractions)
+
+
+class TriggerDetectorCache:
+    """Turn-scoped cache of trigger detector results.
+
+    The same TriggerDetector object is often used by several agendas, and sometimes both as a kickoff and a transition
+    trigger detector for the same agenda. Within a turn, it is always called with the same observations and
+    extractions, so there is no need to run it more than once. A TriggerDetectorCache keeps the results of the
+    detectors run in the current turn, keyed by detector identity, so that each distinct detector runs at most once per
+    turn.
+
+    The cache must be cleared, using clear(), at the start of each turn. The hit and miss counters are kept across
+    turns, until reset_counters() is called. A miss means that a detector was actually run, so the number of misses is
+    the number of detector runs, and the number of hits is the number of runs saved by the cache.
+    """
+
+    def __init__(self) -> None:
+        """Initializes a new, empty TriggerDetectorCache."""
+        self._results: Dict[int, TriggerDetectorResult] = {}
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def hits(self) -> int:
+        """Returns the number of detector results served from the cache."""
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """Returns the number of detector results that had to be computed."""
+        return self._misses
+
+    def clear(self) -> None:
+        """Discard all cached results. Should be called at the start of each turn."""
+        self._results = {}
+
+    def reset_counters(self) -> None:
+        """Reset the hit and miss counters to zero."""
+        self._hits = 0
+        self._misses = 0
+
+    def add(self, detector: TriggerDetector, result: TriggerDetectorResult) -> None:
+        """Add a result that has been computed outside the cache, counting it as a miss.
+
+        Args:
+            detector: The trigger detector.
+            result: The result of the detector's trigger_probabilities() method for the current turn.
+        """
+        self._results[id(detector)] = result
+        self._misses += 1
+        _detector_runs.inc()
+
+    def trigger_probabilities(self, detector: TriggerDetector, observations: List[Observation],
+                              old_extractions: Extractions) -> TriggerDetectorResult:
+        """Returns the result of the detector's trigger_probabilities() method, running the detector if needed.
+
+        Args:
+            detector: The trigger detector.
+            observations: New observations made this turn.
+            old_extractions: Extractions made during previous turns and, possibly, by external analysis in this turn.
+
+        Returns:
+            See documentation of TriggerDetector.trigger_probabilities().
+        """
+        result = self._results.get(id(detector))
+        if result is None:
+            token = begin_detector_timing(detector)
+            try:
+                result = detector.trigger_probabilities(observations, old_extractions)
+            finally:
+                end_timing(token)
+            self._results[id(detector)] = result
+            self._misses += 1
+            _detector_runs.inc()
+        else:
+            self._hits += 1
+            _detector_cache_hits.inc()
+        return result
+
 
 class SnipsTriggerDetector(TriggerDetector):
     """Class detecting triggers in observations, using Snips.
@@ -91,7 +198,8 @@ class SnipsTriggerDetector(TriggerDetector):
     See the documentation in TriggerDetector for further information.
     """
 
-    def __init__(self, paths: List[str], nlp: SpacyEngine, multi_engine: bool = False) -> None:
+    def __init__(self, paths: List[str], nlp: SpacyEngine, multi_engine: bool = False,
+                 training_workers: int = 1) -> None:
         """Initializes a newly created SnipsTriggerEngine.
         
         Args:
@@ -101,27 +209,51 @@ class SnipsTriggerDetector(TriggerDetector):
             nlp: This is a SpacyEngine, used by the detector to perform internal tasks.
             multi_engine: This flags controls the choice between single-engine and multi-engine mode. The default is
                 single-engine.
+            training_workers: The number of worker processes used to train engines in multi-engine mode, see
+                SnipsEngine.load_many(). The default is to train in the current process.
         """
         self._engines: List[SnipsEngine] = []
         self._trigger_names: List[str] = []
         self._nlp = nlp
-        self._paths_list: List[List[str]] = []
-        
-        # Prepare creation of our Snips engine or engines.
-        if multi_engine:
-            self._paths_list = [[p] for p in paths]
-        else:
-            self._paths_list = [paths]
-    
+        self._paths: List[str] = []
+        self._multi_engine = multi_engine
+        self._training_workers = training_workers
+        self.add_paths(paths)
+
+    @property
+    def paths(self) -> List[str]:
+        """Returns the paths of the training data."""
+        return list(self._paths)
+
+    def add_paths(self, paths: List[str]) -> bool:
+        """Adds training data, for more intents to be detected once the detector is loaded again.
+
+        Args:
+            paths: Directory paths pointing to training data, as for the constructor.
+
+        Returns:
+            True if any of the paths was new to the detector, so that it needs to be loaded again.
+        """
+        new_paths = []
+        for path in paths:
+            if path not in self._paths and path not in new_paths:
+                new_paths.append(path)
+        self._paths.extend(new_paths)
+        return len(new_paths) > 0
+
     def load(self) -> None:
-        """Loads the trigger detector.
+        """Loads the trigger detector, or loads it again with the paths added since it was last loaded.
 
         See documentation of the corresponding method in TriggerDetector.
         """
-        for paths in self._paths_list:
-            engine = SnipsEngine.load(paths, self._nlp)
-            self._engines.append(engine)
-            self._trigger_names.extend(engine.intent_names)
+        # Prepare creation of our Snips engine or engines.
+        if self._multi_engine:
+            paths_list = [[p] for p in self._paths]
+        else:
+            paths_list = [self._paths]
+        engines = SnipsEngine.load_many(paths_list, self._nlp, workers=self._training_workers)
+        self._engines = engines
+        self._trigger_names = [name for engine in engines for name in engine.intent_names]
     
     @property
     def trigger_names(self) -> List[str]:
@@ -189,14 +321,31 @@ class TriggerDetectorLoader:
     Trigger detectors often need to load and train on data on disk before they can actually be used for trigger
     detection. The load() method makes sure that this takes place, by calling the load() method on any TriggerDetector
     object that it returns.
+
+    By default, each call to load() finding Snips intents returns a new SnipsTriggerDetector, for the intents of that
+    call only, so that each agenda, and even the kickoff and transition triggers of each agenda, get detectors of their
+    own, all splitting and parsing every message again. With shared_snips_engine, a single SnipsTriggerDetector, trained
+    on the union of the intents of all calls, is returned by all of them. The TriggerDetectorCache of a Puppeteer then
+    runs it once per turn, parsing each sentence once, and each agenda picks the probabilities of its own triggers from
+    the result. Note that, in single-engine mode, the shared engine chooses among all intents of all agendas, instead of
+    among the intents of each agenda. Use Agenda.load_all(), or preload(), to train the shared engine once on all
+    intents, rather than retraining it whenever an agenda with new intents is loaded.
     """
-    def __init__(self, default_snips_path: Optional[str] = None) -> None:
+    def __init__(self, default_snips_path: Optional[str] = None, snips_training_workers: int = 1,
+                 shared_snips_engine: bool = False) -> None:
         """Initializes a newly created TriggerDetectorLoader.
 
         Args:
             default_snips_path: The default root path used to load SNIPS-based trigger detectors.
+            snips_training_workers: The number of worker processes used to train Snips engines, see preload() and
+                SnipsEngine.load_many(). The default is to train in the current process.
+            shared_snips_engine: If true, all agendas share a single SnipsTriggerDetector, see above.
         """
         self._default_snips_path = default_snips_path
+        self._snips_training_workers = snips_training_workers
+        self._shared_snips_engine = shared_snips_engine
+        # The shared Snips trigger detectors, by multi-engine mode.
+        self._shared_snips_detectors: Dict[bool, SnipsTriggerDetector] = {}
         self._snips_paths: Dict[str, str] = {}
         self._registered: Dict[str, TriggerDetector] = {}
         self._registered_by_agenda: Dict[str, Dict[str, TriggerDetector]] = {}
@@ -244,18 +393,94 @@ class TriggerDetectorLoader:
         Return:
             A list containing the loaded trigger detectors.
         """
+        (detectors, snips_trigger_paths) = self._find(agenda_name, trigger_names)
+        for detector in detectors:
+            detector.load()
+        # Get standard Snips trigger detectors.
+        if snips_trigger_paths and self._shared_snips_engine:
+            detectors.append(self._shared_snips_detector(snips_trigger_paths, snips_multi_engine))
+        elif snips_trigger_paths:
+            nlp = SpacyEngine.load()
+            detector = SnipsTriggerDetector(snips_trigger_paths,
+                                            nlp,
+                                            multi_engine=snips_multi_engine,
+                                            training_workers=self._snips_training_workers)
+            detector.load()
+            detectors.append(detector)
+
+        # Return unique detectors
+        return list(set(detectors))
+
+    def preload(self, agendas: List[Tuple[str, List[str]]], snips_multi_engine: bool = False) -> None:
+        """Trains the Snips engines needed by a number of later calls to load(), all at once.
+
+        When loading many agendas, each call to load() only trains the Snips engines of a single agenda. Calling this
+        method first, with the arguments of all the calls to load(), trains all of the engines together, in a pool of
+        snips_training_workers worker processes, so that the calls to load() find them already trained. With
+        shared_snips_engine, the shared engine is trained once, on the intents of all the calls. See Agenda.load_all().
+
+        Args:
+            agendas: For each later call to load(), the agenda name and the trigger names.
+            snips_multi_engine: If true, SnipsTriggerDetectors are loaded in multi-engine mode.
+        """
+        path_lists = []
+        shared_paths: List[str] = []
+        for (agenda_name, trigger_names) in agendas:
+            (_, snips_trigger_paths) = self._find(agenda_name, trigger_names)
+            if self._shared_snips_engine:
+                shared_paths.extend(snips_trigger_paths)
+            elif snips_trigger_paths:
+                if snips_multi_engine:
+                    path_lists.extend([p] for p in snips_trigger_paths)
+                else:
+                    path_lists.append(snips_trigger_paths)
+        if shared_paths:
+            self._shared_snips_detector(shared_paths, snips_multi_engine)
+        if path_lists:
+            SnipsEngine.load_many(path_lists, SpacyEngine.load(), workers=self._snips_training_workers)
+
+    def _shared_snips_detector(self, paths: List[str], snips_multi_engine: bool) -> SnipsTriggerDetector:
+        """Returns the shared Snips trigger detector, loading it again if any of the paths is new to it.
+
+        Args:
+            paths: The paths of the Snips intents needed.
+            snips_multi_engine: The multi-engine mode of the detector.
+
+        Return:
+            The shared detector, detecting the intents under the given paths, and those of all earlier calls.
+        """
+        detector = self._shared_snips_detectors.get(snips_multi_engine)
+        if detector is None:
+            detector = SnipsTriggerDetector([], SpacyEngine.load(), multi_engine=snips_multi_engine,
+                                            training_workers=self._snips_training_workers)
+            self._shared_snips_detectors[snips_multi_engine] = detector
+        intent_paths = {os.path.basename(p): p for p in detector.paths}
+        for path in paths:
+            name = os.path.basename(path)
+            if intent_paths.setdefault(name, path) != path:
+                raise ValueError("Intent %s found in both %s and %s" % (name, intent_paths[name], path))
+        if detector.add_paths(paths):
+            detector.load()
+        return detector
+
+    def _find(self, agenda_name: str, trigger_names: List[str]) -> Tuple[List[TriggerDetector], List[str]]:
+        """Finds trigger detectors for an agenda, without loading them.
+
+        Args:
+            agenda_name: The name of the agenda.
+            trigger_names: The names of the triggers.
+
+        Return:
+            A pair consisting of the registered trigger detectors found, and the paths of the Snips intents found.
+        """
         detectors = []
         snips_trigger_paths = []
         for trigger_name in trigger_names:
             if (agenda_name in self._registered_by_agenda and
                     trigger_name in self._registered_by_agenda[agenda_name]):
-                detector = self._registered_by_agenda[agenda_name][trigger_name]
-                detector.load()
-                detectors.append(detector)
+                detectors.append(self._registered_by_agenda[agenda_name][trigger_name])
             elif trigger_name in self._registered:
-                detector = self._registered[trigger_name]
-                detector.load()
-                detectors.append(detector)
+                detectors.append(self._registered[trigger_name])
             else:
                 # See if this is a standard Snips trigger.
                 def lookfor(dirname: str, rootpath: str) -> Optional[str]:
@@ -273,14 +498,4 @@ class TriggerDetectorLoader:
                         snips_trigger_paths.append(path)
                     else:
                         raise ValueError("Could not find detector for trigger: %s" % trigger_name)
-        # Get standard Snips trigger detectors.
-        if snips_trigger_paths:
-            nlp = SpacyEngine.load()
-            detector = SnipsTriggerDetector(snips_trigger_paths,
-                                            nlp,
-                                            multi_engine=snips_multi_engine)
-            detector.load()
-            detectors.append(detector)
-
-        # Return unique detectors
-        return list(set(detectors))
+        return detectors, snips_trigger_paths
@@ -0,0 +1,388 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os.path import basename
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from .extractions import Extractions
+from .metrics import metrics_registry
+from .nlu import SpacyEngine
+from .observation import MessageObservation, Observation
+from .trigger_detector import SnipsTriggerDetector, TriggerDetector, TriggerDetectorLoader
+
+# Fallbacks of a DeferredTriggerDetector that is not ready.
+FALLBACK_NO_TRIGGER = "no_trigger"
+FALLBACK_BLOCK = "block"
+
+# Readiness states.
+STATE_LOADING = "loading"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+# Texts run through trigger detectors and Spacy models when warming them up.
+WARMUP_TEXTS = [
+    "Hello, how are you doing today?",
+    "My name is John Smith and I live in New York.",
+    "Can you send me $200 by Friday? I will pay you back next week.",
+]
+
+_fallbacks = metrics_registry().counter("puppeteer_detector_fallbacks_total",
+                                        "Trigger detector calls answered by a fallback, while loading or after a "
+                                        "failure, by fallback.", ["fallback"])
+
+
+class DeferredTriggerDetector(TriggerDetector):
+    """Trigger detector that is loaded and warmed up in the background, with a fallback until it is ready.
+
+    A DeferredTriggerDetector wraps a detector that is created, loaded and warmed up by a Warmup, in a background
+    thread. Its trigger names are given up front, so that it can be added to agendas right away. Until the wrapped
+    detector is ready, calls to trigger_probabilities() are answered by the fallback:
+
+        "no_trigger": No trigger is detected, and the call returns immediately.
+        "block":      The call waits until the detector is ready, for at most the timeout, if any. If the detector
+                      is still not ready, no trigger is detected.
+
+    If loading or warming up the detector fails, it is never ready, and no triggers are detected. The error is
+    available through the error property.
+    """
+
+    def __init__(self, factory: Callable[[], TriggerDetector], trigger_names: List[str],
+                 fallback: str = FALLBACK_NO_TRIGGER, timeout: Optional[float] = None) -> None:
+        """Initializes a new DeferredTriggerDetector. Use Warmup.defer() rather than calling this directly.
+
+        Args:
+            factory: Function creating the wrapped detector. It is called in a background thread.
+            trigger_names: The names of the triggers detected by the wrapped detector.
+            fallback: "no_trigger" or "block".
+            timeout: With the "block" fallback, the maximum number of seconds to wait, or None to wait until ready.
+        """
+        if fallback not in (FALLBACK_NO_TRIGGER, FALLBACK_BLOCK):
+            raise ValueError("Unknown fallback: %s" % fallback)
+        self._factory = factory
+        self._trigger_names = list(trigger_names)
+        self._fallback = fallback
+        self._timeout = timeout
+        self._detector: Optional[TriggerDetector] = None
+        self._done = threading.Event()
+        self._state = STATE_LOADING
+        self._error: Optional[Exception] = None
+        self._seconds = 0.0
+
+    @property
+    def trigger_names(self) -> List[str]:
+        """Returns the names of the triggers detected by this trigger detector."""
+        return list(self._trigger_names)
+
+    @property
+    def state(self) -> str:
+        """Returns the readiness state: "loading", "ready" or "failed"."""
+        return self._state
+
+    @property
+    def ready(self) -> bool:
+        """Returns true if the wrapped detector is loaded and warmed up."""
+        return self._state == STATE_READY
+
+    @property
+    def error(self) -> Optional[Exception]:
+        """Returns the error raised while loading or warming up the wrapped detector, if any."""
+        return self._error
+
+    @property
+    def seconds(self) -> float:
+        """Returns the number of seconds spent loading and warming up the wrapped detector, once done."""
+        return self._seconds
+
+    @property
+    def detector(self) -> Optional[TriggerDetector]:
+        """Returns the wrapped detector, or None if it is not ready."""
+        return self._detector if self.ready else None
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Waits until the wrapped detector is ready or has failed.
+
+        Args:
+            timeout: The maximum number of seconds to wait, or None to wait until done.
+
+        Returns:
+            True if the detector is ready.
+        """
+        self._done.wait(timeout)
+        return self.ready
+
+    def load(self) -> None:
+        """Does nothing. The wrapped detector is loaded in the background, by the Warmup that created this detector."""
+        pass
+
+    def trigger_probabilities(self, observations: List[Observation],
+                              old_extractions: Extractions) -> Tuple[Dict[str, float], float, Extractions]:
+        """Returns the trigger probabilities of the wrapped detector, or those of the fallback if it is not ready.
+
+        See documentation of the corresponding method in TriggerDetector.
+        """
+        if self._state == STATE_LOADING and self._fallback == FALLBACK_BLOCK:
+            self._done.wait(self._timeout)
+        detector = self._detector
+        if self._state != STATE_READY or detector is None:
+            _fallbacks.inc(self._fallback)
+            return {}, 1.0, Extractions()
+        return detector.trigger_probabilities(observations, old_extractions)
+
+    def _load(self, texts: Sequence[str]) -> None:
+        """Creates, loads and warms up the wrapped detector. Runs in a background thread."""
+        start = time.perf_counter()
+        try:
+            detector = self._factory()
+            detector.load()
+            for text in texts:
+                detector.trigger_probabilities([MessageObservation(text)], Extractions())
+            self._detector = detector
+            self._state = STATE_READY
+        except Exception as e:
+            self._error = e
+            self._state = STATE_FAILED
+        finally:
+            self._seconds = time.perf_counter() - start
+            self._done.set()
+
+
+class Warmup:
+    """Loads and warms up trigger detectors and Spacy models in background threads, and tracks their readiness.
+
+    Loading trigger detectors, e.g., training Snips engines and loading Spacy models, can take minutes, and the first
+    calls to a freshly loaded model pay for more lazy initialization. A Warmup moves all of this off the startup path:
+    detectors given to defer() are wrapped in DeferredTriggerDetectors, which can be added to agendas right away, and
+    are created, loaded and warmed up in the background, by running a few texts through them. Spacy models given to
+    load_spacy() are loaded and warmed up the same way. Until then, DeferredTriggerDetectors answer with a fallback,
+    see DeferredTriggerDetector, so that conversations are served, in a degraded mode, from the start.
+
+    A WarmupTriggerDetectorLoader defers all the detectors it loads, so that agendas load in no time.
+
+    Example:
+
+        warmup = Warmup()
+        loader = WarmupTriggerDetectorLoader(warmup, default_snips_path="training_data")
+        agendas = [Agenda.load(filename, loader) for filename in filenames]
+        ...  # Serve conversations, in degraded mode until warmup.ready.
+    """
+
+    def __init__(self, threads: int = 1, texts: Sequence[str] = tuple(WARMUP_TEXTS)) -> None:
+        """Initializes a new Warmup.
+
+        Args:
+            threads: The number of background threads. Detectors and models are loaded in the order they are given.
+            texts: The texts run through detectors and models to warm them up.
+        """
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="puppeteer-warmup")
+        self._texts = list(texts)
+        self._detectors: List[DeferredTriggerDetector] = []
+        self._spacy: List[_SpacyWarmup] = []
+        self._lock = threading.Lock()
+
+    def defer(self, factory: Callable[[], TriggerDetector], trigger_names: List[str],
+              fallback: str = FALLBACK_NO_TRIGGER, timeout: Optional[float] = None) -> DeferredTriggerDetector:
+        """Starts loading and warming up a trigger detector in the background.
+
+        Args:
+            factory: Function creating the detector, called in a background thread. The detector is then loaded
+                with its load() method, and warmed up.
+            trigger_names: The names of the triggers detected by the detector.
+            fallback: The fallback used until the detector is ready, see DeferredTriggerDetector.
+            timeout: The timeout of the "block" fallback, see DeferredTriggerDetector.
+
+        Returns:
+            A DeferredTriggerDetector wrapping the detector.
+        """
+        deferred = DeferredTriggerDetector(factory, trigger_names, fallback, timeout)
+        with self._lock:
+            self._detectors.append(deferred)
+        self._executor.submit(deferred._load, self._texts)
+        return deferred
+
+    def load_spacy(self, model: str = "en_core_web_lg") -> None:
+        """Starts loading and warming up a Spacy model in the background, see SpacyEngine.load().
+
+        Args:
+            model: The name of the Spacy model.
+        """
+        spacy_warmup = _SpacyWarmup(model)
+        with self._lock:
+            self._spacy.append(spacy_warmup)
+        self._executor.submit(spacy_warmup._load, self._texts)
+
+    @property
+    def detectors(self) -> List[DeferredTriggerDetector]:
+        """Returns the deferred trigger detectors."""
+        with self._lock:
+            return list(self._detectors)
+
+    @property
+    def state(self) -> str:
+        """Returns the overall readiness state: "failed" if anything failed, else "loading" if anything is still
+        loading, else "ready"."""
+        states = [d.state for d in self._loads()]
+        if STATE_FAILED in states:
+            return STATE_FAILED
+        return STATE_LOADING if STATE_LOADING in states else STATE_READY
+
+    @property
+    def ready(self) -> bool:
+        """Returns true if all detectors and models are loaded and warmed up."""
+        return self.state == STATE_READY
+
+    def status(self) -> Dict[str, int]:
+        """Returns the number of detectors and Spacy models in each readiness state."""
+        counts = {STATE_LOADING: 0, STATE_READY: 0, STATE_FAILED: 0}
+        for d in self._loads():
+            counts[d.state] += 1
+        return counts
+
+    def errors(self) -> List[Tuple[List[str], Exception]]:
+        """Returns the trigger names of the detectors that failed, with their errors."""
+        return [(d.trigger_names, d.error) for d in self.detectors if d.error is not None]
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Waits until all detectors and models given so far are ready or have failed.
+
+        Args:
+            timeout: The maximum number of seconds to wait, or None to wait until done.
+
+        Returns:
+            True if all are ready.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for d in self._loads():
+            d.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return self.ready
+
+    def _loads(self) -> List[Union[DeferredTriggerDetector, "_SpacyWarmup"]]:
+        """Returns the detectors and Spacy models given so far."""
+        with self._lock:
+            return [*self._detectors, *self._spacy]
+
+    def close(self) -> None:
+        """Waits for the background threads to finish, and stops them."""
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> "Warmup":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+class _SpacyWarmup:
+    """Loads a Spacy model and runs warm-up texts through it in a background thread, for Warmup.load_spacy()."""
+
+    def __init__(self, model: str) -> None:
+        """Initializes a new _SpacyWarmup.
+
+        Args:
+            model: The name of the Spacy model.
+        """
+        self._model = model
+        self._done = threading.Event()
+        self._state = STATE_LOADING
+        self._error: Optional[Exception] = None
+
+    @property
+    def state(self) -> str:
+        """Returns the readiness state: "loading", "ready" or "failed"."""
+        return self._state
+
+    @property
+    def error(self) -> Optional[Exception]:
+        """Returns the error raised while loading or warming up the model, if any."""
+        return self._error
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Waits until the model is ready or has failed.
+
+        Args:
+            timeout: The maximum number of seconds to wait, or None to wait until done.
+
+        Returns:
+            True if the model is ready.
+        """
+        self._done.wait(timeout)
+        return self._state == STATE_READY
+
+    def _load(self, texts: Sequence[str]) -> None:
+        """Loads and warms up the model. Runs in a background thread."""
+        try:
+            nlp = SpacyEngine.load(self._model)
+            for text in texts:
+                nlp.get_sentences(text)
+                nlp.nent_extraction(text)
+            self._state = STATE_READY
+        except Exception as e:
+            self._error = e
+            self._state = STATE_FAILED
+        finally:
+            self._done.set()
+
+
+class WarmupTriggerDetectorLoader(TriggerDetectorLoader):
+    """TriggerDetectorLoader deferring the loading of all trigger detectors to a Warmup.
+
+    The loader finds detectors exactly as TriggerDetectorLoader does, but returns DeferredTriggerDetectors instead of
+    loading the detectors, so that Agenda.load() returns without waiting for any training or model loading. The
+    default Spacy model, used by Snips trigger detectors, is loaded in the background as well. A detector registered
+    with the loader, or a Snips trigger detector for the same intents, used by several agendas, is wrapped and loaded
+    only once.
+    """
+
+    def __init__(self, warmup: Warmup, default_snips_path: Optional[str] = None, snips_training_workers: int = 1,
+                 fallback: str = FALLBACK_NO_TRIGGER, timeout: Optional[float] = None) -> None:
+        """Initializes a newly created WarmupTriggerDetectorLoader.
+
+        Args:
+            warmup: The Warmup loading the detectors.
+            default_snips_path: The default root path used to load SNIPS-based trigger detectors.
+            snips_training_workers: The number of worker processes used to train Snips engines.
+            fallback: The fallback of the deferred detectors, see DeferredTriggerDetector.
+            timeout: The timeout of the "block" fallback, see DeferredTriggerDetector.
+        """
+        super(WarmupTriggerDetectorLoader, self).__init__(default_snips_path, snips_training_workers)
+        self._warmup = warmup
+        self._fallback = fallback
+        self._timeout = timeout
+        # Deferred detectors, by the identity of registered detectors or by the paths of Snips detectors.
+        self._deferred: Dict[object, DeferredTriggerDetector] = {}
+        self._spacy_started = False
+
+    def load(self, agenda_name: str,
+             trigger_names: List[str],
+             snips_multi_engine: bool = False) -> List[TriggerDetector]:
+        """Finds trigger detectors for an agenda, and returns them deferred, without waiting for them to load.
+
+        See documentation of the corresponding method in TriggerDetectorLoader.
+        """
+        (detectors, snips_trigger_paths) = self._find(agenda_name, trigger_names)
+        deferreds: List[TriggerDetector] = []
+        for detector in detectors:
+            key = id(detector)
+            if key not in self._deferred:
+                self._deferred[key] = self._warmup.defer(lambda d=detector: d, detector.trigger_names,
+                                                         self._fallback, self._timeout)
+            deferreds.append(self._deferred[key])
+        if snips_trigger_paths:
+            if not self._spacy_started:
+                self._warmup.load_spacy()
+                self._spacy_started = True
+            key = (frozenset(snips_trigger_paths), snips_multi_engine)
+            if key not in self._deferred:
+                paths = list(snips_trigger_paths)
+                workers = self._snips_training_workers
+
+                def factory() -> TriggerDetector:
+                    return SnipsTriggerDetector(paths, SpacyEngine.load(), multi_engine=snips_multi_engine,
+                                                training_workers=workers)
+                self._deferred[key] = self._warmup.defer(factory, [basename(p) for p in paths],
+                                                         self._fallback, self._timeout)
+            deferreds.append(self._deferred[key])
+        return list(dict.fromkeys(deferreds))
+
+    def preload(self, agendas: List[Tuple[str, List[str]]], snips_multi_engine: bool = False) -> None:
+        """Does nothing. Snips engines are trained in the background, when the deferred detectors are loaded."""
+        pass